@@ -1,9 +1,98 @@
+import os
 import numpy as np
 from .CAMSConstants import *
+from .CAMSParser import *
+from .CAMSCategorical import *
+from .CAMSMetrics import *
+from .CAMSProfile import *
+from .CAMSQuery import *
+from .CAMSTarget import *
+from .CAMSPyramid import *
 
 class Archive(np.ndarray):
 
-   def __new__(cls, filename, max_rows=None):
+   def __new__(cls, filename, max_rows=None, engine=LoadEngine.BULK, cache=None, columns=None):
+      """
+      Read an archive from disk.
+
+      Params
+      ------
+         filename - Name of the archive to read.
+         max_rows - Maximum number of rows to read from file (None for all).
+         engine   - LoadEngine used to read the file. LoadEngine.GENFROMTXT
+                    is kept as a reference for the LoadEngine.BULK parser.
+         cache    - Optional ArchiveCache. Full archives are loaded from the
+                    cache when available and stored in it after parsing.
+         columns  - Columns converted when the archive is read (None for all).
+                    Any other column is loaded from the file or the cache the
+                    first time it is accessed.
+      """
+      with PROFILER.timer(T_LOAD):
+         array = cls.__readArray(filename, max_rows, engine, cache, columns, True)
+
+      # Define the array and add the internal parameters.
+      obj = array.view(cls)
+      obj.__filename = filename
+      obj.__script = None
+      obj.__parseDesc = False
+      obj.__metrics = None
+      obj.__target  = None
+      obj.__indexes = {}
+      obj.__source  = (max_rows, engine, cache)
+      obj.__missing = [name for name, _ in TYPE_KEYS if name not in array.dtype.names]
+      obj.__lazy    = {}
+      obj.__rowKeys = []
+      return obj
+
+
+   @classmethod
+   def __readArray(cls, filename, max_rows, engine, cache, columns, store):
+      """
+      Read the columns of an archive from the cache or the file.
+      Archives missing from the cache are parsed in full and stored
+      if requested, then restricted to the columns.
+      """
+      # Only complete archives are cached.
+      useCache = (cache is not None and max_rows is None)
+      array = cache.load(filename, columns) if useCache else None
+      if(True == useCache):
+         PROFILER.count(C_CACHE_HIT if array is not None else C_CACHE_MISS)
+
+      if(array is None):
+         store = (True == store and True == useCache)
+         names = None if store else columns
+         if(LoadEngine.BULK == engine and True == isCompressed(filename)):
+            if(True == PROFILER.enabled):
+               PROFILER.count(C_READ, os.path.getsize(getSourceFile(filename)))
+            
+            # Blocks are parsed while the next ones are decompressed.
+            with PROFILER.timer(T_PARSE):
+               array = np.squeeze(parseBlocks(readLines(filename), max_rows, names))
+         elif(LoadEngine.BULK == engine):
+            with PROFILER.timer(T_READ):
+               buffer = readBuffer(filename)
+            PROFILER.count(C_READ, len(buffer))
+            
+            # Squeeze single row archives the same way genfromtxt does.
+            with PROFILER.timer(T_PARSE):
+               array = np.squeeze(parseBuffer(buffer, max_rows, names))
+         elif(LoadEngine.GENFROMTXT == engine):
+            if(True == PROFILER.enabled):
+               PROFILER.count(C_READ, os.path.getsize(getSourceFile(filename)))
+            with PROFILER.timer(T_PARSE):
+               array = cls.__readGenfromtxt(filename, max_rows)
+         else:
+            raise ValueError("Unknown load engine: ", engine)
+         PROFILER.count(C_ROWS, array.size)
+         if(True == store):
+            cache.store(filename, array)
+         if(columns is not None and len(array.dtype.names) != len(getProjection(columns))):
+            array = selectColumns(array, columns)
+      return array
+
+
+   @staticmethod
+   def __readGenfromtxt(filename, max_rows=None):
       
       # Converter functions to interpret string fields read.
       # All the fields need to be decoded for UTF-8 character sets 
@@ -37,57 +126,109 @@ class Archive(np.ndarray):
          I_LOG_TYPE     : toStr
          }
       
+      # Count the converter calls when profiling.
+      for name in converters:
+         converters[name] = PROFILER.counted(C_CONVERTER, converters[name])
+      
       # List of names for each column.
       names = list(converters.keys())
       
-      # Constants used in parsing the file.
-      delimChar   = ';'
-      commentChar = '#'
-
-      # Definition of field types
-      TYPE_KEYS = [
-         (I_MET,          ENTRY_TYPE_INT), 
-         (I_OSMET,        ENTRY_TYPE_LNG), 
-         (I_CABIN_O2,     ENTRY_TYPE_FLT), 
-         (I_CABIN_P,      ENTRY_TYPE_FLT), 
-         (I_CABIN_T,      ENTRY_TYPE_FLT), 
-         (I_CABIN_CO2,    ENTRY_TYPE_FLT), 
-         (I_CABIN_H,      ENTRY_TYPE_FLT), 
-         (I_TANK_O2,      ENTRY_TYPE_FLT), 
-         (I_TANK_N2,      ENTRY_TYPE_FLT), 
-         (I_EVENT_SOURCE, ENTRY_TYPE_STR), 
-         (I_EVENT_DESC,   ENTRY_TYPE_OBJ), 
-         (I_ERROR_PHASE,  ENTRY_TYPE_STR), 
-         (I_ID,           ENTRY_TYPE_INT), 
-         (I_LOG_TYPE,     ENTRY_TYPE_STR)  
-      ]  
-
+      # Categorical fields are read as strings and encoded afterwards.
+      types = [(name, ENTRY_TYPE_OBJ if name in VOCABULARY else kind) for name, kind in TYPE_KEYS]
+      
       # Read file 
-      array = np.genfromtxt(
-         fname          = filename,     # File name to get archive.                \
-         names          = names,        # Assign column names                      \
-         dtype          = TYPE_KEYS,    # Variable type for each field             \
-         delimiter      = delimChar,    # Delimiter within archive                 \
-         converters     = converters,   # Convert data using lambda functions      \
-         comments       = commentChar,  # Discard comment lines                    \
-         loose          = False,        # Raise errors if invalid values are read. \
-         max_rows       = max_rows      # Maximum number of rows to read from file.\
-         )
-         
-      # Define the array and add the internal parameters.
-      obj = array.view(cls)
-      obj.__filename = filename
-      obj.__script = None
-      obj.__parseDesc = False
-      return obj
+      with openArchive(filename) as fp:
+         return encodeColumns(np.genfromtxt(
+            fname          = fp,                       # File object to get archive.              \
+            names          = names,                    # Assign column names                      \
+            dtype          = types,                    # Variable type for each field             \
+            delimiter      = DELIM_CHAR.decode(),      # Delimiter within archive                 \
+            converters     = converters,               # Convert data using lambda functions      \
+            comments       = COMMENT_CHAR.decode(),    # Discard comment lines                    \
+            loose          = False,                    # Raise errors if invalid values are read. \
+            max_rows       = max_rows                  # Maximum number of rows to read from file.\
+            ))
 
 
    def __array_finalize__(self, obj):
       if obj is None: 
          return
-      self.__filename = getattr(obj, '__filename', None)
-      self.__script = getattr(obj, '__script', None)
-      self.__parseDesc = getattr(obj, '__parseDesc', None)
+      self.__filename = getattr(obj, '_Archive__filename', None)
+      self.__script = getattr(obj, '_Archive__script', None)
+      self.__parseDesc = getattr(obj, '_Archive__parseDesc', None)
+      self.__metrics = None
+      self.__target  = None
+      self.__indexes = {}
+      self.__source  = getattr(obj, '_Archive__source', None)
+      self.__missing = list(getattr(obj, '_Archive__missing', []))
+      self.__lazy    = getattr(obj, '_Archive__lazy', {})
+      self.__rowKeys = list(getattr(obj, '_Archive__rowKeys', []))
+
+
+   def __getitem__(self, key):
+      # Columns left out of the projection are loaded on first access.
+      if(isinstance(key, str) and key in self.__missing):
+         return self.__getLazyColumn(key)
+      item = super().__getitem__(key)
+      
+      # Categorical columns are returned as views of their codes,
+      # and single rows decode the categorical fields as strings.
+      if(isinstance(key, str) and key in VOCABULARY):
+         return Categorical(item.view(np.ndarray), VOCABULARY[key])
+      if(isinstance(item, np.void)):
+         return Record(item, self.__getLazyRow(key))
+      
+      # Remember the rows selected, to pick the same ones from lazy columns.
+      # Field subsets are plain views, without lazy columns.
+      isField = isinstance(key, str) or (isinstance(key, list) and all(isinstance(name, str) for name in key))
+      if(isinstance(item, Archive) and not isField):
+         item.__rowKeys = self.__rowKeys + [key]
+      elif(isinstance(item, Archive)):
+         item.__missing = []
+      return item
+
+
+   def getMissingColumns(self):
+      """
+      Get the columns left out when the archive was read, loaded
+      on first access. Field subsets of an archive have none.
+
+      Return
+      ------
+         list - Names of the columns left out.
+      """
+      return list(self.__missing)
+
+
+   def __getLazyColumn(self, name):
+      if(name not in self.__lazy):
+         if(self.__source is None):
+            raise ValueError("Column was not loaded and the archive has no source: ", name)
+         
+         # Load every missing column at once, the file is only split once.
+         missing = [column for column in self.getMissingColumns() if column not in self.__lazy]
+         max_rows, engine, cache = self.__source
+         with PROFILER.timer(T_LAZY):
+            array = self.__readArray(self.__filename, max_rows, engine, cache, missing, False)
+         PROFILER.count(C_LAZY, len(missing))
+         for column in missing:
+            self.__lazy[column] = np.atleast_1d(array[column])
+      
+      column = self.__lazy[name]
+      for key in self.__rowKeys:
+         column = column[key]
+      if(column.size != self.size):
+         raise ValueError("Column does not match the rows of the archive, the file changed: ", name)
+      column = column.reshape(self.shape)
+      if(name in VOCABULARY):
+         return Categorical(column, VOCABULARY[name])
+      return column
+
+
+   def __getLazyRow(self, key):
+      if(0 == len(self.__missing)):
+         return None
+      return dict((name, self[name][key]) for name in self.__missing)
 
 
    def getScript(self):
@@ -103,172 +244,408 @@ class Archive(np.ndarray):
       # Cache result
       if(None == self.__script):
          try:
-            # Open the file, read the first line, parse it, and extract the name.
-            with open(self.__filename, "r") as fp:
-               line          = fp.readline().strip()
-               scriptPath    = line.split(':')[-1]
-               scriptName    = scriptPath.split('\\')[-1]
-               self.__script = scriptName.strip()
+            # Read the first line, parse it, and extract the name.
+            with PROFILER.timer(T_SCRIPT):
+               line = readHeader(self.__filename)
+               self.__script = getScriptName(line)
+            PROFILER.count(C_READ, len(line))
          except IOError:
             # Catch errors if it fails to open the file.
             raise Exception("Could not read file: ", self.__filename)
       return self.__script
 
       
-   def parseData(self, prefix, skipFault=False):
+   def parseData(self, prefix, skipFault=False, engine=ParseEngine.VECTOR):
       """
-      <INSERT DESCRIPTION>
-      
+      Extract the metrics for every fault episode in the archive.
+      An episode ends with each GREEN phase change.
+
       Params
       ------
-         prefix - Array with missionId, userId, sessionId, hasFault
-      
+         prefix    - Array with missionId, userId, sessionId, hasFault
+         skipFault - Skip episodes where AFIRA misdiagnosed the fault.
+         engine    - ParseEngine used to extract the metrics. ParseEngine.LOOP
+                     is kept as a reference for ParseEngine.VECTOR.
+
       Return
       ------
          string - Comma separated metrics extracted for this session.
       """
-      COMMA = ","
-      
-      faultIndex        = 0
-      iRed              = None   # Index when fault is introduced
-      iGreen            = None   # Index when fault is resolved
-      iFirstRepair      = None   # Index when first repair order is sent
-      iCorrectRepair    = None   # Index when correct repair order is sent
-      faultInjected     = None   # Fault injected into the system
-      faultDetected     = None   # Fault detected by AFIRA
-      repairOrders      = []     # Repair orders sent
-      paramsVerified    = set()  # Set of parameters verified
-      conCheckTotalTime = 0      # Total time elapsed for connection checks
-      conCheckCount     = 0      # Number of connection checks
-      conCheckIndex     = 0      # Index of last connection check
-      logTotal          = 0      # Number of log entries entered
-      logMissed         = 0      # Number of log entries missed
-      
-      output = ""
+      return formatMetrics(self.getMetrics(engine), prefix, skipFault)
+
+
+   def getMetrics(self, engine=ParseEngine.VECTOR, names=None):
+      """
+      Extract the metrics for every fault episode in the archive.
+      The result is computed once and reused by later calls, so any 
+      number of views (see formatMetrics and selectMetrics) can be 
+      rendered from a single pass over the archive.
+
+      Params
+      ------
+         engine - ParseEngine used to extract the metrics.
+         names  - Names of the metrics to compute, from METRIC_REGISTRY
+                  (None for DEFAULT_METRICS). ParseEngine.LOOP only
+                  computes the default metrics.
+
+      Return
+      ------
+         ndarray - Structured array with the fields in getMetricTypeKeys(names),
+                   i.e. METRIC_TYPE_KEYS for the default metrics.
+      """
+      key = (engine, None if names is None else tuple(names))
+      if(self.__metrics is None or self.__metrics[0] != key):
+         with PROFILER.timer(T_METRICS):
+            if(ParseEngine.VECTOR == engine):
+               metrics = getTableMetrics(self, names)
+            elif(ParseEngine.LOOP == engine):
+               if(names is not None and not set(names).issubset(DEFAULT_METRICS)):
+                  raise ValueError("The loop engine only computes the default metrics: ", names)
+               metrics = self.__metricsLoop()
+               if(names is not None):
+                  metrics = selectFields(metrics, names)
+            else:
+               raise ValueError("Unknown parse engine: ", engine)
+         PROFILER.count(C_EPISODES, metrics.size)
+         self.__metrics = (key, metrics)
+      return self.__metrics[1]
+
+
+   def getOutOfTarget(self):
+      """
+      Compute the time each cabin sensor spent outside its green and red
+      bands (see Limits), for every fault episode and for the whole
+      archive. The result is computed once and reused by later calls.
+
+      Return
+      ------
+         ndarray - Structured array with the fields in TARGET_TYPE_KEYS,
+                   one record per episode (from the first RED phase change
+                   to the GREEN one).
+         np.void - Record with the fields in TARGET_TYPE_KEYS for the
+                   whole archive.
+      """
+      if(self.__target is None):
+         with PROFILER.timer(T_TARGET):
+            self.__target = getTargetTables(self)
+      return self.__target
+
+
+   def getTimeIndex(self, field=I_OSMET):
+      """
+      Get the index of a time column, building it on first use.
+      Indexes are not shared with slices of the archive, since the
+      row positions differ.
+
+      Params
+      ------
+         field - Time column to index (I_OSMET or I_MET).
+
+      Return
+      ------
+         TimeIndex - Sorted view of the column.
+      """
+      key = ("time", field)
+      if(key not in self.__indexes):
+         self.__indexes[key] = TimeIndex(self[field])
+      return self.__indexes[key]
+
+
+   def getEventIndex(self, field):
+      """
+      Get the inverted index of a column, building it on first use.
+
+      Params
+      ------
+         field - Column to index, e.g. I_EVENT_SOURCE.
+
+      Return
+      ------
+         EventIndex - Rows of each value of the column.
+      """
+      key = ("event", field)
+      if(key not in self.__indexes):
+         self.__indexes[key] = EventIndex(self[field])
+      return self.__indexes[key]
+
+
+   def findRows(self, field, value):
+      """
+      Get the rows where a column holds a value.
+
+      Params
+      ------
+         field - Column to search, e.g. I_EVENT_DESC.
+         value - Value to find, or a list, tuple or set of values.
+
+      Return
+      ------
+         ndarray - Sorted row positions.
+      """
+      index = self.getEventIndex(field)
+      if(isinstance(value, (list, tuple, set))):
+         return index.getRowsIn(value)
+      return index.getRows(value)
+
+
+   def getRowsBetween(self, start=None, end=None, field=I_OSMET):
+      """
+      Get the rows inside a time window [start, end].
+
+      Params
+      ------
+         start - First time of the window (None for the start of the archive).
+         end   - Last time of the window (None for the end of the archive).
+         field - Time column used (I_OSMET [milliseconds] or I_MET [seconds]).
+
+      Return
+      ------
+         ndarray - Sorted row positions.
+      """
+      return self.getTimeIndex(field).getRows(start, end)
+
+
+   def getWindow(self, start=None, end=None, field=I_OSMET):
+      """
+      Get the part of the archive inside a time window [start, end].
+
+      Return
+      ------
+         Archive - Rows in the window.
+      """
+      index = self.getTimeIndex(field)
+      if(True == index.isSorted()):
+         lo, hi = index.getBounds(start, end)
+         return self[lo:hi]
+      return self[index.getRows(start, end)]
+
+
+   def query(self, source=None, desc=None, phase=None, start=None, end=None,
+             firstRow=None, lastRow=None, field=I_OSMET):
+      """
+      Find the rows matching all the given criteria.
+      The rows of the rarest value requested are taken from the inverted
+      index and only those are checked against the other criteria, e.g. all
+      graphic_monitor events between a RED and the next GREEN phase change:
+
+         red   = archive.query(desc=EventDesc.PHASE_CHANGE, phase=ErrorState.RED)[0]
+         green = archive.getNextRow(red, desc=EventDesc.PHASE_CHANGE, phase=ErrorState.GREEN)
+         rows  = archive.query(source=EventSource.GRAPH_MONITOR, firstRow=red, lastRow=green)
+
+      Params
+      ------
+         source   - Value(s) of I_EVENT_SOURCE (None for any).
+         desc     - Value(s) of I_EVENT_DESC (None for any).
+         phase    - Value(s) of I_ERROR_PHASE (None for any).
+         start    - First time of the window (None for no limit).
+         end      - Last time of the window (None for no limit).
+         firstRow - First row of the window (None for no limit).
+         lastRow  - Last row of the window (None for no limit).
+         field    - Time column used for start and end.
+
+      Return
+      ------
+         ndarray - Sorted row positions.
+      """
+      criteria = [(name, value) for name, value in
+                  ((I_EVENT_SOURCE, source), (I_EVENT_DESC, desc), (I_ERROR_PHASE, phase))
+                  if value is not None]
+
+      # Time windows become row windows when the archive is in time order.
+      timeIndex = None
+      if(start is not None or end is not None):
+         timeIndex = self.getTimeIndex(field)
+         if(True == timeIndex.isSorted()):
+            lo, hi = timeIndex.getBounds(start, end)
+            firstRow = lo if firstRow is None else max(firstRow, lo)
+            lastRow  = hi - 1 if lastRow is None else min(lastRow, hi - 1)
+            timeIndex = None
+
+      if(0 == len(criteria)):
+         lo = 0 if firstRow is None else max(0, firstRow)
+         hi = self.size if lastRow is None else min(self.size, lastRow + 1)
+         rows = np.arange(lo, max(lo, hi))
+      else:
+         postings = [self.findRows(name, value) for name, value in criteria]
+         smallest = min(range(len(postings)), key=lambda i: len(postings[i]))
+         rows = clipRows(postings[smallest], firstRow, lastRow)
+         for i, (name, value) in enumerate(criteria):
+            if(i != smallest and rows.size > 0):
+               rows = rows[self.__matchRows(rows, name, value)]
+
+      if(timeIndex is not None and rows.size > 0):
+         times = np.atleast_1d(self[field])[rows]
+         keep = np.ones(rows.size, dtype=bool)
+         if(start is not None):
+            keep &= (times >= start)
+         if(end is not None):
+            keep &= (times <= end)
+         rows = rows[keep]
+      return rows
+
+
+   def __matchRows(self, rows, field, value):
+      column = np.atleast_1d(self[field])
+      values = value if isinstance(value, (list, tuple, set)) else [value]
+      if(isinstance(column, Categorical)):
+         codes = [column.vocabulary.code(item) for item in values]
+         return np.isin(column.getCodes()[rows], codes)
+      return np.isin(column[rows], list(values))
+
+
+   def getNextRow(self, after, source=None, desc=None, phase=None):
+      """
+      Get the first row after a given row matching the criteria of query().
+
+      Return
+      ------
+         int - Row position, None if there is none.
+      """
+      rows = self.query(source, desc, phase, firstRow=after + 1)
+      return int(rows[0]) if rows.size > 0 else None
+
+
+   def getPreviousRow(self, before, source=None, desc=None, phase=None):
+      """
+      Get the last row before a given row matching the criteria of query().
+
+      Return
+      ------
+         int - Row position, None if there is none.
+      """
+      rows = self.query(source, desc, phase, lastRow=before - 1)
+      return int(rows[-1]) if rows.size > 0 else None
+
+
+   def __getEventRows(self, events):
+      if(isinstance(events, dict)):
+         return self.query(**events)
+      return np.asarray(events, dtype=np.int64)
+
+
+   def joinEvents(self, start, end, field=I_OSMET):
+      """
+      Pair each end event with the last start event before it and measure
+      the time between them, e.g. the connection check response times:
+
+         rows, starts, latency = archive.joinEvents(
+            {"desc" : EventDesc.ICON_APPEARS},
+            {"source" : EventSource.CONNECTION_CHECK, "desc" : [EventDesc.ICON_CONFIRMED, EventDesc.ICON_CLOSED]})
+
+      Params
+      ------
+         start - Criteria of query() for the start events, or their sorted rows.
+         end   - Criteria of query() for the end events, or their sorted rows.
+         field - Time column used for the latencies.
+
+      Return
+      ------
+         ndarray - Row of each end event.
+         ndarray - Row of the start event paired with it (MISSING_ROW if none).
+         ndarray - Latency of each pair (MISSING_TIME if not paired).
+      """
+      endRows   = self.__getEventRows(end)
+      startRows = pairEvents(self.__getEventRows(start), endRows)
+      return endRows, startRows, getLatencies(self[field], startRows, endRows)
+
+
+   def getLatencyStats(self, start, end, field=I_OSMET):
+      """
+      Get the distribution of the latencies between two events in each
+      fault episode. Only end events while the fault is present (from the
+      first RED phase change to GREEN) are used, paired with the last start
+      event in the same window.
+
+      Params
+      ------
+         See joinEvents().
+
+      Return
+      ------
+         ndarray - Structured array with the fields in LATENCY_TYPE_KEYS,
+                   one record per episode.
+      """
+      episodes = findEpisodes(self[I_EVENT_SOURCE], self[I_EVENT_DESC], self[I_ERROR_PHASE])[0]
+      lo, hi   = getFaultWindows(episodes)
+
+      endRows  = self.__getEventRows(end)
+      iEpisode = getEpisodeIndex(episodes, endRows)
+      inside   = (iEpisode < len(episodes))
+      inside[inside] = (endRows[inside] >= lo[iEpisode[inside]])
+      endRows, iEpisode = endRows[inside], iEpisode[inside]
+
+      startRows = pairEvents(self.__getEventRows(start), endRows, lo[iEpisode])
+      paired  = (startRows >= 0)
+      latency = getLatencies(self[field], startRows[paired], endRows[paired])
+      return getGroupStats(latency, iEpisode[paired], len(episodes))
+
+
+   def getPyramid(self):
+      """
+      Get the min/max/mean pyramid of the sensor columns, building it on
+      first use. Complete archives read with a cache load the pyramid
+      stored next to their columns, or store it once built.
+
+      Return
+      ------
+         SensorPyramid - Decimation of the columns in PYRAMID_SENSORS over I_OSMET.
+      """
+      key = ("pyramid",)
+      if(key not in self.__indexes):
+         max_rows, _, cache = self.__source if self.__source is not None else (None, None, None)
+         if(max_rows is not None or len(self.__rowKeys) > 0):
+            cache = None
+         
+         levels = None
+         if(cache is not None):
+            arrays = cache.loadDerived(self.__filename, PYRAMID_NAME)
+            levels = unpackPyramid(arrays, self.size) if arrays is not None else None
+         sensors = dict((sensor, self[sensor]) for sensor in PYRAMID_SENSORS)
+         pyramid = SensorPyramid(self.getTimeIndex(), sensors, levels)
+         if(cache is not None and levels is None):
+            cache.storeDerived(self.__filename, PYRAMID_NAME, packPyramid(pyramid.levels))
+         self.__indexes[key] = pyramid
+      return self.__indexes[key]
+
+
+   def getSensorPoints(self, start=None, end=None, maxPoints=DEFAULT_POINTS, sensors=None):
+      """
+      Get at most maxPoints points describing the sensors in a time window,
+      e.g. to plot a whole session. See SensorPyramid.getPoints().
+
+      Return
+      ------
+         ndarray - Structured array with the fields in getPointTypeKeys(sensors).
+      """
+      return self.getPyramid().getPoints(start, end, maxPoints, sensors)
+
+
+   def findExcursions(self, sensor, low=None, high=None, start=None, end=None):
+      """
+      Find the rows where a sensor is outside its limits in a time window,
+      e.g. outside the green band of the oxygen concentration:
+
+         rows = archive.findExcursions(I_CABIN_O2, Limits.O2[Limits.GREEN_LOW], Limits.O2[Limits.GREEN_HIGH])
+
+      See SensorPyramid.findExcursions().
+
+      Return
+      ------
+         ndarray - Sorted rows of the archive.
+      """
+      return self.getPyramid().findExcursions(sensor, low, high, start, end)
+
+
+   def __metricsLoop(self):
+      tracker = EpisodeTracker()
+      records = []
       
       # Iterate through the whole archive
       for i in range(self.size):
          curr = self[i]
-         
-         # Identify faults inserted
-         if(EventSource.AFIRA in curr[I_EVENT_SOURCE] and ":" in curr[I_EVENT_DESC]):
-            faultInjected, faultDetected = curr[I_EVENT_DESC].split(":")
-            faultIndex += 1
-            
-         # Identify all repair orders sent
-         if(EventDesc.REPAIR in curr[I_EVENT_DESC]):
-            temp = curr[I_EVENT_DESC].split(" ")[1]
-            if(temp != "task"):
-               repairOrders.append(temp)
-            
-               # Store index of first repair set
-               if(len(repairOrders) == 1):
-                  iFirstRepair = i
-            
-            # Store index when correct repair was sent. 
-            if(faultInjected is not None and temp == faultInjected):
-               iCorrectRepair = i
-         
-         # Find index of RED (start of fault)
-         if(EventDesc.PHASE_CHANGE == curr[I_EVENT_DESC] and ErrorState.RED == curr[I_ERROR_PHASE]):
-            iRed = i
-            
-         # Find index of RED_NO_ERROR (end of fault)
-         if(EventDesc.PHASE_CHANGE == curr[I_EVENT_DESC] and ErrorState.RED_NO_ERROR == curr[I_ERROR_PHASE]):
-            iGreen = i
-         
-         # Capture set of all parameters verified while the fault is present. 
-         if(iRed is not None):
-            if(curr[I_EVENT_SOURCE] in EventSource.FLOW_MONITOR):
-               paramsVerified.update([curr[I_EVENT_SOURCE]])
-            if(curr[I_EVENT_SOURCE] == EventSource.GRAPH_MONITOR):
-               paramsVerified.update([curr[I_EVENT_DESC]])
-            if(curr[I_EVENT_SOURCE] == EventSource.POSSIBLE_FLOW):
-               paramsVerified.update([EventSource.POSSIBLE_FLOW])
-         
-         # Connection checks
-         if(iRed is not None):
-            if(curr[I_EVENT_SOURCE] == EventSource.CONNECTION_CHECK):
-               if(curr[I_EVENT_DESC] == EventDesc.ICON_APPEARS):
-                  conCheckIndex = i
-               else:
-                  conCheckTotalTime += (curr[I_OSMET] - self[conCheckIndex][I_OSMET])
-                  conCheckCount += 1
-                  
-         # Logging tasks
-         if(iRed is not None):
-            if(curr[I_EVENT_SOURCE] == EventSource.LOGGING_TASK):
-               if(curr[I_EVENT_DESC] == EventDesc.LOGGING_MISSED or curr[I_EVENT_DESC] == EventDesc.LOGGING_EMPTY):
-                  logMissed += 1
-               logTotal += 1
-         
-         # Find index of GREEN (finished processing fault -> record entry)
-         if(EventDesc.PHASE_CHANGE == curr[I_EVENT_DESC] and ErrorState.GREEN == curr[I_ERROR_PHASE]):
-            
-            if(True == skipFault and faultInjected != faultDetected):
-               print("Skipping...")
-            else:
-               # Capture output
-               output += COMMA.join(map(str, prefix)) + COMMA
-            
-               # Fault index
-               output += str(faultIndex) + COMMA
-            
-               # Has fault?
-               if(faultInjected == faultDetected):
-                  output += "0" + COMMA
-               else:
-                  output += "1" + COMMA
-               
-               # Number of repair orders set
-               output += str(len(repairOrders)) + COMMA
-            
-               # Fault Identification Time (FIT)
-               deltaTime = self[iCorrectRepair][I_OSMET] - self[iRed][I_OSMET]
-               output += str(deltaTime) + COMMA 
-            
-               # Automation Verification Time (AVT)
-               deltaTime = self[iFirstRepair][I_OSMET] - self[iRed][I_OSMET]
-               output += str(deltaTime) + COMMA
-            
-               # Automation Verification Sampling of Relevant Parameters (AVS-RP)
-               limitSet = paramsVerified.intersection(PARAMS_RELEVANT)
-               temp = float(len(limitSet)) / len(PARAMS_RELEVANT)
-               output += "{0:.3f}".format(temp) + COMMA
-            
-               # Automation Verification Sampling of Necessary Parameters (AVS-NP)
-               limitSet = paramsVerified.intersection(PARAMS_NECESSARY[faultInjected])
-               temp = float(len(limitSet)) / len(PARAMS_NECESSARY[faultInjected])
-               output += "{0:.3f}".format(temp) + COMMA
-            
-               # Connection check
-               if(conCheckCount > 0):
-                  output += "{0:.3f}".format(float(conCheckTotalTime) / conCheckCount) + COMMA
-               else:
-                  output += "{0:.3f}".format(0.0) + COMMA
-               
-               # Logging task (skip comma for last variable)
-               if(logTotal > 0):
-                  output += "{0:.3f}".format(float(logTotal - logMissed) / logTotal) 
-               else:
-                  output += "{0:.3f}".format(0.0) 
-            
-               output += "\n"
-            
-            # Reset all variables
-            iRed              = None
-            iGreen            = None
-            iFirstRepair      = None
-            iCorrectRepair    = None
-            faultInjected     = None
-            faultDetected     = None
-            repairOrders      = []  
-            paramsVerified    = set()
-            conCheckTotalTime = 0
-            conCheckCount     = 0
-            conCheckIndex     = 0 
-            logTotal          = 0
-            logMissed         = 0
+         record = tracker.feed(curr[I_OSMET], curr[I_EVENT_SOURCE], curr[I_EVENT_DESC], curr[I_ERROR_PHASE])
+         if(record is not None):
+            records.append(record)
             
-      return output
+      return np.array(records, dtype=METRIC_TYPE_KEYS)
       
\ No newline at end of file
@@ -0,0 +1,65 @@
+import io
+import contextlib
+from concurrent.futures import ProcessPoolExecutor
+from .CAMSProfile import *
+
+
+def runTask(function, task):
+   """
+   Run a single task, capturing everything it prints, any error raised
+   and what the profiler recorded while it ran.
+
+   Params
+   ------
+      function - Function called with the task as its only argument.
+      task     - Argument for the function.
+
+   Return
+   ------
+      object - Value returned by the function (None on error).
+      string - Console output of the task.
+      string - Description of the error raised (None on success).
+      dict   - Profiler report of the task (None while profiling is disabled).
+   """
+   log = io.StringIO()
+   result = None
+   error = None
+   with contextlib.redirect_stdout(log):
+      try:
+         result = function(task)
+      except Exception as e:
+         error = "%s: %s" % (type(e).__name__, e)
+   return result, log.getvalue(), error, PROFILER.collect()
+
+
+def runBatch(function, tasks, jobs=1):
+   """
+   Run independent tasks, in a process pool when jobs > 1.
+   Results are always returned in the order of the tasks,
+   regardless of the order in which they complete, so the
+   output does not depend on the number of workers. Workers
+   profile when the profiler of this process is enabled.
+
+   Params
+   ------
+      function - Module level function called for each task.
+      tasks    - List of arguments for the function.
+      jobs     - Number of worker processes (1 runs in this process).
+
+   Return
+   ------
+      generator - Tuples (task, result, log, error, profile) in task order.
+   """
+   if(jobs <= 1):
+      for task in tasks:
+         yield (task,) + runTask(function, task)
+      return
+
+   with ProcessPoolExecutor(max_workers=jobs, initializer=enableProfiling, initargs=(PROFILER.enabled,)) as pool:
+      futures = [pool.submit(runTask, function, task) for task in tasks]
+      for task, future in zip(tasks, futures):
+         try:
+            yield (task,) + future.result()
+         except Exception as e:
+            # The worker itself failed (e.g. it was killed).
+            yield (task, None, "", "%s: %s" % (type(e).__name__, e), None)
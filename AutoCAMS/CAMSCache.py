@@ -0,0 +1,390 @@
+import os
+import json
+import shutil
+import hashlib
+import tempfile
+import numpy as np
+from .CAMSConstants import *
+from .CAMSCategorical import *
+from .CAMSParser import *
+from .CAMSCompress import *
+
+# Version of the on-disk layout. Increment when the format changes.
+CACHE_VERSION = 1
+
+# Default limit on the total size of the cache [bytes].
+DEFAULT_MAX_BYTES = 1024 * 1024 * 1024
+
+# Files stored for each cached archive.
+META_FILE   = "meta.json"
+CODES_EXT   = ".codes.npy"
+VOCAB_EXT   = ".vocab.npy"
+COLUMN_EXT  = ".npy"
+DERIVED_EXT = ".npz"     # Data computed from the columns, e.g. the sensor pyramid
+
+# Size of the blocks used to hash the contents of a file [bytes].
+HASH_BLOCK = 1024 * 1024
+
+
+def isEncoded(name, kind):
+   """
+   Check whether a column is stored as codes plus a vocabulary.
+   """
+   return (name in VOCABULARY or kind in (ENTRY_TYPE_STR, ENTRY_TYPE_OBJ))
+
+
+def getSchemaKey():
+   """
+   Get a key describing the column layout of an archive.
+   Any change to TYPE_KEYS or the ENTRY_TYPE_* definitions
+   produces a different key and invalidates existing entries.
+
+   Return
+   ------
+      string - Hash of the schema definition.
+   """
+   schema = [CACHE_VERSION,
+             [ENTRY_TYPE_STR, ENTRY_TYPE_OBJ, ENTRY_TYPE_INT, ENTRY_TYPE_LNG, ENTRY_TYPE_FLT, ENTRY_TYPE_DBL, ENTRY_TYPE_CAT],
+             sorted(VOCABULARY.keys()),
+             [list(entry) for entry in TYPE_KEYS]]
+   return hashlib.sha1(json.dumps(schema).encode('utf-8')).hexdigest()
+
+
+def getContentHash(filename):
+   """
+   Hash the contents of a file.
+
+   Params
+   ------
+      filename - Name of the file to hash.
+
+   Return
+   ------
+      string - SHA-1 digest of the file contents.
+   """
+   digest = hashlib.sha1()
+   with open(filename, "rb") as fp:
+      for block in iter(lambda: fp.read(HASH_BLOCK), b''):
+         digest.update(block)
+   return digest.hexdigest()
+
+
+class ArchiveCache():
+   """
+   Persistent binary cache of parsed archives.
+
+   Each archive is stored in its own directory with one .npy file per
+   column so that later loads can memory-map the columns instead of
+   parsing the text again. String and categorical columns are stored
+   as integer codes plus the list of unique values. Entries are
+   validated against the size, modification time and content hash of
+   the source file, and the least recently used entries are evicted
+   once the total size exceeds the configured limit.
+   """
+
+   def __init__(self, cacheDir, maxBytes=DEFAULT_MAX_BYTES):
+      """
+      Params
+      ------
+         cacheDir - Directory used to store the cached archives.
+         maxBytes - Maximum total size of the cache (None for no limit).
+      """
+      self.cacheDir = cacheDir
+      self.maxBytes = maxBytes
+      self.schemaKey = getSchemaKey()
+      os.makedirs(self.cacheDir, exist_ok=True)
+
+
+   def getEntryDir(self, filename):
+      """
+      Get the directory used to cache a given archive.
+
+      Params
+      ------
+         filename - Name of the archive.
+
+      Return
+      ------
+         string - Path to the cache entry.
+      """
+      key = hashlib.sha1(os.path.abspath(filename).encode('utf-8')).hexdigest()
+      return os.path.join(self.cacheDir, key)
+
+
+   def __readMeta(self, entryDir):
+      try:
+         with open(os.path.join(entryDir, META_FILE), "r") as fp:
+            return json.load(fp)
+      except (IOError, ValueError):
+         return None
+
+
+   def __writeMeta(self, entryDir, meta):
+      with open(os.path.join(entryDir, META_FILE), "w") as fp:
+         json.dump(meta, fp)
+
+
+   def isValid(self, filename):
+      """
+      Check whether the cached copy of an archive can be used.
+      The size and modification time are checked first. If only the
+      modification time changed, the contents are hashed and the entry
+      is kept (and refreshed) when the hash still matches.
+
+      Params
+      ------
+         filename - Name of the archive.
+
+      Return
+      ------
+         bool - True if the cache entry matches the file.
+      """
+      entryDir = self.getEntryDir(filename)
+      meta = self.__readMeta(entryDir)
+      if(meta is None or meta["schema"] != self.schemaKey):
+         return False
+
+      source = getSourceFile(filename)
+      stat = os.stat(source)
+      if(stat.st_size != meta["size"]):
+         return False
+      if(stat.st_mtime_ns == meta["mtime"]):
+         return True
+
+      # File was touched, compare the contents.
+      if(getContentHash(source) != meta["hash"]):
+         return False
+      meta["mtime"] = stat.st_mtime_ns
+      self.__writeMeta(entryDir, meta)
+      return True
+
+
+   def loadColumns(self, filename):
+      """
+      Memory-map the cached columns of an archive.
+
+      Params
+      ------
+         filename - Name of the archive.
+
+      Return
+      ------
+         dict - Map of column name to read-only memory-mapped array.
+                String and categorical columns map to a tuple
+                (codes, vocabulary).
+                None if the archive is not cached or is out of date.
+      """
+      if(False == self.isValid(filename)):
+         return None
+
+      entryDir = self.getEntryDir(filename)
+      columns = {}
+      try:
+         for name, kind in TYPE_KEYS:
+            path = os.path.join(entryDir, name)
+            if(isEncoded(name, kind)):
+               codes = np.load(path + CODES_EXT, mmap_mode='r')
+               vocab = np.load(path + VOCAB_EXT)
+               columns[name] = (codes, vocab)
+            else:
+               columns[name] = np.load(path + COLUMN_EXT, mmap_mode='r')
+
+         # Mark entry as recently used.
+         os.utime(os.path.join(entryDir, META_FILE))
+      except (IOError, ValueError):
+         # Entry was evicted or replaced by another process.
+         return None
+      return columns
+
+
+   def load(self, filename, names=None):
+      """
+      Load an archive from the cache.
+      The columns are copied out of the memory-mapped files: Archive is a
+      single structured array, which stores the fields of each row next
+      to each other, while the cache stores one file per column, and the
+      codes of the categorical columns are translated to the vocabulary
+      of this process. Only the columns in names are copied, the others
+      are loaded on first access (see Archive). Use loadColumns() for
+      views of the files without a copy.
+
+      Params
+      ------
+         filename - Name of the archive.
+         names    - Columns to load (None for all).
+
+      Return
+      ------
+         ndarray - Structured array with the fields in getProjection(names),
+                   or None if the archive is not cached or is out of date.
+      """
+      columns = self.loadColumns(filename)
+      if(columns is None):
+         return None
+
+      array = None
+      types = getProjection(names)
+      for name, kind in types:
+         if(name in VOCABULARY):
+            # Translate the stored codes to the codes of this process.
+            codes, vocab = columns[name]
+            column = VOCABULARY[name].encode(vocab)[codes]
+         elif(isEncoded(name, kind)):
+            codes, vocab = columns[name]
+            column = vocab.astype(object)[codes]
+         else:
+            column = columns[name]
+         if(array is None):
+            array = np.empty(column.shape, dtype=types)
+         array[name] = column
+      return array
+
+
+   def store(self, filename, array):
+      """
+      Save the parsed columns of an archive in the cache.
+
+      Params
+      ------
+         filename - Name of the archive.
+         array    - Structured array with the fields in TYPE_KEYS.
+      """
+      # Compressed archives are checked against the file on disk.
+      source = getSourceFile(filename)
+      stat = os.stat(source)
+      meta = {
+         "file"   : os.path.abspath(filename),
+         "size"   : stat.st_size,
+         "mtime"  : stat.st_mtime_ns,
+         "hash"   : getContentHash(source),
+         "schema" : self.schemaKey
+         }
+
+      # Write into a temporary directory first so that readers
+      # never see a partially written entry.
+      tempDir = tempfile.mkdtemp(dir=self.cacheDir)
+      try:
+         for name, kind in TYPE_KEYS:
+            path = os.path.join(tempDir, name)
+            column = np.asarray(array[name])
+            if(name in VOCABULARY):
+               used, codes = np.unique(column, return_inverse=True)
+               vocab = VOCABULARY[name].decode(used).astype(str)
+               np.save(path + CODES_EXT, codes.reshape(column.shape).astype(np.int32))
+               np.save(path + VOCAB_EXT, vocab)
+            elif(isEncoded(name, kind)):
+               vocab, codes = np.unique(column.astype(str), return_inverse=True)
+               np.save(path + CODES_EXT, codes.reshape(column.shape).astype(np.int32))
+               np.save(path + VOCAB_EXT, vocab)
+            else:
+               np.save(path + COLUMN_EXT, column)
+         self.__writeMeta(tempDir, meta)
+
+         entryDir = self.getEntryDir(filename)
+         if(os.path.exists(entryDir)):
+            shutil.rmtree(entryDir)
+         os.rename(tempDir, entryDir)
+      except:
+         shutil.rmtree(tempDir, ignore_errors=True)
+         raise
+
+      self.evict()
+
+
+   def loadDerived(self, filename, name):
+      """
+      Load data computed from an archive and stored next to its columns,
+      e.g. the sensor pyramid.
+
+      Params
+      ------
+         filename - Name of the archive.
+         name     - Name of the derived data.
+
+      Return
+      ------
+         dict - Map of array name to array, or None if the data or the
+                archive are not cached or are out of date.
+      """
+      if(False == self.isValid(filename)):
+         return None
+      try:
+         with np.load(os.path.join(self.getEntryDir(filename), name + DERIVED_EXT)) as data:
+            return dict((key, data[key]) for key in data.files)
+      except (IOError, ValueError):
+         return None
+
+
+   def storeDerived(self, filename, name, arrays):
+      """
+      Save data computed from an archive next to its columns. The data is
+      dropped with the entry when the archive changes.
+
+      Params
+      ------
+         filename - Name of the archive.
+         name     - Name of the derived data.
+         arrays   - Map of array name to array.
+
+      Return
+      ------
+         bool - True if stored, False if the archive is not cached.
+      """
+      if(False == self.isValid(filename)):
+         return False
+      entryDir = self.getEntryDir(filename)
+      fd, tempFile = tempfile.mkstemp(dir=entryDir)
+      try:
+         with os.fdopen(fd, "wb") as fp:
+            np.savez(fp, **arrays)
+         os.replace(tempFile, os.path.join(entryDir, name + DERIVED_EXT))
+      except:
+         os.remove(tempFile)
+         raise
+      return True
+
+
+   def getSize(self, entryDir):
+      """
+      Get the size of a cache entry on disk [bytes].
+      """
+      return sum(entry.stat().st_size for entry in os.scandir(entryDir) if entry.is_file())
+
+
+   def evict(self):
+      """
+      Remove the least recently used entries until the total size
+      of the cache is within the configured limit.
+
+      Return
+      ------
+         int - Number of entries removed.
+      """
+      if(self.maxBytes is None):
+         return 0
+
+      entries = []
+      for entry in os.scandir(self.cacheDir):
+         metaPath = os.path.join(entry.path, META_FILE)
+         if(entry.is_dir() and os.path.exists(metaPath)):
+            entries.append((os.stat(metaPath).st_mtime, self.getSize(entry.path), entry.path))
+
+      total = sum(size for _, size, _ in entries)
+      removed = 0
+      for _, size, path in sorted(entries):
+         if(total <= self.maxBytes):
+            break
+         shutil.rmtree(path, ignore_errors=True)
+         total -= size
+         removed += 1
+      return removed
+
+
+   def clear(self):
+      """
+      Remove all the entries in the cache. Other folders in the cache
+      directory, e.g. the results of previous runs, are kept.
+      """
+      for entry in os.scandir(self.cacheDir):
+         if(entry.is_dir() and os.path.exists(os.path.join(entry.path, META_FILE))):
+            shutil.rmtree(entry.path, ignore_errors=True)
@@ -0,0 +1,352 @@
+import numpy as np
+from .CAMSConstants import *
+
+# Code used for values that are not in a vocabulary.
+MISSING_CODE = -1
+
+
+class Vocabulary():
+   """
+   Mapping between the strings of a categorical column and
+   the integer codes stored in the archive. A vocabulary is
+   shared by every archive so codes can be compared directly
+   across archives loaded in the same process.
+   """
+
+   def __init__(self, values=()):
+      """
+      Params
+      ------
+         values - Initial values. These get the lowest codes,
+                  in the order given.
+      """
+      self.values = []
+      self.codes  = {}
+      self.__array = None
+      for value in values:
+         self.add(value)
+
+
+   def __len__(self):
+      return len(self.values)
+
+
+   def __getitem__(self, code):
+      return self.values[code]
+
+
+   def add(self, value):
+      """
+      Get the code for a value, adding it to the vocabulary if needed.
+
+      Params
+      ------
+         value - String to add.
+
+      Return
+      ------
+         int - Code assigned to the value.
+      """
+      code = self.codes.get(value)
+      if(code is None):
+         code = len(self.values)
+         self.values.append(value)
+         self.codes[value] = code
+         self.__array = None
+      return code
+
+
+   def code(self, value):
+      """
+      Get the code for a value without adding it.
+
+      Return
+      ------
+         int - Code of the value or MISSING_CODE if it is unknown.
+      """
+      return self.codes.get(value, MISSING_CODE)
+
+
+   def asArray(self):
+      """
+      Get the vocabulary as an object array indexed by code.
+      """
+      if(self.__array is None):
+         self.__array = np.empty(len(self.values), dtype=object)
+         self.__array[:] = self.values
+      return self.__array
+
+
+   def encode(self, values):
+      """
+      Encode an array of strings. Each unique value is looked up once.
+
+      Params
+      ------
+         values - Array of strings.
+
+      Return
+      ------
+         ndarray - Array of codes with type ENTRY_TYPE_CAT.
+      """
+      values = np.asarray(values, dtype=object)
+      if(0 == values.size):
+         return np.empty(values.shape, dtype=ENTRY_TYPE_CAT)
+      unique, inverse = np.unique(values, return_inverse=True)
+      return self.encodeUnique(unique, inverse).reshape(values.shape)
+
+
+   def encodeUnique(self, unique, inverse):
+      """
+      Encode values already split into unique strings and their positions.
+
+      Params
+      ------
+         unique  - Array of unique strings.
+         inverse - Index into unique for each row.
+
+      Return
+      ------
+         ndarray - Array of codes with type ENTRY_TYPE_CAT.
+      """
+      lookup = np.array([self.add(value) for value in unique], dtype=ENTRY_TYPE_CAT)
+      return lookup[np.asarray(inverse).reshape(-1)]
+
+
+   def decode(self, codes):
+      """
+      Decode an array of codes into an object array of strings.
+      """
+      return self.asArray()[codes]
+
+
+def getConstants(cls):
+   """
+   Get the string values defined in a class of constants.
+   """
+   values = []
+   for name, value in vars(cls).items():
+      if(name.startswith('_')):
+         continue
+      if(isinstance(value, str)):
+         values.append(value)
+      elif(isinstance(value, list)):
+         values.extend(value)
+   return values
+
+
+# Vocabularies for each categorical column. They are seeded with the
+# constants so those always resolve to the same codes.
+VOCABULARY = {
+   I_EVENT_SOURCE : Vocabulary(getConstants(EventSource)),
+   I_EVENT_DESC   : Vocabulary(getConstants(EventDesc) + sorted(PARAMS_TOTAL)),
+   I_ERROR_PHASE  : Vocabulary(getConstants(ErrorState))
+   }
+
+
+class Categorical(np.ndarray):
+   """
+   View of the codes of a categorical column.
+   Comparisons against strings are resolved to codes once and
+   evaluated as integer operations. Reading a single element
+   returns the string it represents.
+   """
+
+   def __new__(cls, codes, vocabulary):
+      obj = np.asarray(codes).view(cls)
+      obj.vocabulary = vocabulary
+      return obj
+
+
+   def __array_finalize__(self, obj):
+      if obj is None:
+         return
+      self.vocabulary = getattr(obj, 'vocabulary', None)
+
+
+   def __getitem__(self, key):
+      item = super().__getitem__(key)
+      if(isinstance(item, Categorical)):
+         return item
+      return self.vocabulary[int(item)]
+
+
+   def __iter__(self):
+      return iter(self.decode())
+
+
+   def __eq__(self, other):
+      codes = self.view(np.ndarray)
+      if(isinstance(other, str)):
+         return codes == self.vocabulary.code(other)
+      if(isinstance(other, Categorical) and other.vocabulary is self.vocabulary):
+         return codes == other.view(np.ndarray)
+      return self.decode() == other
+
+
+   def __ne__(self, other):
+      return np.logical_not(self.__eq__(other))
+
+
+   def __contains__(self, value):
+      return bool(np.any(self.__eq__(value)))
+
+
+   __hash__ = None
+
+
+   def getCodes(self):
+      """
+      Get the codes as a plain integer array.
+      """
+      return self.view(np.ndarray)
+
+
+   def decode(self):
+      """
+      Get the column as an object array of strings.
+      """
+      return self.vocabulary.decode(self.getCodes())
+
+
+   def tolist(self):
+      return self.decode().tolist()
+
+
+   def __repr__(self):
+      return "Categorical(%s)" % repr(self.decode())
+
+
+   def __str__(self):
+      return str(self.decode())
+
+
+   def isin(self, values):
+      """
+      Test membership against a collection of strings.
+
+      Params
+      ------
+         values - Collection of strings.
+
+      Return
+      ------
+         ndarray - Boolean mask with one entry per row.
+      """
+      codes = [self.vocabulary.code(value) for value in values]
+      return np.isin(self.getCodes(), [code for code in codes if code != MISSING_CODE])
+
+
+   def unique(self):
+      """
+      Get the codes present in the column and the position of each row in them.
+      """
+      return np.unique(self.getCodes(), return_inverse=True)
+
+
+   def map(self, function, dtype=object):
+      """
+      Apply a function to the string of every row.
+      The function is evaluated once for each code present.
+
+      Params
+      ------
+         function - Function applied to each value.
+         dtype    - Type of the values returned by the function.
+
+      Return
+      ------
+         ndarray - Result of the function for every row.
+      """
+      if(0 == self.size):
+         return np.empty(self.shape, dtype=dtype)
+      codes, inverse = self.unique()
+      results = np.empty(len(codes), dtype=dtype)
+      results[:] = [function(self.vocabulary[code]) for code in codes]
+      return results[inverse.reshape(-1)].reshape(self.shape)
+
+
+   def match(self, predicate):
+      """
+      Evaluate a predicate on the string of every row.
+
+      Return
+      ------
+         ndarray - Boolean mask with one entry per row.
+      """
+      return self.map(predicate, bool)
+
+
+class Record():
+   """
+   Single row of an archive. Categorical fields are returned
+   as strings, all others as stored. Columns loaded after the
+   archive was read are passed separately, already decoded.
+   """
+
+   __slots__ = ('row', 'extra')
+
+   def __init__(self, row, extra=None):
+      """
+      Params
+      ------
+         row   - Row of the structured array.
+         extra - Optional dictionary with the values of other columns.
+      """
+      self.row   = row
+      self.extra = extra
+
+
+   def getNames(self):
+      """
+      Get the names of the fields of the row.
+      """
+      if(self.extra is None):
+         return self.row.dtype.names
+      return tuple(name for name, _ in TYPE_KEYS if name in self.extra or name in self.row.dtype.names)
+
+
+   def __getitem__(self, key):
+      if(isinstance(key, (int, np.integer))):
+         key = self.getNames()[key]
+      if(self.extra is not None and key in self.extra):
+         return self.extra[key]
+      value = self.row[key]
+      if(key in VOCABULARY):
+         return VOCABULARY[key][int(value)]
+      return value
+
+
+   def __len__(self):
+      return len(self.getNames())
+
+
+   def __iter__(self):
+      for name in self.getNames():
+         yield self[name]
+
+
+   def __repr__(self):
+      return repr(tuple(self))
+
+
+def encodeColumns(array):
+   """
+   Convert a structured array with the categorical fields stored
+   as strings into an array with the fields in TYPE_KEYS.
+
+   Params
+   ------
+      array - Structured array with the same field names as TYPE_KEYS.
+
+   Return
+   ------
+      ndarray - Structured array with the fields in TYPE_KEYS.
+   """
+   result = np.empty(array.shape, dtype=TYPE_KEYS)
+   for name, _ in TYPE_KEYS:
+      if(name in VOCABULARY):
+         result[name] = VOCABULARY[name].encode(array[name])
+      else:
+         result[name] = array[name]
+   return result
@@ -0,0 +1,227 @@
+import io
+import os
+import re
+import bz2
+import gzip
+import lzma
+import queue
+import zipfile
+import threading
+
+# Zstandard archives are only available when the zstandard package is installed.
+try:
+   import zstandard
+except ImportError:
+   zstandard = None
+
+# Extensions of the archives.
+TEXT_EXT  = ".txt"
+GZIP_EXT  = ".gz"
+BZIP2_EXT = ".bz2"
+XZ_EXT    = ".xz"
+ZSTD_EXT  = ".zst"
+ZIP_EXT   = ".zip"
+
+# Number of decompressed bytes read at a time.
+DECOMPRESS_BLOCK = 4 * 1024 * 1024
+
+# Number of decompressed blocks the reader thread keeps ahead of the parser.
+READ_AHEAD = 4
+
+# Member of a zip file, e.g. "Logs.zip/192.168.7.8_0000.txt".
+MEMBER_RE = re.compile(r'^(.*?' + re.escape(ZIP_EXT) + r')[/\\](.+)$', re.IGNORECASE)
+
+
+def splitMember(filename):
+   """
+   Split the name of an archive stored in a zip file.
+
+   Params
+   ------
+      filename - Name of the archive, e.g. "Logs.zip/192.168.7.8_0000.txt".
+
+   Return
+   ------
+      string - Name of the file on disk.
+      string - Name of the member in the zip file (None for other files).
+   """
+   match = MEMBER_RE.match(filename)
+   if(match is not None and os.path.isfile(match.group(1))):
+      return match.group(1), match.group(2).replace('\\', '/')
+   if(filename.lower().endswith(ZIP_EXT)):
+      return filename, getZipMembers(filename)[0]
+   return filename, None
+
+
+def getSourceFile(filename):
+   """
+   Get the file on disk holding an archive, checked for changes
+   by the cache and the manifests.
+   """
+   return splitMember(filename)[0]
+
+
+def getExtension(filename):
+   """
+   Get the compression extension of an archive ("" for plain text).
+   """
+   name = getSourceFile(filename).lower()
+   for ext in (GZIP_EXT, BZIP2_EXT, XZ_EXT, ZSTD_EXT, ZIP_EXT):
+      if(name.endswith(ext)):
+         return ext
+   return ""
+
+
+def isCompressed(filename):
+   return "" != getExtension(filename)
+
+
+def isArchiveFile(name):
+   """
+   Check whether a file in the data tree holds archives: text logs,
+   possibly compressed (e.g. ".txt.gz"), or zip files of logs.
+   """
+   return TEXT_EXT in name or name.lower().endswith(ZIP_EXT)
+
+
+def getZipMembers(filename):
+   """
+   Get the names of the logs stored in a zip file, in the order stored.
+   """
+   with zipfile.ZipFile(filename) as archive:
+      members = [info.filename for info in archive.infolist() if False == info.is_dir() and TEXT_EXT in info.filename]
+   if(0 == len(members)):
+      raise ValueError("No log found in zip file: " + filename)
+   return members
+
+
+def listArchives(filename):
+   """
+   Get the archives held by a file of the data tree: every log of a zip
+   file, or the file itself.
+   """
+   if(filename.lower().endswith(ZIP_EXT)):
+      return [filename + "/" + member for member in getZipMembers(filename)]
+   return [filename]
+
+
+def openArchive(filename):
+   """
+   Open an archive for reading, decompressing it on the fly.
+
+   Params
+   ------
+      filename - Name of the archive (plain, compressed or a zip member).
+
+   Return
+   ------
+      file - Binary file object with the text of the archive.
+   """
+   ext = getExtension(filename)
+   if(GZIP_EXT == ext):
+      return gzip.open(filename, "rb")
+   if(BZIP2_EXT == ext):
+      return bz2.open(filename, "rb")
+   if(XZ_EXT == ext):
+      return lzma.open(filename, "rb")
+   if(ZSTD_EXT == ext):
+      if(zstandard is None):
+         raise ImportError("Zstandard archives require the zstandard package.")
+      # The reader of zstandard does not split lines, buffer it like the other formats.
+      return io.BufferedReader(zstandard.ZstdDecompressor().stream_reader(open(filename, "rb"), closefd=True))
+   if(ZIP_EXT == ext):
+      source, member = splitMember(filename)
+      # The member keeps the zip file open until it is closed.
+      with zipfile.ZipFile(source) as archive:
+         return archive.open(member)
+   return open(filename, "rb")
+
+
+def readHeader(filename):
+   """
+   Read the first line of an archive. Only the start of a compressed
+   archive is decompressed.
+
+   Return
+   ------
+      string - First line of the archive.
+   """
+   with openArchive(filename) as fp:
+      return fp.readline().decode('utf-8', 'replace')
+
+
+def readBlocks(filename, blockSize=DECOMPRESS_BLOCK, readAhead=READ_AHEAD):
+   """
+   Read the text of an archive in large blocks. Compressed archives are
+   decompressed by a reader thread, so the next blocks are decompressed
+   while the current one is parsed (the decompressors release the GIL).
+   Blocks are not aligned on lines.
+
+   Params
+   ------
+      filename  - Name of the archive.
+      blockSize - Number of decompressed bytes per block.
+      readAhead - Number of blocks decompressed ahead of the consumer.
+
+   Return
+   ------
+      generator - Blocks of bytes.
+   """
+   if(False == isCompressed(filename)):
+      with open(filename, "rb") as fp:
+         for block in iter(lambda: fp.read(blockSize), b''):
+            yield block
+      return
+
+   blocks = queue.Queue(readAhead)
+   stop = threading.Event()
+
+   def decompress():
+      try:
+         with openArchive(filename) as fp:
+            while(False == stop.is_set()):
+               block = fp.read(blockSize)
+               blocks.put(block)
+               if(not block):
+                  return
+      except Exception as e:
+         blocks.put(e)
+
+   reader = threading.Thread(target=decompress, daemon=True)
+   reader.start()
+   try:
+      while(True):
+         block = blocks.get()
+         if(isinstance(block, Exception)):
+            raise block
+         if(not block):
+            break
+         yield block
+   finally:
+      # Unblock the reader if the consumer stopped early.
+      stop.set()
+      while(reader.is_alive()):
+         try:
+            blocks.get(timeout=0.1)
+         except queue.Empty:
+            pass
+      reader.join()
+
+
+def readLines(filename, blockSize=DECOMPRESS_BLOCK):
+   """
+   Read the text of an archive in large blocks of complete lines.
+
+   Return
+   ------
+      generator - Blocks of bytes ending with a line break (except the last one).
+   """
+   pending = b''
+   for block in readBlocks(filename, blockSize):
+      pending += block
+      end = pending.rfind(b'\n') + 1
+      if(end > 0):
+         yield pending[:end]
+         pending = pending[end:]
+   if(pending):
+      yield pending
@@ -4,10 +4,12 @@ from enum import Enum, unique
 # Changes affect archives globally.
 ENTRY_TYPE_STR = 'O'    # Object/string
 ENTRY_TYPE_OBJ = 'O'    # Object/string
+ENTRY_TYPE_SHT = 'i2'   # 16-bit integer
 ENTRY_TYPE_INT = 'i4'   # 32-bit integer
 ENTRY_TYPE_LNG = 'i8'   # 64-bit integer
 ENTRY_TYPE_FLT = 'f4'   # 32-bit float
 ENTRY_TYPE_DBL = 'f8'   # 64-bit double
+ENTRY_TYPE_CAT = 'i4'   # Categorical (code into a shared vocabulary)
 
 # Field names to use for addressing archive columns.
 # Replacing these with numbers will allow numerical indexing.
@@ -29,6 +31,25 @@ I_LOG_TYPE     = 'LOG_TYPE'       # Event: CAMS_SYSTEM (periodic) or OPERATOR (a
 # Additional field names for common computations
 I_OSMET_FINE   = 'OSMET_FINE'     # 
 
+# Definition of field types for each archive column. 
+# The order matches the order of the fields in the log files. 
+TYPE_KEYS = [
+   (I_MET,          ENTRY_TYPE_INT), 
+   (I_OSMET,        ENTRY_TYPE_LNG), 
+   (I_CABIN_O2,     ENTRY_TYPE_FLT), 
+   (I_CABIN_P,      ENTRY_TYPE_FLT), 
+   (I_CABIN_T,      ENTRY_TYPE_FLT), 
+   (I_CABIN_CO2,    ENTRY_TYPE_FLT), 
+   (I_CABIN_H,      ENTRY_TYPE_FLT), 
+   (I_TANK_O2,      ENTRY_TYPE_FLT), 
+   (I_TANK_N2,      ENTRY_TYPE_FLT), 
+   (I_EVENT_SOURCE, ENTRY_TYPE_CAT), 
+   (I_EVENT_DESC,   ENTRY_TYPE_CAT), 
+   (I_ERROR_PHASE,  ENTRY_TYPE_CAT), 
+   (I_ID,           ENTRY_TYPE_INT), 
+   (I_LOG_TYPE,     ENTRY_TYPE_STR)  
+   ]  
+
 PARAMS_NECESSARY = {
    "OXYGEN_VALVE_LEAK"               : set(["ox_tank_display", "ox_open", "ox_second", "possible_flow"]),
    "OXYGEN_VALVE_BLOCK"              : set(["ox_tank_display", "ox_open", "ox_second", "possible_flow"]),
@@ -53,6 +74,165 @@ PARAMS_TOTAL = set([
    "possible_flow"
    ])
 
+# Field names for the fault episodes found in an archive. 
+# Row indexes are -1 when the event was not found in the episode.
+E_START          = 'START'            # First row of the episode (row after previous GREEN)
+E_GREEN          = 'GREEN'            # Row of the GREEN phase change closing the episode
+E_RED_FIRST      = 'RED_FIRST'        # Row of the first RED phase change
+E_RED            = 'RED'              # Row of the last RED phase change
+E_AFIRA          = 'AFIRA'            # Row of the last fault diagnosis by AFIRA
+E_FIRST_REPAIR   = 'FIRST_REPAIR'     # Row of the first repair order sent
+E_CORRECT_REPAIR = 'CORRECT_REPAIR'   # Row of the last correct repair order sent
+E_REPAIR_COUNT   = 'REPAIR_COUNT'     # Number of repair orders sent
+E_FAULT_INDEX    = 'FAULT_INDEX'      # Number of faults diagnosed up to the end of the episode
+
+EPISODE_TYPE_KEYS = [
+   (E_START,          ENTRY_TYPE_LNG),
+   (E_GREEN,          ENTRY_TYPE_LNG),
+   (E_RED_FIRST,      ENTRY_TYPE_LNG),
+   (E_RED,            ENTRY_TYPE_LNG),
+   (E_AFIRA,          ENTRY_TYPE_LNG),
+   (E_FIRST_REPAIR,   ENTRY_TYPE_LNG),
+   (E_CORRECT_REPAIR, ENTRY_TYPE_LNG),
+   (E_REPAIR_COUNT,   ENTRY_TYPE_INT),
+   (E_FAULT_INDEX,    ENTRY_TYPE_INT)
+   ]
+
+# Field names for the metrics extracted from each fault episode.
+M_FAULT_INDEX  = 'FAULT_INDEX'    # Number of faults diagnosed up to the end of the episode
+M_HAS_FAULT    = 'HAS_FAULT'      # 1 if AFIRA misdiagnosed the fault (automation failure)
+M_REPAIR_COUNT = 'REPAIR_COUNT'   # Number of repair orders sent
+M_FIT          = 'FIT'            # Fault Identification Time [milliseconds]
+M_AVT          = 'AVT'            # Automation Verification Time [milliseconds]
+M_AVS_RP       = 'AVS_RP'         # Automation Verification Sampling of Relevant Parameters
+M_AVS_NP       = 'AVS_NP'         # Automation Verification Sampling of Necessary Parameters
+M_CON_CHECK    = 'CON_CHECK'      # Mean connection check response time [milliseconds]
+M_LOGGING      = 'LOGGING'        # Proportion of logging tasks completed
+
+METRIC_TYPE_KEYS = [
+   (M_FAULT_INDEX,  ENTRY_TYPE_INT),
+   (M_HAS_FAULT,    ENTRY_TYPE_INT),
+   (M_REPAIR_COUNT, ENTRY_TYPE_INT),
+   (M_FIT,          ENTRY_TYPE_LNG),
+   (M_AVT,          ENTRY_TYPE_LNG),
+   (M_AVS_RP,       ENTRY_TYPE_DBL),
+   (M_AVS_NP,       ENTRY_TYPE_DBL),
+   (M_CON_CHECK,    ENTRY_TYPE_DBL),
+   (M_LOGGING,      ENTRY_TYPE_DBL)
+   ]
+
+# Field names for the optional metrics, left out of METRIC_TYPE_KEYS.
+M_CON_CHECK_COUNT  = 'CON_CHECK_COUNT'    # Number of connection check responses
+M_CON_CHECK_MEDIAN = 'CON_CHECK_MEDIAN'   # Median connection check response time [milliseconds]
+M_CON_CHECK_P95    = 'CON_CHECK_P95'      # 95th percentile of the response times [milliseconds]
+M_PROSPECTIVE      = 'PROSPECTIVE'        # Proportion of CO2 log entries on time (prospective memory)
+
+# Field names identifying the session of each row of the output.
+O_MISSION = 'MISSION'   # Index of the mission folder
+O_USER    = 'USER'      # Subject, unique across missions
+O_SESSION = 'SESSION'   # Session of the subject (1 to NUM_SESSIONS)
+O_FAULT   = 'FAULT'     # 1 if the session has an automation fault
+
+OUTPUT_TYPE_KEYS = [
+   (O_MISSION, ENTRY_TYPE_INT),
+   (O_USER,    ENTRY_TYPE_INT),
+   (O_SESSION, ENTRY_TYPE_INT),
+   (O_FAULT,   ENTRY_TYPE_INT)
+   ] + METRIC_TYPE_KEYS
+
+# Field names added to every row of a consolidated dataset, 
+# together with O_MISSION, O_USER, O_SESSION and O_FAULT.
+K_FILE   = 'FILE'     # Position of the archive in the dataset
+K_SCRIPT = 'SCRIPT'   # Code of the script name of the archive
+
+KEY_TYPE_KEYS = [
+   (K_FILE,    ENTRY_TYPE_INT),
+   (K_SCRIPT,  ENTRY_TYPE_SHT),
+   (O_MISSION, ENTRY_TYPE_SHT),
+   (O_USER,    ENTRY_TYPE_SHT),
+   (O_SESSION, ENTRY_TYPE_SHT),
+   (O_FAULT,   ENTRY_TYPE_SHT)
+   ]
+
+# Values used for metrics that cannot be computed for an episode
+# (e.g. no RED phase change, no repair order or unknown fault).
+# Time differences can be negative (e.g. AVT), so missing times use
+# the lowest 64-bit integer, which no time difference can reach.
+MISSING_TIME  = -2**63
+MISSING_RATIO = float('nan')
+
+# Text written for MISSING_TIME and MISSING_RATIO in the comma separated
+# outputs (see formatMetrics), read back as those values by loadTextOutput.
+MISSING_TEXT = "NA"
+
+class LoadEngine():
+   """
+   Abstract class for the engines available to read an archive from disk. 
+   """
+   BULK       = "bulk"          # Read the whole file and convert columns in bulk.
+   GENFROMTXT = "genfromtxt"    # Reference engine using numpy.genfromtxt.
+
+
+class ParseEngine():
+   """
+   Abstract class for the engines available to extract metrics from an archive. 
+   """
+   VECTOR = "vector"     # Find episode boundaries with masks and index ranges.
+   LOOP   = "loop"       # Reference engine iterating through every row.
+
+
+class OutputFormat():
+   """
+   Abstract class for the formats available to write the metrics. 
+   """
+   TEXT    = "text"       # Comma separated text, one file per session.
+   NPY     = "npy"        # Single record array with the fields in OUTPUT_TYPE_KEYS.
+   PARQUET = "parquet"    # Single Parquet table (requires pyarrow).
+
+
+class Aggregate():
+   """
+   Abstract class for the aggregates available to group a dataset. 
+   """
+   COUNT = "COUNT"   # Number of rows in the group.
+   SUM   = "SUM"     # Sum of the values.
+   MEAN  = "MEAN"    # Mean of the values.
+   MIN   = "MIN"     # Smallest value.
+   MAX   = "MAX"     # Largest value.
+
+
+class Severity():
+   """
+   Abstract class for the severity of the problems found in an archive. 
+   """
+   ERROR   = "error"      # The archive cannot be processed reliably.
+   WARNING = "warning"    # Some metrics may be missing or inaccurate.
+
+
+class Check():
+   """
+   Abstract class for the checks run when validating an archive. 
+   """
+   READ           = "read"             # File cannot be read.
+   HEADER         = "header"           # Missing script header.
+   EMPTY          = "empty"            # No rows.
+   COLUMNS        = "columns"          # Wrong number of columns in a line.
+   NUMERIC        = "numeric"          # Invalid numeric value.
+   DECIMAL_STYLE  = "decimal_style"    # Decimal commas and points mixed.
+   ID_ORDER       = "id_order"         # ID not increasing.
+   MET_ORDER      = "met_order"        # MET decreasing.
+   OSMET_ORDER    = "osmet_order"      # OSMET decreasing.
+   TIME_GAP       = "time_gap"         # Large gap between two rows.
+   UNKNOWN_SOURCE = "unknown_source"   # Event source not known.
+   UNKNOWN_DESC   = "unknown_desc"     # Event description not valid for its source.
+   UNKNOWN_PHASE  = "unknown_phase"    # Error phase not known.
+   UNKNOWN_FAULT  = "unknown_fault"    # Fault diagnosed or repaired not in PARAMS_NECESSARY.
+   NO_EPISODES    = "no_episodes"      # No GREEN phase change.
+   EPISODE_RED    = "episode_red"      # Fault episode without a RED phase change.
+   EPISODE_REPAIR = "episode_repair"   # Fault episode without a correct repair order.
+   EPISODE_OPEN   = "episode_open"     # RED phase change not closed by a GREEN one.
+
+
 # Differentiate whether it was a periodic task by the software or an aperiodic task 
 # where the operator was doing something.
 class EventType():
@@ -146,7 +326,7 @@ class Limits():
       ]
 
    # Humidity limits in relative percent humidity
-   CO2 = [
+   H = [
       36.5, # RED_LOW
       38.0, # GREEN_LOW
       42.0, # GREEN_HIGH
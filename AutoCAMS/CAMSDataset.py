@@ -0,0 +1,386 @@
+import os
+import json
+import shutil
+import tempfile
+import numpy as np
+from .CAMSConstants import *
+from .CAMSCategorical import *
+from .CAMSCache import *
+from .CAMSCompress import *
+from .CAMSArchive import *
+
+# Version of the on-disk layout. Increment when the format changes.
+DATASET_VERSION = 1
+
+# Files stored in a dataset directory.
+DATASET_FILE = "dataset.json"   # Manifest: columns, vocabularies and archives
+DATA_EXT     = ".bin"           # Raw column data, one file per column
+
+# Number of rows processed at a time by the group-by operations.
+DATASET_CHUNK = 1024 * 1024
+
+# Largest number of key combinations a group-by can produce.
+MAX_GROUPS = 1 << 24
+
+# Fields stored for each archive in the manifest.
+D_PATH    = "path"
+D_SCRIPT  = "script"
+D_START   = "start"    # First row of the archive in the dataset
+D_STOP    = "stop"     # Row after the last row of the archive
+D_SIZE    = "size"
+D_MTIME   = "mtime"
+
+# Key columns stored in the manifest of each archive.
+FILE_KEYS = [K_FILE, K_SCRIPT, O_MISSION, O_USER, O_SESSION, O_FAULT]
+
+
+def getDatasetColumns():
+   """
+   Get the columns stored in a dataset. String and categorical columns
+   are stored as codes into a vocabulary saved in the manifest.
+
+   Return
+   ------
+      list - Tuples (name, type).
+   """
+   columns = [(name, ENTRY_TYPE_CAT if isEncoded(name, kind) else kind) for name, kind in TYPE_KEYS]
+   return columns + KEY_TYPE_KEYS
+
+
+def buildDataset(directory, archives, cache=None):
+   """
+   Concatenate archives into a single memory-mapped dataset.
+   The archives are read one at a time and their columns appended to
+   one raw file per column, so the whole study is never held in memory.
+   The dataset is written into a temporary directory first and replaces
+   any previous one at the end.
+
+   Params
+   ------
+      directory - Folder the dataset is written to.
+      archives  - List of tuples (filename, prefix), with the prefix
+                  (missionId, userId, sessionId, hasFault) of each archive.
+      cache     - Optional ArchiveCache used to load the archives.
+
+   Return
+   ------
+      Dataset - The dataset written.
+   """
+   directory = os.path.normpath(directory)
+   parent = os.path.dirname(os.path.abspath(directory))
+   os.makedirs(parent, exist_ok=True)
+
+   columns = getDatasetColumns()
+   vocabularies = dict((name, VOCABULARY.get(name, Vocabulary())) for name, kind in TYPE_KEYS
+                       if isEncoded(name, kind))
+   scripts = Vocabulary()
+   files   = []
+   rows    = 0
+
+   tempDir = tempfile.mkdtemp(dir=parent)
+   try:
+      handles = dict((name, open(os.path.join(tempDir, name + DATA_EXT), "wb")) for name, _ in columns)
+      try:
+         for filename, prefix in archives:
+            archive = Archive(filename, cache=cache)
+            array   = np.atleast_1d(archive.view(np.ndarray))
+            script  = archive.getScript() or ""
+
+            for name, kind in columns[:len(TYPE_KEYS)]:
+               column = array[name]
+               if(name in vocabularies and name not in VOCABULARY):
+                  column = vocabularies[name].encode(column)
+               np.ascontiguousarray(column, dtype=kind).tofile(handles[name])
+
+            keys = dict(zip([O_MISSION, O_USER, O_SESSION, O_FAULT], [int(value) for value in prefix]))
+            keys[K_SCRIPT] = scripts.add(script)
+            keys[K_FILE]   = len(files)
+            for name, kind in KEY_TYPE_KEYS:
+               np.full(len(array), keys[name], dtype=kind).tofile(handles[name])
+
+            stat = os.stat(getSourceFile(filename))
+            entry = {
+               D_PATH   : filename,
+               D_START  : rows,
+               D_STOP   : rows + len(array),
+               D_SIZE   : stat.st_size,
+               D_MTIME  : stat.st_mtime_ns
+               }
+            entry.update((name, keys[name]) for name in FILE_KEYS)
+            entry[D_SCRIPT] = script
+            files.append(entry)
+            rows += len(array)
+      finally:
+         for handle in handles.values():
+            handle.close()
+
+      manifest = {
+         "version"      : DATASET_VERSION,
+         "schema"       : getSchemaKey(),
+         "rows"         : rows,
+         "columns"      : [[name, kind] for name, kind in columns],
+         "vocabularies" : dict((name, list(vocabulary.values)) for name, vocabulary in vocabularies.items()),
+         "scripts"      : list(scripts.values),
+         "files"        : files
+         }
+      with open(os.path.join(tempDir, DATASET_FILE), "w") as fp:
+         json.dump(manifest, fp, indent=1)
+
+      if(os.path.exists(directory)):
+         shutil.rmtree(directory)
+      os.rename(tempDir, directory)
+   except:
+      shutil.rmtree(tempDir, ignore_errors=True)
+      raise
+   return Dataset(directory)
+
+
+class Dataset():
+   """
+   Every archive of a study as one table of memory-mapped columns.
+
+   The rows of each archive are contiguous and keep their order. Besides
+   the columns in TYPE_KEYS, every row carries the keys of its archive
+   (see KEY_TYPE_KEYS). Categorical columns, and the script names in
+   K_SCRIPT, are returned as Categorical views of their stored codes.
+   Columns are only mapped when first used, and the group-by operations
+   read them in chunks, so the dataset can be larger than the memory.
+   """
+
+   def __init__(self, directory):
+      """
+      Params
+      ------
+         directory - Folder written by buildDataset().
+      """
+      self.directory = directory
+      with open(os.path.join(directory, DATASET_FILE), "r") as fp:
+         manifest = json.load(fp)
+      if(manifest["version"] != DATASET_VERSION or manifest["schema"] != getSchemaKey()):
+         raise ValueError("Dataset was written by another version, build it again: ", directory)
+
+      self.rows    = manifest["rows"]
+      self.files   = manifest["files"]
+      self.types   = dict((name, kind) for name, kind in manifest["columns"])
+      self.vocabularies = dict((name, Vocabulary(values)) for name, values in manifest["vocabularies"].items())
+      self.vocabularies[K_SCRIPT] = Vocabulary(manifest["scripts"])
+      self.__columns = {}
+
+
+   def __len__(self):
+      return self.rows
+
+
+   def __getitem__(self, name):
+      return self.getColumn(name)
+
+
+   def getColumn(self, name):
+      """
+      Get a column without reading it into memory.
+
+      Params
+      ------
+         name - Name of the column, from TYPE_KEYS or KEY_TYPE_KEYS.
+
+      Return
+      ------
+         ndarray - Read-only memory-mapped column, or a Categorical
+                   view of it for string and categorical columns.
+      """
+      if(name not in self.types):
+         raise KeyError("Unknown column: ", name)
+      if(name not in self.__columns):
+         path = os.path.join(self.directory, name + DATA_EXT)
+         if(0 == self.rows):
+            # Empty files cannot be memory-mapped.
+            column = np.empty(0, dtype=self.types[name])
+         else:
+            column = np.memmap(path, dtype=self.types[name], mode='r', shape=(self.rows,))
+         self.__columns[name] = column
+      column = self.__columns[name]
+      if(name in self.vocabularies):
+         return Categorical(column, self.vocabularies[name])
+      return column
+
+
+   def findFiles(self, **keys):
+      """
+      Get the archives matching the given keys, e.g.
+      dataset.findFiles(USER=2, FAULT=1).
+
+      Params
+      ------
+         keys - Values of the fields in FILE_KEYS. Each value can be a
+                single value or a list, tuple or set of values. Scripts
+                are given by name.
+
+      Return
+      ------
+         list - Manifest entries of the archives, in dataset order.
+      """
+      for name in keys:
+         if(name not in FILE_KEYS):
+            raise KeyError("Not a key of the archives: ", name)
+      getValues = lambda value: value if isinstance(value, (list, tuple, set)) else [value]
+      values = dict((name, set(getValues(value))) for name, value in keys.items())
+      if(K_SCRIPT in values):
+         values[K_SCRIPT] = set(self.vocabularies[K_SCRIPT].code(value) for value in values[K_SCRIPT])
+      return [entry for entry in self.files
+              if all(entry[name] in allowed for name, allowed in values.items())]
+
+
+   def getFileRows(self, filename):
+      """
+      Get the rows of an archive in the dataset.
+
+      Return
+      ------
+         slice - Rows of the archive, None if it is not in the dataset.
+      """
+      for entry in self.files:
+         if(entry[D_PATH] == filename):
+            return slice(entry[D_START], entry[D_STOP])
+      return None
+
+
+   def __getBounds(self, name, ranges):
+      """
+      Get the smallest value and the number of values a key can take.
+      """
+      if(name in self.vocabularies):
+         return 0, max(len(self.vocabularies[name]), 1)
+      if(name in FILE_KEYS):
+         values = [entry[name] for entry in self.files] or [0]
+         return min(values), max(values) - min(values) + 1
+      column = self.getColumn(name)
+      lo, hi = None, None
+      for start, stop in ranges:
+         for first in range(start, stop, DATASET_CHUNK):
+            chunk = column[first:min(stop, first + DATASET_CHUNK)]
+            lo = chunk.min() if lo is None else min(lo, chunk.min())
+            hi = chunk.max() if hi is None else max(hi, chunk.max())
+      if(lo is None):
+         return 0, 1
+      return int(lo), int(hi) - int(lo) + 1
+
+
+   def __getMask(self, name, value, first, last):
+      column = self.getColumn(name)[first:last]
+      values = value if isinstance(value, (list, tuple, set)) else [value]
+      if(isinstance(column, Categorical)):
+         return column.isin(values)
+      return np.isin(column, list(values))
+
+
+   def groupBy(self, keys, field=None, aggregates=(Aggregate.COUNT,), where=None):
+      """
+      Group the rows by one or more keys and aggregate a column, e.g. the
+      mean oxygen of each subject in the sessions with an automation fault:
+
+         dataset.groupBy([O_USER], I_CABIN_O2, [Aggregate.MEAN], {O_FAULT : 1})
+
+      Conditions on the keys of the archives select whole archives from the
+      manifest, so only their rows are read. Every key combination is turned
+      into a single group number and the aggregates are accumulated with
+      bincount over chunks of DATASET_CHUNK rows.
+
+      Params
+      ------
+         keys       - List of columns to group by: keys of the archives,
+                      categorical columns or integer columns.
+         field      - Column aggregated (only needed for aggregates other
+                      than Aggregate.COUNT).
+         aggregates - List of Aggregate values.
+         where      - Optional dictionary of conditions {column : value}.
+                      Each value can be a single value or a list, tuple or
+                      set of values.
+
+      Return
+      ------
+         ndarray - Structured array with one record per group found,
+                   sorted by key. It holds the keys (categorical keys as
+                   strings) and one field per aggregate.
+      """
+      keys  = list(keys)
+      where = dict(where or {})
+      if(field is None and any(Aggregate.COUNT != aggregate for aggregate in aggregates)):
+         raise ValueError("A field is needed for the aggregates: ", aggregates)
+
+      # Select the archives, then filter the rows of those archives.
+      fileWhere = dict((name, value) for name, value in where.items() if name in FILE_KEYS)
+      rowWhere  = dict((name, value) for name, value in where.items() if name not in FILE_KEYS)
+      ranges = [(entry[D_START], entry[D_STOP]) for entry in self.findFiles(**fileWhere)
+                if entry[D_STOP] > entry[D_START]]
+
+      # Number of each key combination: sum of (key - lo) * stride.
+      bounds  = [self.__getBounds(name, ranges) for name in keys]
+      strides = [int(np.prod([size for _, size in bounds[i + 1:]], dtype=np.int64)) for i in range(len(keys))]
+      numGroups = int(np.prod([size for _, size in bounds], dtype=np.int64))
+      if(numGroups > MAX_GROUPS):
+         raise ValueError("Too many key combinations to group by: ", numGroups)
+
+      counts = np.zeros(numGroups, dtype=np.int64)
+      sums   = np.zeros(numGroups, dtype=np.float64)
+      mins   = np.full(numGroups, np.inf)
+      maxs   = np.full(numGroups, -np.inf)
+      needSum = (Aggregate.SUM in aggregates or Aggregate.MEAN in aggregates)
+
+      columns = [self.getColumn(name) for name in keys]
+      for start, stop in ranges:
+         for first in range(start, stop, DATASET_CHUNK):
+            last = min(stop, first + DATASET_CHUNK)
+            groups = np.zeros(last - first, dtype=np.int64)
+            for column, (lo, _), stride in zip(columns, bounds, strides):
+               groups += (np.asarray(column[first:last], dtype=np.int64) - lo) * stride
+
+            mask = None
+            for name, value in rowWhere.items():
+               match = self.__getMask(name, value, first, last)
+               mask = match if mask is None else (mask & match)
+            if(mask is not None):
+               groups = groups[mask]
+
+            counts += np.bincount(groups, minlength=numGroups)
+            if(field is None):
+               continue
+            values = np.asarray(self.getColumn(field)[first:last], dtype=np.float64)
+            if(mask is not None):
+               values = values[mask]
+            if(True == needSum):
+               sums += np.bincount(groups, values, minlength=numGroups)
+            if(Aggregate.MIN in aggregates):
+               np.minimum.at(mins, groups, values)
+            if(Aggregate.MAX in aggregates):
+               np.maximum.at(maxs, groups, values)
+
+      # Keep the groups found and split their numbers back into keys.
+      found = np.flatnonzero(counts)
+      types = [(name, object if name in self.vocabularies else np.int64) for name in keys]
+      types += [(aggregate, np.int64 if Aggregate.COUNT == aggregate else np.float64) for aggregate in aggregates]
+      results = np.empty(len(found), dtype=types)
+      for name, (lo, size), stride in zip(keys, bounds, strides):
+         values = (found // stride) % size + lo
+         if(name in self.vocabularies):
+            values = self.vocabularies[name].decode(values)
+         results[name] = values
+      for aggregate in aggregates:
+         if(Aggregate.COUNT == aggregate):
+            results[aggregate] = counts[found]
+         elif(Aggregate.SUM == aggregate):
+            results[aggregate] = sums[found]
+         elif(Aggregate.MEAN == aggregate):
+            results[aggregate] = sums[found] / counts[found]
+         elif(Aggregate.MIN == aggregate):
+            results[aggregate] = mins[found]
+         elif(Aggregate.MAX == aggregate):
+            results[aggregate] = maxs[found]
+         else:
+            raise ValueError("Unknown aggregate: ", aggregate)
+
+      # Group numbers follow the codes of the categorical keys, in the order
+      # the values were first seen, so sort again by the decoded values.
+      if(len(results) > 1 and any(name in self.vocabularies for name in keys)):
+         ranks = [np.unique(results[name], return_inverse=True)[1] for name in keys]
+         results = results[np.lexsort(ranks[::-1])]
+      return results
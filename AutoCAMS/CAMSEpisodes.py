@@ -0,0 +1,322 @@
+import numpy as np
+from .CAMSConstants import *
+from .CAMSJoin import *
+from .CAMSCategorical import *
+
+
+def matchValues(column, predicate):
+   """
+   Evaluate a predicate on a column of strings.
+   The predicate is only called once for each unique value,
+   so substring tests cost the same as an equality test.
+
+   Params
+   ------
+      column    - Array of strings.
+      predicate - Function returning True for matching values.
+
+   Return
+   ------
+      ndarray - Boolean mask with one entry per row.
+   """
+   return mapValues(column, predicate, bool)
+
+
+def mapValues(column, function, dtype=object):
+   """
+   Apply a function to a column of strings, once per unique value.
+
+   Params
+   ------
+      column   - Array of strings.
+      function - Function applied to each value.
+      dtype    - Type of the values returned by the function.
+
+   Return
+   ------
+      ndarray - Result of the function for every row.
+   """
+   column = np.atleast_1d(column)
+   if(isinstance(column, Categorical)):
+      return column.map(function, dtype)
+   if(0 == column.size):
+      return np.empty(0, dtype=dtype)
+   values, inverse = np.unique(column, return_inverse=True)
+   results = np.empty(len(values), dtype=dtype)
+   results[:] = [function(value) for value in values]
+   return results[inverse.reshape(-1)]
+
+
+def countInRanges(rows, lo, hi):
+   """
+   Count the sorted rows falling inside each range [lo, hi].
+   """
+   return np.searchsorted(rows, hi, 'right') - np.searchsorted(rows, lo, 'left')
+
+
+def sumInRanges(rows, values, lo, hi):
+   """
+   Sum the values of the sorted rows falling inside each range [lo, hi].
+   """
+   total = np.concatenate(([0], np.cumsum(values)))
+   return total[np.searchsorted(rows, hi, 'right')] - total[np.searchsorted(rows, lo, 'left')]
+
+
+def firstInRanges(rows, lo, hi):
+   """
+   Find the first of the sorted rows inside each range [lo, hi] (-1 if none).
+   """
+   i = np.searchsorted(rows, lo, 'left')
+   j = np.searchsorted(rows, hi, 'right')
+   found = j > i
+   first = np.full(len(lo), -1, dtype=np.int64)
+   first[found] = rows[i[found]]
+   return first
+
+
+def lastInRanges(rows, lo, hi):
+   """
+   Find the last of the sorted rows inside each range [lo, hi] (-1 if none).
+   """
+   i = np.searchsorted(rows, lo, 'left')
+   j = np.searchsorted(rows, hi, 'right')
+   found = j > i
+   last = np.full(len(lo), -1, dtype=np.int64)
+   last[found] = rows[j[found] - 1]
+   return last
+
+
+def splitFault(value):
+   """
+   Split an AFIRA diagnosis into the fault injected and the fault detected.
+   """
+   injected, detected = value.split(":")
+   return injected, detected
+
+
+def findEpisodes(source, desc, phase):
+   """
+   Split an archive into fault episodes.
+   Every GREEN phase change closes an episode that started on the row
+   after the previous GREEN phase change. The RED phase changes, AFIRA
+   diagnoses and repair orders of each episode are located using masks
+   over the whole archive and binary searches on the matching rows.
+
+   Params
+   ------
+      source - Column I_EVENT_SOURCE of the archive.
+      desc   - Column I_EVENT_DESC of the archive.
+      phase  - Column I_ERROR_PHASE of the archive.
+
+   Return
+   ------
+      ndarray - Structured array with the fields in EPISODE_TYPE_KEYS.
+      ndarray - Object array with the fault injected in each episode.
+      ndarray - Object array with the fault detected in each episode.
+   """
+   source = np.atleast_1d(source)
+   desc   = np.atleast_1d(desc)
+   phase  = np.atleast_1d(phase)
+
+   # Phase changes delimiting the episodes.
+   isPhase   = (desc == EventDesc.PHASE_CHANGE)
+   redRows   = np.flatnonzero(isPhase & (phase == ErrorState.RED))
+   greenRows = np.flatnonzero(isPhase & (phase == ErrorState.GREEN))
+   startRows = np.concatenate(([0], greenRows[:-1] + 1)).astype(np.int64)
+
+   episodes = np.zeros(len(greenRows), dtype=EPISODE_TYPE_KEYS)
+   episodes[E_START]     = startRows
+   episodes[E_GREEN]     = greenRows
+   episodes[E_RED_FIRST] = firstInRanges(redRows, startRows, greenRows)
+   episodes[E_RED]       = lastInRanges(redRows, startRows, greenRows)
+
+   # Faults diagnosed by AFIRA ("injected:detected").
+   afiraRows = np.flatnonzero(matchValues(source, lambda value: EventSource.AFIRA in value) &
+                              matchValues(desc,   lambda value: ":" in value))
+   afiraInjected = mapValues(desc[afiraRows], lambda value: splitFault(value)[0])
+   afiraDetected = mapValues(desc[afiraRows], lambda value: splitFault(value)[1])
+
+   episodes[E_AFIRA]       = lastInRanges(afiraRows, startRows, greenRows)
+   episodes[E_FAULT_INDEX] = np.searchsorted(afiraRows, greenRows, 'right')
+
+   injected = np.full(len(greenRows), None, dtype=object)
+   detected = np.full(len(greenRows), None, dtype=object)
+   found = (episodes[E_AFIRA] >= 0)
+   iAfira = np.searchsorted(afiraRows, episodes[E_AFIRA][found])
+   injected[found] = afiraInjected[iAfira]
+   detected[found] = afiraDetected[iAfira]
+
+   # Repair orders ("repair: FAULT"). Orders for "repair task finished"
+   # are not counted but can still match the fault injected.
+   repairRows = np.flatnonzero(matchValues(desc, lambda value: EventDesc.REPAIR in value))
+   repairs    = mapValues(desc[repairRows], lambda value: value.split(" ")[1])
+   orderRows  = repairRows[repairs != "task"]
+
+   episodes[E_REPAIR_COUNT] = countInRanges(orderRows, startRows, greenRows)
+   episodes[E_FIRST_REPAIR] = firstInRanges(orderRows, startRows, greenRows)
+
+   # A repair is correct when it matches the last fault diagnosed
+   # before it within the same episode.
+   iEpisode  = np.searchsorted(greenRows, repairRows, 'left')
+   inEpisode = (iEpisode < len(greenRows))
+   repairRows, repairs, iEpisode = repairRows[inEpisode], repairs[inEpisode], iEpisode[inEpisode]
+
+   iAfira  = np.searchsorted(afiraRows, repairRows, 'right') - 1
+   current = (iAfira >= 0)
+   current[current] = (afiraRows[iAfira[current]] >= startRows[iEpisode[current]])
+   correct = np.zeros(len(repairRows), dtype=bool)
+   correct[current] = (repairs[current] == afiraInjected[iAfira[current]])
+
+   episodes[E_CORRECT_REPAIR] = lastInRanges(repairRows[correct], startRows, greenRows)
+
+   return episodes, injected, detected
+
+
+def getFaultWindows(episodes):
+   """
+   Get the range of rows where a fault is present in each episode,
+   from the first RED phase change up to the GREEN phase change.
+   Episodes without a RED phase change get an empty range.
+
+   Params
+   ------
+      episodes - Structured array with the fields in EPISODE_TYPE_KEYS.
+
+   Return
+   ------
+      ndarray - First row of each range.
+      ndarray - Last row of each range.
+   """
+   hi = episodes[E_GREEN]
+   lo = np.where(episodes[E_RED_FIRST] >= 0, episodes[E_RED_FIRST], hi + 1)
+   return lo, hi
+
+
+def getEpisodeIndex(episodes, rows):
+   """
+   Get the episode each row belongs to (len(episodes) for rows
+   after the last GREEN phase change).
+   """
+   return np.searchsorted(episodes[E_GREEN], rows, 'left')
+
+
+def getParamsVerified(source, desc, episodes, params):
+   """
+   Find which parameters were verified while the fault was present.
+   Flow monitors are identified by their source, graphic monitors by
+   their description and the possible flow display by its source.
+
+   Params
+   ------
+      source   - Column I_EVENT_SOURCE of the archive.
+      desc     - Column I_EVENT_DESC of the archive.
+      episodes - Structured array with the fields in EPISODE_TYPE_KEYS.
+      params   - List of parameter names of interest.
+
+   Return
+   ------
+      ndarray - Boolean matrix (episodes x params), True if verified.
+   """
+   source = np.atleast_1d(source)
+   desc   = np.atleast_1d(desc)
+   lookup = dict((param, i) for i, param in enumerate(params))
+   toCode = lambda value: lookup.get(value, -1)
+
+   codes = np.full(len(source), -1, dtype=np.int64)
+   isFlow = matchValues(source, lambda value: value in EventSource.FLOW_MONITOR)
+   codes[isFlow] = mapValues(source[isFlow], toCode, np.int64)
+   isGraph = (source == EventSource.GRAPH_MONITOR)
+   codes[isGraph] = mapValues(desc[isGraph], toCode, np.int64)
+   codes[source == EventSource.POSSIBLE_FLOW] = toCode(EventSource.POSSIBLE_FLOW)
+
+   # Running count of each parameter over the rows where one was verified.
+   rows = np.flatnonzero(codes >= 0)
+   seen = np.zeros((len(rows) + 1, len(params)), dtype=np.int64)
+   seen[np.arange(1, len(rows) + 1), codes[rows]] = 1
+   seen = np.cumsum(seen, axis=0)
+
+   lo, hi = getFaultWindows(episodes)
+   first = np.searchsorted(rows, lo, 'left')
+   last  = np.searchsorted(rows, hi, 'right')
+   return (seen[last] - seen[first]) > 0
+
+
+def getConnectionResponses(osmet, source, desc, episodes):
+   """
+   Find the connection check responses while the fault was present and
+   their response times. Each response is paired with the last time the
+   icon appeared during the fault. Responses with no icon during the fault
+   are measured from the first row of the archive, as done by the loop
+   implementation.
+
+   Params
+   ------
+      osmet    - Column I_OSMET of the archive.
+      source   - Column I_EVENT_SOURCE of the archive.
+      desc     - Column I_EVENT_DESC of the archive.
+      episodes - Structured array with the fields in EPISODE_TYPE_KEYS.
+
+   Return
+   ------
+      ndarray - Row of each response.
+      ndarray - Episode of each response.
+      ndarray - Response time of each response [milliseconds].
+   """
+   osmet  = np.atleast_1d(osmet)
+   source = np.atleast_1d(source)
+   desc   = np.atleast_1d(desc)
+   lo, hi = getFaultWindows(episodes)
+
+   isCheck    = (source == EventSource.CONNECTION_CHECK)
+   isAppear   = isCheck & (desc == EventDesc.ICON_APPEARS)
+   appearRows = np.flatnonzero(isAppear)
+   replyRows  = np.flatnonzero(isCheck & ~isAppear)
+
+   # Keep replies inside a fault window.
+   iEpisode = getEpisodeIndex(episodes, replyRows)
+   inside   = (iEpisode < len(episodes))
+   inside[inside] = (replyRows[inside] >= lo[iEpisode[inside]])
+   replyRows, iEpisode = replyRows[inside], iEpisode[inside]
+
+   # Pair with the previous icon in the same window.
+   startRows = pairEvents(appearRows, replyRows, lo[iEpisode], 0)
+   return replyRows, iEpisode, getLatencies(osmet, startRows, replyRows)
+
+
+def getConnectionChecks(osmet, source, desc, episodes):
+   """
+   Measure the connection check response times while the fault was present
+   (see getConnectionResponses()).
+
+   Return
+   ------
+      ndarray - Total response time per episode [milliseconds].
+      ndarray - Number of responses per episode.
+   """
+   replyRows, _, delta = getConnectionResponses(osmet, source, desc, episodes)
+   lo, hi = getFaultWindows(episodes)
+   return sumInRanges(replyRows, delta, lo, hi), countInRanges(replyRows, lo, hi)
+
+
+def getLoggingTasks(source, desc, episodes):
+   """
+   Count the logging tasks while the fault was present.
+
+   Params
+   ------
+      source   - Column I_EVENT_SOURCE of the archive.
+      desc     - Column I_EVENT_DESC of the archive.
+      episodes - Structured array with the fields in EPISODE_TYPE_KEYS.
+
+   Return
+   ------
+      ndarray - Number of log entries per episode.
+      ndarray - Number of log entries missed per episode.
+   """
+   source = np.atleast_1d(source)
+   desc   = np.atleast_1d(desc)
+   lo, hi = getFaultWindows(episodes)
+
+   logRows = np.flatnonzero(source == EventSource.LOGGING_TASK)
+   missed  = (desc[logRows] == EventDesc.LOGGING_MISSED) | (desc[logRows] == EventDesc.LOGGING_EMPTY)
+   return countInRanges(logRows, lo, hi), countInRanges(logRows[missed], lo, hi)
@@ -0,0 +1,204 @@
+import random
+from .CAMSConstants import *
+
+# Values used at the start of a synthetic session.
+START_OSMET = 1525382457470   # Time code of the first row [milliseconds]
+START_TANK  = 30000.0          # Oxygen and nitrogen supply
+
+# Nominal value and step of the random walk of each cabin sensor.
+SENSORS = [
+   (I_CABIN_O2,  19.8,  0.02),
+   (I_CABIN_P,   1.01,  0.001),
+   (I_CABIN_T,   21.0,  0.02),
+   (I_CABIN_CO2, 0.4,   0.01),
+   (I_CABIN_H,   40.0,  0.05)
+   ]
+
+# Duration of each part of a fault episode [seconds].
+GREEN_DURATION  = (120, 300)   # Until the next fault is injected
+RED_DURATION    = (10, 60)     # Until the first repair order
+REPAIR_DURATION = (30, 90)     # Until the repair is finished
+NO_ERROR_DELAY  = 3            # From RED_NO_ERROR to GREEN
+
+# Probability per second of each operator task.
+P_CONNECTION_CHECK = 1.0 / 30
+P_LOGGING_TASK     = 1.0 / 60
+P_GRAPH_MONITOR    = 1.0 / 10
+P_FLOW_MONITOR     = 1.0 / 15
+P_POSSIBLE_FLOW    = 1.0 / 60
+
+# Probability of each kind of mistake.
+P_MISDIAGNOSIS     = 0.2   # AFIRA reports the wrong fault
+P_WRONG_REPAIR     = 0.2   # A wrong repair order is sent first
+P_LOGGING_MISSED   = 0.1   # Logging task missed or left empty
+
+
+class SyntheticSession():
+   """
+   Generator of synthetic AutoCAMS sessions.
+
+   The rows follow the layout of TYPE_KEYS and the event sequence of the
+   real logs: a periodic CamsFirst row every second, fault injections
+   diagnosed by AfiraSystem6 with the names in PARAMS_NECESSARY, repair
+   orders, connection checks, logging tasks and parameter checks by the
+   operator. The same seed always produces the same session.
+   """
+
+   def __init__(self, seed=0, decimalComma=False):
+      """
+      Params
+      ------
+         seed         - Seed of the random number generator.
+         decimalComma - Write decimals in European notation (19,8 instead of 19.8).
+      """
+      self.rng          = random.Random(seed)
+      self.decimalComma = decimalComma
+      self.faults       = sorted(PARAMS_NECESSARY.keys())
+      self.params       = sorted(PARAMS_TOTAL - PARAMS_RELEVANT.union(EventSource.FLOW_MONITOR))
+
+
+   def __formatRow(self, met, osmet, sensors, tanks, source, desc, phase, rowId, logType):
+      values = "%.6f;%.6f;%.6f;%.6f;%.6f;%.6f;%.6f" % (tuple(sensors) + tuple(tanks))
+      if(True == self.decimalComma):
+         values = values.replace('.', ',')
+      return "%d;%d;%s;%s;%s;%s;%d;%s\r\n" % (met, osmet, values, source, desc, phase, rowId, logType)
+
+
+   def __second(self, phase, fault):
+      """
+      Get the operator events for one second of the session.
+      """
+      rng    = self.rng
+      events = []
+      if(rng.random() < P_CONNECTION_CHECK):
+         response = EventDesc.ICON_CLOSED if rng.random() < P_LOGGING_MISSED else EventDesc.ICON_CONFIRMED
+         events.append((rng.randint(0, 299),   EventSource.CONNECTION_CHECK, EventDesc.ICON_APPEARS, EventType.PERIODIC))
+         events.append((rng.randint(300, 999), EventSource.CONNECTION_CHECK, response, EventType.APERIODIC))
+      if(rng.random() < P_LOGGING_TASK):
+         if(rng.random() < P_LOGGING_MISSED):
+            desc = rng.choice([EventDesc.LOGGING_MISSED, EventDesc.LOGGING_EMPTY])
+         else:
+            desc = ".%d" % rng.randint(1, 6)
+         events.append((rng.randint(0, 999), EventSource.LOGGING_TASK, desc, EventType.APERIODIC))
+
+      # Parameter checks are more frequent while a fault is present.
+      factor = 3 if (fault is not None) else 1
+      if(rng.random() < P_GRAPH_MONITOR * factor):
+         param = rng.choice(sorted(PARAMS_RELEVANT) + self.params)
+         events.append((rng.randint(0, 999), EventSource.GRAPH_MONITOR, param, EventType.APERIODIC))
+      if(rng.random() < P_FLOW_MONITOR * factor):
+         source = rng.choice(EventSource.FLOW_MONITOR)
+         events.append((rng.randint(0, 999), source, "open:%d" % rng.randint(0, 30000), EventType.APERIODIC))
+      if(rng.random() < P_POSSIBLE_FLOW * factor):
+         events.append((rng.randint(0, 999), EventSource.POSSIBLE_FLOW, "open: oxygen_std= 10", EventType.APERIODIC))
+      return sorted(events, key=lambda event: event[0])
+
+
+   def rows(self, numRows):
+      """
+      Generate the rows of a session.
+
+      Params
+      ------
+         numRows - Number of rows to generate.
+
+      Return
+      ------
+         generator - One line of text per row, with the line ending.
+      """
+      rng      = self.rng
+      sensors  = [value for _, value, _ in SENSORS]
+      tanks    = [START_TANK, START_TANK]
+      phase    = ErrorState.GREEN
+      fault    = None
+      rowId    = 0
+      met      = 0
+      schedule = []    # (second, description) of delayed repair orders
+      nextPhase = rng.randint(*GREEN_DURATION)
+
+      while(rowId < numRows):
+         osmet = START_OSMET + met * 1000
+
+         # Random walk of the sensors and supply.
+         for i, (_, nominal, step) in enumerate(SENSORS):
+            sensors[i] += rng.uniform(-step, step) + (nominal - sensors[i]) * 0.01
+         tanks[rng.randint(0, 1)] -= rng.uniform(0.0, 10.0)
+
+         # Periodic row of the system.
+         rowPhase = phase
+         events = [(0, EventSource.A_CAMS_SYSTEM, "worked_once", EventType.PERIODIC)]
+
+         # Phase changes of the fault episode.
+         if(met == nextPhase):
+            if(ErrorState.GREEN == phase):
+               fault    = rng.choice(self.faults)
+               detected = fault if rng.random() >= P_MISDIAGNOSIS else rng.choice(self.faults)
+               events += [
+                  (1, EventSource.A_CAMS_SYSTEM, EventDesc.INJECTED + ": " + fault, EventType.PERIODIC),
+                  (1, EventSource.A_CAMS_SYSTEM, EventDesc.PHASE_CHANGE, EventType.PERIODIC, ErrorState.GREEN_ERROR),
+                  (2, EventSource.A_CAMS_SYSTEM, EventDesc.PHASE_CHANGE, EventType.PERIODIC, ErrorState.RED),
+                  (40, EventSource.AFIRA, fault + ":" + detected, EventType.PERIODIC),
+                  (40, EventSource.DETECTOR, fault, EventType.PERIODIC)
+                  ]
+               phase     = ErrorState.RED
+               nextPhase = met + rng.randint(*RED_DURATION)
+            elif(ErrorState.RED == phase):
+               events.append((1, EventSource.A_CAMS_SYSTEM, EventDesc.PHASE_CHANGE, EventType.PERIODIC, ErrorState.RED_REPAIR))
+               if(rng.random() < P_WRONG_REPAIR):
+                  wrong = rng.choice([name for name in self.faults if name != fault])
+                  events.append((2, EventSource.A_CAMS_SYSTEM, EventDesc.REPAIR + ": " + wrong, EventType.PERIODIC))
+                  schedule.append((met + rng.randint(5, 20), EventDesc.REPAIR + ": " + fault))
+               else:
+                  events.append((2, EventSource.A_CAMS_SYSTEM, EventDesc.REPAIR + ": " + fault, EventType.PERIODIC))
+               phase     = ErrorState.RED_REPAIR
+               nextPhase = met + rng.randint(*REPAIR_DURATION)
+            elif(ErrorState.RED_REPAIR == phase):
+               events += [
+                  (1, EventSource.A_CAMS_SYSTEM, EventDesc.PHASE_CHANGE, EventType.PERIODIC, ErrorState.RED_NO_ERROR),
+                  (1, EventSource.A_CAMS_SYSTEM, "repair task finished", EventType.PERIODIC)
+                  ]
+               phase     = ErrorState.RED_NO_ERROR
+               nextPhase = met + NO_ERROR_DELAY
+            else:
+               events.append((1, EventSource.A_CAMS_SYSTEM, EventDesc.PHASE_CHANGE, EventType.PERIODIC, ErrorState.GREEN))
+               phase     = ErrorState.GREEN
+               fault     = None
+               nextPhase = met + rng.randint(*GREEN_DURATION)
+
+         # Delayed repair orders.
+         for entry in [entry for entry in schedule if entry[0] == met]:
+            events.append((3, EventSource.A_CAMS_SYSTEM, entry[1], EventType.PERIODIC))
+            schedule.remove(entry)
+
+         events += self.__second(phase, fault)
+
+         # Phase changes carry the new phase, later rows keep it.
+         for event in sorted(events, key=lambda event: event[0]):
+            if(rowId >= numRows):
+               break
+            if(len(event) > 4):
+               rowPhase = event[4]
+            yield self.__formatRow(met, osmet + event[0], sensors, tanks, event[1], event[2], rowPhase, rowId, event[3])
+            rowId += 1
+         met += 1
+
+
+   def write(self, filename, numRows, script="ILTPNVVO.xml"):
+      """
+      Write a synthetic session to disk.
+
+      Params
+      ------
+         filename - Name of the archive to write.
+         numRows  - Number of rows to generate.
+         script   - Script name written in the header.
+      """
+      with open(filename, "w", newline='') as fp:
+         fp.write("# scriptfile: .\\scripts\\experiment\\" + script + "\r\n")
+         lines = []
+         for line in self.rows(numRows):
+            lines.append(line)
+            if(len(lines) >= 10000):
+               fp.write("".join(lines))
+               lines = []
+         fp.write("".join(lines))
@@ -0,0 +1,325 @@
+import os
+import json
+import tempfile
+from .CAMSConstants import *
+from .CAMSParser import *
+from .CAMSCompress import *
+
+# Version of the manifest layout. Increment when the format changes.
+INDEX_VERSION = 1
+
+# Number of bytes read at a time when searching for the last record.
+TAIL_BLOCK = 4096
+
+# Number of bytes read at a time when counting lines.
+COUNT_BLOCK = 1024 * 1024
+
+# Fields stored for each archive in the manifest.
+X_PATH        = "path"
+X_MISSION     = "mission"
+X_SUBJECT     = "subject"
+X_SCRIPT      = "script"
+X_ROWS        = "rows"
+X_FIRST_OSMET = "firstOsmet"
+X_LAST_OSMET  = "lastOsmet"
+X_FIRST_ID    = "firstId"
+X_LAST_ID     = "lastId"
+X_SIZE        = "size"
+X_MTIME       = "mtime"
+
+
+def getArchivePrefix(filename):
+   """
+   Get the machine an archive was written by: the part of the file name
+   before the first '_', e.g. "192.168.7.8" for "192.168.7.8_0004.txt".
+   It names the fragments of a session and the clients of the server.
+   """
+   return os.path.basename(filename).split('_')[0]
+
+
+def readFirstLines(fp):
+   """
+   Read the header of an archive up to its first record.
+
+   Return
+   ------
+      string - First line of the file (the script header).
+      bytes  - First record, None if the archive has no records.
+      int    - Offset of the first record in the file.
+   """
+   header = None
+   while(True):
+      offset = fp.tell()
+      line = fp.readline()
+      if(not line):
+         return header, None, offset
+      if(header is None):
+         header = line.decode('utf-8', 'replace')
+      line = line.strip(b' \r\n')
+      if(line and not line.startswith(COMMENT_CHAR)):
+         return header, line, offset
+
+
+def readLastLine(fp):
+   """
+   Read the last record of an archive by scanning backwards from the end.
+
+   Return
+   ------
+      bytes - Last record, None if the archive has no records.
+      int   - Offset of the start of the last record in the file.
+   """
+   fp.seek(0, os.SEEK_END)
+   end  = fp.tell()
+   tail = b''
+   while(end > 0):
+      start = max(0, end - TAIL_BLOCK)
+      fp.seek(start)
+      tail = fp.read(end - start) + tail
+      end  = start
+
+      # Only lines that are known to be complete are checked.
+      lineEnd = len(tail)
+      while(lineEnd > 0):
+         lineStart = tail.rfind(b'\n', 0, lineEnd) + 1
+         if(0 == lineStart and start > 0):
+            break
+         line = tail[lineStart:lineEnd].strip(b' \r\n')
+         if(line and not line.startswith(COMMENT_CHAR)):
+            return line, start + lineStart
+         lineEnd = lineStart - 1
+   return None, None
+
+
+def countLines(fp, start, end):
+   """
+   Count the line breaks between two offsets of a file without parsing it.
+   """
+   fp.seek(start)
+   count = 0
+   while(start < end):
+      block = fp.read(min(COUNT_BLOCK, end - start))
+      if(not block):
+         break
+      count += block.count(b'\n')
+      start += len(block)
+   return count
+
+
+def scanLines(filename):
+   """
+   Read the header and the first and last records of an archive in one
+   pass over its text. Used for compressed archives, which cannot be
+   read backwards.
+
+   Return
+   ------
+      string - First line of the file (the script header).
+      bytes  - First record, None if the archive has no records.
+      bytes  - Last record, None if the archive has no records.
+      int    - Number of records.
+   """
+   header = None
+   first  = None
+   last   = None
+   rows   = 0
+   for block in readLines(filename):
+      if(header is None):
+         header = block.split(b'\n', 1)[0].decode('utf-8', 'replace')
+      for line in block.split(b'\n'):
+         line = line.strip(b' \r')
+         if(line and not line.startswith(COMMENT_CHAR)):
+            if(first is None):
+               first = line
+            last = line
+            rows += 1
+   return header, first, last, rows
+
+
+def readSummary(filename):
+   """
+   Summarize an archive from its header and its first and last records.
+   Only those records are parsed. The number of rows is the number of 
+   lines between them, AutoCAMS does not write comments or empty lines
+   after the header. Compressed archives are decompressed once, see
+   scanLines().
+
+   Params
+   ------
+      filename - Name of the archive.
+
+   Return
+   ------
+      dict - Manifest entry for the archive.
+   """
+   source = getSourceFile(filename)
+   stat = os.stat(source)
+   rows = 0
+   if(True == isCompressed(filename)):
+      header, first, last, rows = scanLines(filename)
+   else:
+      with open(filename, "rb") as fp:
+         header, first, firstOffset = readFirstLines(fp)
+         if(first is not None):
+            last, lastOffset = readLastLine(fp)
+            rows = countLines(fp, firstOffset, lastOffset) + 1
+
+   parts = os.path.normpath(source).split(os.sep)
+   entry = {
+      X_PATH        : os.path.normpath(filename),
+      X_MISSION     : parts[-3] if len(parts) >= 3 else None,
+      X_SUBJECT     : parts[-2] if len(parts) >= 2 else None,
+      X_SCRIPT      : getScriptName(header) if header is not None else None,
+      X_ROWS        : rows,
+      X_FIRST_OSMET : None,
+      X_LAST_OSMET  : None,
+      X_FIRST_ID    : None,
+      X_LAST_ID     : None,
+      X_SIZE        : stat.st_size,
+      X_MTIME       : stat.st_mtime_ns
+      }
+   if(first is not None):
+      try:
+         records = parseBuffer(first + b'\n' + last)
+      except ValueError:
+         # Malformed record, reported by the validation of the archive.
+         return entry
+      entry[X_FIRST_OSMET] = int(records[I_OSMET][0])
+      entry[X_LAST_OSMET]  = int(records[I_OSMET][-1])
+      entry[X_FIRST_ID]    = int(records[I_ID][0])
+      entry[X_LAST_ID]     = int(records[I_ID][-1])
+   return entry
+
+
+class ArchiveIndex():
+   """
+   Persistent manifest of the archives in the data tree.
+
+   Only the header and the first and last records of each archive are
+   parsed, so the script used for a run and the extent of the session are
+   known without parsing the file. Entries are refreshed incrementally:
+   archives are only read again when their size or modification time
+   change, and entries for files that no longer exist are dropped.
+   """
+
+   def __init__(self, indexFile):
+      """
+      Params
+      ------
+         indexFile - File used to store the manifest.
+      """
+      self.indexFile = indexFile
+      self.entries = {}
+      try:
+         with open(self.indexFile, "r") as fp:
+            data = json.load(fp)
+         if(INDEX_VERSION == data.get("version")):
+            self.entries = data["entries"]
+      except (IOError, ValueError, KeyError):
+         # Missing or corrupt manifest, it is rebuilt by refresh().
+         self.entries = {}
+
+
+   def refresh(self, filenames):
+      """
+      Bring the manifest up to date with a list of archives.
+
+      Params
+      ------
+         filenames - Names of all the archives in the data tree.
+
+      Return
+      ------
+         int - Number of archives that had to be read.
+      """
+      entries = {}
+      updated = 0
+      for filename in filenames:
+         key   = os.path.normpath(filename)
+         entry = self.entries.get(key)
+         stat  = os.stat(getSourceFile(filename))
+         if(entry is None or entry[X_SIZE] != stat.st_size or entry[X_MTIME] != stat.st_mtime_ns):
+            entry = readSummary(filename)
+            updated += 1
+         entries[key] = entry
+
+      changed = (updated > 0 or len(entries) != len(self.entries))
+      self.entries = entries
+      if(True == changed):
+         self.save()
+      return updated
+
+
+   def save(self):
+      """
+      Write the manifest to disk. The file is replaced atomically.
+      """
+      folder = os.path.dirname(os.path.abspath(self.indexFile))
+      os.makedirs(folder, exist_ok=True)
+      fd, tempFile = tempfile.mkstemp(dir=folder)
+      try:
+         with os.fdopen(fd, "w") as fp:
+            json.dump({"version" : INDEX_VERSION, "entries" : self.entries}, fp, indent=1, sort_keys=True)
+         os.replace(tempFile, self.indexFile)
+      except:
+         os.remove(tempFile)
+         raise
+
+
+   def get(self, filename):
+      """
+      Get the manifest entry of an archive (None if it is not indexed).
+      """
+      return self.entries.get(os.path.normpath(filename))
+
+
+   def getScript(self, filename):
+      """
+      Get the script used for an archive without opening it.
+      """
+      entry = self.get(filename)
+      return entry[X_SCRIPT] if entry is not None else None
+
+
+   def find(self, script=None, mission=None, subject=None):
+      """
+      Find the archives matching all the given criteria.
+
+      Params
+      ------
+         script  - Name of the XML script (None for any).
+         mission - Mission folder, e.g. "M5_Logs" (None for any).
+         subject - Subject folder, e.g. "S1" (None for any).
+
+      Return
+      ------
+         list - Manifest entries sorted by path.
+      """
+      if(mission is not None):
+         mission = mission.strip('/\\')
+      if(subject is not None):
+         subject = subject.strip('/\\')
+
+      result = []
+      for key in sorted(self.entries):
+         entry = self.entries[key]
+         if(script is not None and entry[X_SCRIPT] != script):
+            continue
+         if(mission is not None and entry[X_MISSION] != mission):
+            continue
+         if(subject is not None and entry[X_SUBJECT] != subject):
+            continue
+         result.append(entry)
+      return result
+
+
+   def findByScript(self, script):
+      return self.find(script=script)
+
+
+   def findByMission(self, mission):
+      return self.find(mission=mission)
+
+
+   def findBySubject(self, subject):
+      return self.find(subject=subject)
@@ -0,0 +1,154 @@
+import numpy as np
+from .CAMSConstants import *
+
+# Field names for the distribution of the latencies in a group.
+L_COUNT  = 'COUNT'    # Number of latencies
+L_MEAN   = 'MEAN'     # Mean latency
+L_MEDIAN = 'MEDIAN'   # Median latency
+L_P95    = 'P95'      # 95th percentile of the latencies
+
+LATENCY_TYPE_KEYS = [
+   (L_COUNT,  ENTRY_TYPE_LNG),
+   (L_MEAN,   ENTRY_TYPE_DBL),
+   (L_MEDIAN, ENTRY_TYPE_DBL),
+   (L_P95,    ENTRY_TYPE_DBL)
+   ]
+
+# Row used for end events with no start event.
+MISSING_ROW = -1
+
+
+def pairEvents(startRows, endRows, lo=None, fallback=MISSING_ROW):
+   """
+   Pair each end event with the last start event before it, e.g. each
+   connection check response with the icon it answers. All the events
+   are matched with one binary search.
+
+   Params
+   ------
+      startRows - Sorted rows of the start events.
+      endRows   - Sorted rows of the end events.
+      lo        - Optional first row where the start of each end event
+                  may be found (one value per end event).
+      fallback  - Row used for end events with no start event.
+
+   Return
+   ------
+      ndarray - Row of the start event paired with each end event.
+   """
+   startRows = np.asarray(startRows, dtype=np.int64)
+   endRows   = np.asarray(endRows, dtype=np.int64)
+   iStart = np.searchsorted(startRows, endRows, 'left') - 1
+   paired = (iStart >= 0)
+   if(lo is not None):
+      lo = np.broadcast_to(np.asarray(lo, dtype=np.int64), endRows.shape)
+      paired[paired] = (startRows[iStart[paired]] >= lo[paired])
+
+   pairs = np.full(len(endRows), fallback, dtype=np.int64)
+   pairs[paired] = startRows[iStart[paired]]
+   return pairs
+
+
+def getLatencies(times, startRows, endRows):
+   """
+   Get the time from each start event to its end event.
+
+   Params
+   ------
+      times     - Time column of the archive (e.g. I_OSMET).
+      startRows - Start row of each pair (MISSING_ROW if not paired).
+      endRows   - End row of each pair.
+
+   Return
+   ------
+      ndarray - Latency of each pair, MISSING_TIME if not paired.
+   """
+   times     = np.atleast_1d(times)
+   startRows = np.asarray(startRows, dtype=np.int64)
+   endRows   = np.asarray(endRows, dtype=np.int64)
+   paired  = (startRows >= 0)
+   latency = np.full(len(endRows), MISSING_TIME, dtype=np.int64)
+   latency[paired] = times[endRows[paired]] - times[startRows[paired]]
+   return latency
+
+
+def getSortedQuantile(ordered, first, last, quantile):
+   """
+   Get a quantile of every group of sorted values, interpolated linearly
+   as done by numpy.percentile.
+
+   Params
+   ------
+      ordered  - Values sorted by group and value.
+      first    - Position of the first value of each group in ordered.
+      last     - Position of the last value of each group in ordered.
+      quantile - Quantile between 0 and 1, e.g. 0.5 for the median.
+
+   Return
+   ------
+      ndarray - Quantile of each group.
+   """
+   position = first + quantile * (last - first)
+   lower = np.floor(position).astype(np.int64)
+   upper = np.minimum(lower + 1, last)
+   return ordered[lower] + (ordered[upper] - ordered[lower]) * (position - lower)
+
+
+def getGroupStats(values, groups, numGroups):
+   """
+   Get the distribution of the values in each group.
+   The values are sorted once by group and value, so the median and
+   percentiles of every group are read from known positions. Quantiles
+   are interpolated linearly, as done by numpy.percentile.
+
+   Params
+   ------
+      values    - Values to describe.
+      groups    - Group of each value (0 to numGroups - 1).
+      numGroups - Number of groups.
+
+   Return
+   ------
+      ndarray - Structured array with the fields in LATENCY_TYPE_KEYS,
+                one record per group. Groups without values have a
+                count of 0 and MISSING_RATIO for the other fields.
+   """
+   values = np.asarray(values, dtype=np.float64)
+   groups = np.asarray(groups, dtype=np.int64)
+
+   counts = np.bincount(groups, minlength=numGroups)
+   sums   = np.bincount(groups, values, minlength=numGroups)
+   starts = np.cumsum(counts) - counts
+   ordered = values[np.lexsort((values, groups))]
+
+   stats = np.zeros(numGroups, dtype=LATENCY_TYPE_KEYS)
+   stats[L_COUNT] = counts
+   found = (counts > 0)
+   for name, _ in LATENCY_TYPE_KEYS[1:]:
+      stats[name] = MISSING_RATIO
+   stats[L_MEAN][found] = sums[found] / counts[found]
+
+   first = starts[found]
+   last  = first + counts[found] - 1
+   for name, quantile in ((L_MEDIAN, 0.5), (L_P95, 0.95)):
+      stats[name][found] = getSortedQuantile(ordered, first, last, quantile)
+   return stats
+
+
+def getToleranceHits(times, period, tolerance):
+   """
+   Check which events happened close enough to a multiple of a period,
+   e.g. log entries due every full minute with a tolerance of 5 seconds.
+
+   Params
+   ------
+      times     - Time of each event.
+      period    - Period of the task, in the units of times.
+      tolerance - Largest distance allowed to a multiple of the period.
+
+   Return
+   ------
+      ndarray - Boolean mask, True for events inside a window.
+   """
+   offset = np.mod(np.asarray(times), period)
+   return np.minimum(offset, period - offset) <= tolerance
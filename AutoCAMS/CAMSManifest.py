@@ -0,0 +1,175 @@
+import os
+import json
+import hashlib
+import tempfile
+import numpy as np
+from .CAMSConstants import *
+from .CAMSCache import *
+from .CAMSCompress import *
+from .CAMSMetrics import *
+
+# Version of the run manifest. Increment when the metrics change, so
+# every archive is processed again by the next run.
+RUN_VERSION = 2
+
+# Extension of the files holding the results of an archive.
+RESULT_EXT = ".npy"
+
+# Fields stored for each archive in the run manifest.
+R_SIZE    = "size"
+R_MTIME   = "mtime"
+R_HASH    = "hash"
+R_PREFIX  = "prefix"
+R_METRICS = "metrics"
+R_RESULT  = "result"
+
+
+class RunManifest():
+   """
+   Record of the archives processed by previous runs, used to process
+   only new or changed archives. Each entry holds the checksum of the
+   archive, the session it was mapped to in SESSION_SCRIPT, the metrics
+   computed and the file with the resulting episodes. An entry is reused
+   when the archive, its mapping and the metrics are unchanged.
+
+   Entries that are not used or added during a run are dropped by save(),
+   so the manifest follows archives that are removed from the data tree.
+   """
+
+   def __init__(self, manifestFile, resultDir, full=False):
+      """
+      Params
+      ------
+         manifestFile - File used to store the manifest.
+         resultDir    - Directory holding the results of each archive.
+         full         - Ignore the previous runs and process every archive.
+      """
+      self.manifestFile = manifestFile
+      self.resultDir = resultDir
+      self.entries = {}
+      self.used = {}
+      if(True == full):
+         return
+      try:
+         with open(self.manifestFile, "r") as fp:
+            data = json.load(fp)
+         if(RUN_VERSION == data.get("version")):
+            self.entries = data["entries"]
+      except (IOError, ValueError, KeyError):
+         # Missing or corrupt manifest, every archive is processed.
+         self.entries = {}
+
+
+   def getResultFile(self, filename):
+      """
+      Get the file holding the results of an archive.
+      """
+      key = hashlib.sha1(os.path.abspath(filename).encode('utf-8')).hexdigest()
+      return os.path.join(self.resultDir, key + RESULT_EXT)
+
+
+   def __isCurrent(self, filename, entry, prefix, names):
+      if(entry[R_PREFIX] != list(prefix) or entry[R_METRICS] != list(names)):
+         return False
+
+      # Same check as ArchiveCache: the contents are only hashed
+      # when the modification time changed.
+      source = getSourceFile(filename)
+      stat = os.stat(source)
+      if(stat.st_size != entry[R_SIZE]):
+         return False
+      if(stat.st_mtime_ns != entry[R_MTIME]):
+         if(getContentHash(source) != entry[R_HASH]):
+            return False
+         entry[R_MTIME] = stat.st_mtime_ns
+      return True
+
+
+   def getResult(self, filename, prefix, names=None):
+      """
+      Get the results of an archive from a previous run.
+
+      Params
+      ------
+         filename - Name of the archive.
+         prefix   - Session of the archive: missionId, userId, sessionId, hasFault
+         names    - Names of the metrics (None for DEFAULT_METRICS).
+
+      Return
+      ------
+         ndarray - Structured array with the fields in getMetricTypeKeys(names),
+                   None if the archive has to be processed again.
+      """
+      names = DEFAULT_METRICS if names is None else names
+      key   = os.path.normpath(filename)
+      entry = self.entries.get(key)
+      if(entry is None or False == self.__isCurrent(filename, entry, prefix, names)):
+         return None
+
+      try:
+         metrics = np.load(os.path.join(self.resultDir, entry[R_RESULT]))
+      except (IOError, ValueError):
+         return None
+      if(metrics.dtype != np.dtype(getMetricTypeKeys(names))):
+         return None
+      self.used[key] = entry
+      return metrics
+
+
+   def add(self, filename, prefix, metrics, names=None):
+      """
+      Record the results of an archive processed by this run.
+
+      Params
+      ------
+         filename - Name of the archive.
+         prefix   - Session of the archive: missionId, userId, sessionId, hasFault
+         metrics  - Structured array with the fields in getMetricTypeKeys(names).
+         names    - Names of the metrics (None for DEFAULT_METRICS).
+      """
+      names = DEFAULT_METRICS if names is None else names
+      os.makedirs(self.resultDir, exist_ok=True)
+      resultFile = self.getResultFile(filename)
+      fd, tempFile = tempfile.mkstemp(dir=self.resultDir)
+      try:
+         with os.fdopen(fd, "wb") as fp:
+            np.save(fp, np.asarray(metrics))
+         os.replace(tempFile, resultFile)
+      except:
+         os.remove(tempFile)
+         raise
+
+      source = getSourceFile(filename)
+      stat = os.stat(source)
+      self.used[os.path.normpath(filename)] = {
+         R_SIZE    : stat.st_size,
+         R_MTIME   : stat.st_mtime_ns,
+         R_HASH    : getContentHash(source),
+         R_PREFIX  : [int(value) for value in prefix],
+         R_METRICS : list(names),
+         R_RESULT  : os.path.basename(resultFile)
+         }
+
+
+   def save(self):
+      """
+      Write the entries used or added by this run and remove the results
+      of the other archives. The manifest is replaced atomically.
+      """
+      folder = os.path.dirname(os.path.abspath(self.manifestFile))
+      os.makedirs(folder, exist_ok=True)
+      fd, tempFile = tempfile.mkstemp(dir=folder)
+      try:
+         with os.fdopen(fd, "w") as fp:
+            json.dump({"version" : RUN_VERSION, "entries" : self.used}, fp, indent=1, sort_keys=True)
+         os.replace(tempFile, self.manifestFile)
+      except:
+         os.remove(tempFile)
+         raise
+
+      kept = set(entry[R_RESULT] for entry in self.used.values())
+      if(os.path.isdir(self.resultDir)):
+         for entry in os.scandir(self.resultDir):
+            if(entry.name.endswith(RESULT_EXT) and entry.name not in kept):
+               os.remove(entry.path)
+      self.entries = dict(self.used)
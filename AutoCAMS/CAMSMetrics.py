@@ -0,0 +1,654 @@
+import numpy as np
+from .CAMSConstants import *
+from .CAMSEpisodes import *
+
+# Separator used for the text output.
+COMMA = ","
+
+
+class EpisodeContext():
+   """
+   Columns of an archive and the fault episodes found in it, shared by
+   every metric computed in the same pass. The episodes are segmented
+   once, and intermediate results needed by several metrics are only
+   computed by the first one asking for them (see getShared()).
+   """
+
+   def __init__(self, osmet, source, desc, phase, columns=None):
+      """
+      Params
+      ------
+         osmet   - Column I_OSMET of the archive.
+         source  - Column I_EVENT_SOURCE of the archive.
+         desc    - Column I_EVENT_DESC of the archive.
+         phase   - Column I_ERROR_PHASE of the archive.
+         columns - Dictionary with any other column needed by the metrics.
+      """
+      self.osmet   = np.atleast_1d(osmet)
+      self.source  = np.atleast_1d(source)
+      self.desc    = np.atleast_1d(desc)
+      self.phase   = np.atleast_1d(phase)
+      self.columns = columns if columns is not None else {}
+      self.episodes, self.injected, self.detected = findEpisodes(self.source, self.desc, self.phase)
+      self.__shared = {}
+
+
+   def __len__(self):
+      return len(self.episodes)
+
+
+   def getColumn(self, name):
+      """
+      Get a column of the archive passed in columns.
+      """
+      if(name not in self.columns):
+         raise KeyError("Column not available to the metrics: ", name)
+      return np.atleast_1d(self.columns[name])
+
+
+   def getShared(self, key, function):
+      """
+      Get an intermediate result, computing it on first use.
+
+      Params
+      ------
+         key      - Name of the result.
+         function - Function computing the result from the context.
+      """
+      if(key not in self.__shared):
+         self.__shared[key] = function(self)
+      return self.__shared[key]
+
+
+class MetricPlugin():
+   """
+   Metric computed for every fault episode of an archive.
+   """
+
+   def __init__(self, name, fields, function, columns=()):
+      """
+      Params
+      ------
+         name     - Name used to select the metric.
+         fields   - List of tuples (field, type) added to the metrics.
+         function - Function receiving an EpisodeContext and returning a
+                    dictionary with one array (one value per episode)
+                    for each field.
+         columns  - Columns of the archive needed by the metric, besides
+                    I_OSMET, I_EVENT_SOURCE, I_EVENT_DESC and I_ERROR_PHASE.
+      """
+      self.name     = name
+      self.fields   = list(fields)
+      self.function = function
+      self.columns  = list(columns)
+
+
+   def compute(self, context):
+      """
+      Compute the metric for every episode of a context.
+
+      Return
+      ------
+         dict - Values of each field.
+      """
+      values = self.function(context)
+      for field, _ in self.fields:
+         if(field not in values):
+            raise ValueError("Metric " + self.name + " did not compute field: ", field)
+      return values
+
+
+# Metrics available, in output order. Filled by registerMetric().
+METRIC_REGISTRY = {}
+
+
+def registerMetric(name, fields, function, columns=()):
+   """
+   Make a metric available to computeMetrics().
+
+   Params
+   ------
+      See MetricPlugin.
+
+   Return
+   ------
+      MetricPlugin - The metric registered.
+   """
+   if(name in METRIC_REGISTRY):
+      raise ValueError("Metric already registered: ", name)
+   used = set(field for plugin in METRIC_REGISTRY.values() for field, _ in plugin.fields)
+   for field, _ in fields:
+      if(field in used):
+         raise ValueError("Field already computed by another metric: ", field)
+   plugin = MetricPlugin(name, fields, function, columns)
+   METRIC_REGISTRY[name] = plugin
+   return plugin
+
+
+def getMetricPlugins(names=None):
+   """
+   Get the metrics selected for a run, in output order.
+
+   Params
+   ------
+      names - Names of the metrics (None for DEFAULT_METRICS).
+
+   Return
+   ------
+      list - MetricPlugin of each metric.
+   """
+   names = DEFAULT_METRICS if names is None else names
+   for name in names:
+      if(name not in METRIC_REGISTRY):
+         raise ValueError("Unknown metric: ", name)
+   return [plugin for name, plugin in METRIC_REGISTRY.items() if name in names]
+
+
+def getMetricTypeKeys(names=None):
+   """
+   Get the fields computed by the selected metrics.
+   The default metrics give METRIC_TYPE_KEYS.
+   """
+   return [entry for plugin in getMetricPlugins(names) for entry in plugin.fields]
+
+
+def getMetricColumns(names=None):
+   """
+   Get the columns of the archive needed by the selected metrics,
+   besides I_OSMET, I_EVENT_SOURCE, I_EVENT_DESC and I_ERROR_PHASE.
+   """
+   columns = []
+   for plugin in getMetricPlugins(names):
+      columns += [name for name in plugin.columns if name not in columns]
+   return columns
+
+
+def getRequiredColumns(names=None):
+   """
+   Get every column of the archive read by the selected metrics, so
+   archives can be loaded with only those (see Archive).
+
+   Params
+   ------
+      names - Names of the metrics (None for DEFAULT_METRICS).
+
+   Return
+   ------
+      list - Names of the columns.
+   """
+   columns = [I_OSMET, I_EVENT_SOURCE, I_EVENT_DESC, I_ERROR_PHASE]
+   return columns + [name for name in getMetricColumns(names) if name not in columns]
+
+
+def computeMetrics(osmet, source, desc, phase, names=None, columns=None):
+   """
+   Compute the metrics of every fault episode in a single pass.
+   The episodes are found once and every selected metric works on the
+   same EpisodeContext.
+
+   Params
+   ------
+      osmet   - Column I_OSMET of the archive.
+      source  - Column I_EVENT_SOURCE of the archive.
+      desc    - Column I_EVENT_DESC of the archive.
+      phase   - Column I_ERROR_PHASE of the archive.
+      names   - Names of the metrics to compute (None for DEFAULT_METRICS).
+      columns - Dictionary with the columns in getMetricColumns(names).
+
+   Return
+   ------
+      ndarray - Structured array with the fields in getMetricTypeKeys(names),
+                i.e. METRIC_TYPE_KEYS for the default metrics.
+   """
+   context = EpisodeContext(osmet, source, desc, phase, columns)
+   metrics = np.zeros(len(context), dtype=getMetricTypeKeys(names))
+   for plugin in getMetricPlugins(names):
+      for field, values in plugin.compute(context).items():
+         metrics[field] = values
+   return metrics
+
+
+def getTableMetrics(table, names=None):
+   """
+   Compute the metrics of every fault episode of an archive or a session,
+   see computeMetrics().
+
+   Params
+   ------
+      table - Archive or Session with the columns in getRequiredColumns(names).
+      names - Names of the metrics to compute (None for DEFAULT_METRICS).
+
+   Return
+   ------
+      ndarray - Structured array with the fields in getMetricTypeKeys(names).
+   """
+   columns = dict((name, table[name]) for name in getMetricColumns(names))
+   return computeMetrics(table[I_OSMET], table[I_EVENT_SOURCE], table[I_EVENT_DESC], table[I_ERROR_PHASE],
+                         names, columns)
+
+
+def selectFields(metrics, names=None):
+   """
+   Keep the fields of the selected metrics.
+
+   Params
+   ------
+      metrics - Structured array with the fields of the metrics.
+      names   - Names of the metrics to keep (None for DEFAULT_METRICS).
+
+   Return
+   ------
+      ndarray - Structured array with the fields in getMetricTypeKeys(names).
+   """
+   types  = getMetricTypeKeys(names)
+   result = np.empty(len(metrics), dtype=types)
+   for field, _ in types:
+      result[field] = metrics[field]
+   return result
+
+
+def getDeltaTime(osmet, startRows, endRows):
+   """
+   Get the time between two rows of each episode [milliseconds].
+   MISSING_TIME is used when either row was not found.
+   """
+   found = (startRows >= 0) & (endRows >= 0)
+   delta = np.full(len(startRows), MISSING_TIME, dtype=np.int64)
+   delta[found] = osmet[endRows[found]] - osmet[startRows[found]]
+   return delta
+
+
+def getRatio(numerator, denominator):
+   """
+   Divide two counts, using 0.0 when the denominator is 0.
+   """
+   ratio = np.zeros(len(numerator), dtype=np.float64)
+   valid = (denominator > 0)
+   ratio[valid] = numerator[valid].astype(np.float64) / denominator[valid]
+   return ratio
+
+
+def getMetricType(field):
+   """
+   Get the type of a field of METRIC_TYPE_KEYS.
+   """
+   return dict(METRIC_TYPE_KEYS)[field]
+
+
+def getParamsChecked(context):
+   """
+   Get the parameters of interest for AVS-RP and AVS-NP and which of
+   them were verified in each episode (see getParamsVerified()).
+   """
+   params = sorted(PARAMS_RELEVANT.union(*PARAMS_NECESSARY.values()))
+   return params, getParamsVerified(context.source, context.desc, context.episodes, params)
+
+
+def getResponses(context):
+   """
+   Get the connection check responses of the context (see getConnectionResponses()).
+   """
+   return getConnectionResponses(context.osmet, context.source, context.desc, context.episodes)
+
+
+def metricEpisode(context):
+   episodes = context.episodes
+   return {
+      M_FAULT_INDEX  : episodes[E_FAULT_INDEX],
+      M_HAS_FAULT    : [faultInjected != faultDetected for faultInjected, faultDetected in zip(context.injected, context.detected)],
+      M_REPAIR_COUNT : episodes[E_REPAIR_COUNT]
+      }
+
+
+def metricFit(context):
+   # Fault Identification Time (FIT)
+   return {M_FIT : getDeltaTime(context.osmet, context.episodes[E_RED], context.episodes[E_CORRECT_REPAIR])}
+
+
+def metricAvt(context):
+   # Automation Verification Time (AVT)
+   return {M_AVT : getDeltaTime(context.osmet, context.episodes[E_RED], context.episodes[E_FIRST_REPAIR])}
+
+
+def metricAvsRp(context):
+   # Automation Verification Sampling of Relevant Parameters (AVS-RP)
+   params, verified = context.getShared("paramsChecked", getParamsChecked)
+   relevant = np.array([param in PARAMS_RELEVANT for param in params], dtype=bool)
+   return {M_AVS_RP : np.count_nonzero(verified & relevant, axis=1) / float(len(PARAMS_RELEVANT))}
+
+
+def metricAvsNp(context):
+   # Automation Verification Sampling of Necessary Parameters (AVS-NP)
+   params, verified = context.getShared("paramsChecked", getParamsChecked)
+   injected  = context.injected
+   necessary = np.array([[param in PARAMS_NECESSARY.get(faultInjected, ()) for param in params]
+                         for faultInjected in injected], dtype=bool).reshape(len(context), len(params))
+   known = np.array([faultInjected in PARAMS_NECESSARY for faultInjected in injected], dtype=bool)
+   avsNp = np.full(len(context), MISSING_RATIO, dtype=np.float64)
+   avsNp[known] = np.count_nonzero(verified & necessary, axis=1)[known] / \
+                  np.count_nonzero(necessary, axis=1)[known].astype(float)
+   return {M_AVS_NP : avsNp}
+
+
+def metricConCheck(context):
+   # Connection check
+   replyRows, _, delta = context.getShared("responses", getResponses)
+   lo, hi = getFaultWindows(context.episodes)
+   conCheckTotalTime, conCheckCount = sumInRanges(replyRows, delta, lo, hi), countInRanges(replyRows, lo, hi)
+   return {M_CON_CHECK : getRatio(conCheckTotalTime, conCheckCount)}
+
+
+def metricLogging(context):
+   # Logging task
+   logTotal, logMissed = getLoggingTasks(context.source, context.desc, context.episodes)
+   return {M_LOGGING : getRatio(logTotal - logMissed, logTotal)}
+
+
+# Name of the metric with the fault index, automation failure and repair count.
+METRIC_EPISODE = 'EPISODE'
+
+# Built-in metrics, giving the fields in METRIC_TYPE_KEYS.
+registerMetric(METRIC_EPISODE, [(name, getMetricType(name)) for name in (M_FAULT_INDEX, M_HAS_FAULT, M_REPAIR_COUNT)], metricEpisode)
+registerMetric(M_FIT,       [(M_FIT,       getMetricType(M_FIT))],       metricFit)
+registerMetric(M_AVT,       [(M_AVT,       getMetricType(M_AVT))],       metricAvt)
+registerMetric(M_AVS_RP,    [(M_AVS_RP,    getMetricType(M_AVS_RP))],    metricAvsRp)
+registerMetric(M_AVS_NP,    [(M_AVS_NP,    getMetricType(M_AVS_NP))],    metricAvsNp)
+registerMetric(M_CON_CHECK, [(M_CON_CHECK, getMetricType(M_CON_CHECK))], metricConCheck)
+registerMetric(M_LOGGING,   [(M_LOGGING,   getMetricType(M_LOGGING))],   metricLogging)
+
+# Metrics computed when none are selected.
+DEFAULT_METRICS = list(METRIC_REGISTRY.keys())
+
+# Log entries are due every full minute of MET, with a tolerance [seconds].
+LOG_PERIOD    = 60
+LOG_TOLERANCE = 5
+
+
+def metricConCheckStats(context):
+   # Distribution of the connection check response times
+   _, iEpisode, delta = context.getShared("responses", getResponses)
+   stats = getGroupStats(delta, iEpisode, len(context))
+   return {
+      M_CON_CHECK_COUNT  : stats[L_COUNT],
+      M_CON_CHECK_MEDIAN : stats[L_MEDIAN],
+      M_CON_CHECK_P95    : stats[L_P95]
+      }
+
+
+def metricProspective(context):
+   # Prospective memory: CO2 values logged within a full minute +/- LOG_TOLERANCE
+   source = context.source
+   desc   = context.desc
+   lo, hi = getFaultWindows(context.episodes)
+   isEntry = (source == EventSource.LOGGING_TASK) & (desc != EventDesc.LOGGING_MISSED) & (desc != EventDesc.LOGGING_EMPTY)
+   entryRows = np.flatnonzero(isEntry)
+   onTime    = getToleranceHits(context.getColumn(I_MET)[entryRows], LOG_PERIOD, LOG_TOLERANCE)
+   entries   = countInRanges(entryRows, lo, hi)
+   prospective = np.full(len(context), MISSING_RATIO, dtype=np.float64)
+   found = (entries > 0)
+   prospective[found] = countInRanges(entryRows[onTime], lo, hi)[found] / entries[found].astype(float)
+   return {M_PROSPECTIVE : prospective}
+
+
+# Optional metrics, only computed when selected.
+registerMetric("CON_CHECK_STATS", [(M_CON_CHECK_COUNT,  ENTRY_TYPE_LNG),
+                                   (M_CON_CHECK_MEDIAN, ENTRY_TYPE_DBL),
+                                   (M_CON_CHECK_P95,    ENTRY_TYPE_DBL)], metricConCheckStats)
+registerMetric(M_PROSPECTIVE, [(M_PROSPECTIVE, ENTRY_TYPE_DBL)], metricProspective, [I_MET])
+
+
+def formatDecimal(value):
+   """
+   Render a decimal field with three digits, MISSING_TEXT for MISSING_RATIO.
+   """
+   return MISSING_TEXT if np.isnan(value) else "{0:.3f}".format(value)
+
+
+def formatInteger(value):
+   """
+   Render an integer field, MISSING_TEXT for MISSING_TIME.
+   """
+   return MISSING_TEXT if MISSING_TIME == value else str(value)
+
+
+def parseDecimal(text):
+   """
+   Read a decimal field written by formatDecimal().
+   """
+   return MISSING_RATIO if MISSING_TEXT == text.strip() else float(text)
+
+
+def parseInteger(text):
+   """
+   Read an integer field written by formatInteger().
+   """
+   return MISSING_TIME if MISSING_TEXT == text.strip() else int(text)
+
+
+def getTextConverters(dtype):
+   """
+   Get the numpy.loadtxt converters reading the fields of a structured
+   type as written by formatMetrics().
+
+   Params
+   ------
+      dtype - Structured type of the rows, one field per column.
+
+   Return
+   ------
+      dict - Map of column number to converter, for the numeric fields.
+   """
+   dtype = np.dtype(dtype)
+   parsers = {'f' : parseDecimal, 'i' : parseInteger}
+   return dict((column, parsers[dtype[column].kind]) for column in range(len(dtype.names))
+               if dtype[column].kind in parsers)
+
+
+def formatMetrics(metrics, prefix, skipFault=False):
+   """
+   Render metrics as comma separated text, one line per episode.
+   Decimals are written with three digits, all other fields as is.
+   Missing values (MISSING_TIME and MISSING_RATIO) are written as
+   MISSING_TEXT, see getTextConverters() to read them back.
+
+   Params
+   ------
+      metrics   - Structured array with the fields of the metrics
+                  (METRIC_TYPE_KEYS by default).
+      prefix    - Array with missionId, userId, sessionId, hasFault
+      skipFault - Skip episodes where AFIRA misdiagnosed the fault.
+
+   Return
+   ------
+      string - Comma separated metrics.
+   """
+   prefix  = COMMA.join(map(str, prefix))
+   lines   = []
+   formats = None
+   for record in metrics:
+      if(formats is None):
+         formatters = {'f' : formatDecimal, 'i' : formatInteger}
+         formats = [(name, formatters.get(record.dtype.fields[name][0].kind, str)) for name in record.dtype.names]
+      if(True == skipFault and M_HAS_FAULT in record.dtype.names and 1 == record[M_HAS_FAULT]):
+         print("Skipping...")
+         continue
+
+      fields = [prefix] + [toText(record[name]) for name, toText in formats]
+      lines.append(COMMA.join(fields) + "\n")
+   return "".join(lines)
+
+
+def selectMetrics(metrics, skipFault=False):
+   """
+   Select the episodes included in a view of the metrics.
+
+   Params
+   ------
+      metrics   - Structured array with the fields of the metrics.
+      skipFault - Drop episodes where AFIRA misdiagnosed the fault
+                  (needs the field M_HAS_FAULT).
+
+   Return
+   ------
+      ndarray - Selected metrics.
+   """
+   if(True == skipFault and M_HAS_FAULT in metrics.dtype.names):
+      return metrics[metrics[M_HAS_FAULT] == 0]
+   return metrics
+
+
+class EpisodeTracker():
+   """
+   State machine following the fault episodes of a session one row
+   at a time. Only the state of the current episode is kept, so it
+   can be fed from a complete archive or from a stream of rows.
+   An episode ends with each GREEN phase change.
+   """
+
+   def __init__(self):
+      self.faultIndex = 0      # Number of faults diagnosed so far
+      self.firstOsmet = None   # OSMET of the first row of the session
+      self.reset()
+
+
+   def reset(self):
+      """
+      Clear the state of the current episode.
+      """
+      self.redOsmet          = None   # OSMET when fault is introduced
+      self.firstRepairOsmet  = None   # OSMET when first repair order is sent
+      self.correctOsmet      = None   # OSMET when correct repair order is sent
+      self.faultInjected     = None   # Fault injected into the system
+      self.faultDetected     = None   # Fault detected by AFIRA
+      self.repairOrders      = []     # Repair orders sent
+      self.paramsVerified    = set()  # Set of parameters verified
+      self.conCheckTotalTime = 0      # Total time elapsed for connection checks
+      self.conCheckCount     = 0      # Number of connection checks
+      self.conCheckOsmet     = self.firstOsmet   # OSMET of last connection check
+      self.logTotal          = 0      # Number of log entries entered
+      self.logMissed         = 0      # Number of log entries missed
+
+
+   def feed(self, osmet, source, desc, phase):
+      """
+      Process the next row of the session.
+
+      Params
+      ------
+         osmet  - Value of I_OSMET.
+         source - Value of I_EVENT_SOURCE.
+         desc   - Value of I_EVENT_DESC.
+         phase  - Value of I_ERROR_PHASE.
+
+      Return
+      ------
+         tuple - Record with the fields in METRIC_TYPE_KEYS if this row
+                 completed an episode, None otherwise.
+      """
+      if(self.firstOsmet is None):
+         self.firstOsmet    = osmet
+         self.conCheckOsmet = osmet
+
+      # Identify faults inserted
+      if(EventSource.AFIRA in source and ":" in desc):
+         self.faultInjected, self.faultDetected = desc.split(":")
+         self.faultIndex += 1
+
+      # Identify all repair orders sent
+      if(EventDesc.REPAIR in desc):
+         temp = desc.split(" ")[1]
+         if(temp != "task"):
+            self.repairOrders.append(temp)
+
+            # Store time of first repair set
+            if(len(self.repairOrders) == 1):
+               self.firstRepairOsmet = osmet
+
+         # Store time when correct repair was sent.
+         if(self.faultInjected is not None and temp == self.faultInjected):
+            self.correctOsmet = osmet
+
+      isPhaseChange = (EventDesc.PHASE_CHANGE == desc)
+
+      # Find RED (start of fault)
+      if(isPhaseChange and ErrorState.RED == phase):
+         self.redOsmet = osmet
+
+      if(self.redOsmet is not None):
+         # Capture set of all parameters verified while the fault is present.
+         if(source in EventSource.FLOW_MONITOR):
+            self.paramsVerified.add(source)
+         if(source == EventSource.GRAPH_MONITOR):
+            self.paramsVerified.add(desc)
+         if(source == EventSource.POSSIBLE_FLOW):
+            self.paramsVerified.add(EventSource.POSSIBLE_FLOW)
+
+         # Connection checks
+         if(source == EventSource.CONNECTION_CHECK):
+            if(desc == EventDesc.ICON_APPEARS):
+               self.conCheckOsmet = osmet
+            else:
+               self.conCheckTotalTime += (osmet - self.conCheckOsmet)
+               self.conCheckCount += 1
+
+         # Logging tasks
+         if(source == EventSource.LOGGING_TASK):
+            if(desc == EventDesc.LOGGING_MISSED or desc == EventDesc.LOGGING_EMPTY):
+               self.logMissed += 1
+            self.logTotal += 1
+
+      # Find GREEN (finished processing fault -> record entry)
+      if(isPhaseChange and ErrorState.GREEN == phase):
+         record = self.getRecord()
+         self.reset()
+         return record
+      return None
+
+
+   def getRecord(self):
+      """
+      Get the metrics of the current episode.
+
+      Return
+      ------
+         tuple - Record with the fields in METRIC_TYPE_KEYS.
+      """
+      # Has fault?
+      hasFault = 0 if (self.faultInjected == self.faultDetected) else 1
+
+      # Fault Identification Time (FIT)
+      if(self.redOsmet is not None and self.correctOsmet is not None):
+         fit = self.correctOsmet - self.redOsmet
+      else:
+         fit = MISSING_TIME
+
+      # Automation Verification Time (AVT)
+      if(self.redOsmet is not None and self.firstRepairOsmet is not None):
+         avt = self.firstRepairOsmet - self.redOsmet
+      else:
+         avt = MISSING_TIME
+
+      # Automation Verification Sampling of Relevant Parameters (AVS-RP)
+      limitSet = self.paramsVerified.intersection(PARAMS_RELEVANT)
+      avsRp = float(len(limitSet)) / len(PARAMS_RELEVANT)
+
+      # Automation Verification Sampling of Necessary Parameters (AVS-NP)
+      if(self.faultInjected in PARAMS_NECESSARY):
+         limitSet = self.paramsVerified.intersection(PARAMS_NECESSARY[self.faultInjected])
+         avsNp = float(len(limitSet)) / len(PARAMS_NECESSARY[self.faultInjected])
+      else:
+         avsNp = MISSING_RATIO
+
+      # Connection check
+      if(self.conCheckCount > 0):
+         conCheck = float(self.conCheckTotalTime) / self.conCheckCount
+      else:
+         conCheck = 0.0
+
+      # Logging task
+      if(self.logTotal > 0):
+         logging = float(self.logTotal - self.logMissed) / self.logTotal
+      else:
+         logging = 0.0
+
+      return (self.faultIndex, hasFault, len(self.repairOrders), fit, avt, avsRp, avsNp, conCheck, logging)
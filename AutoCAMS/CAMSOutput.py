@@ -0,0 +1,255 @@
+import os
+import numpy as np
+from .CAMSConstants import *
+from .CAMSMetrics import *
+
+# Parquet output is only available when pyarrow is installed.
+try:
+   import pyarrow
+   import pyarrow.parquet
+except ImportError:
+   pyarrow = None
+
+# Amount of text buffered before it is written to disk [bytes].
+BUFFER_BYTES = 4 * 1024 * 1024
+
+# Names of the output files.
+TEXT_FILE    = "output.txt"
+SESSION_FILE = "output_session_%d.txt"
+NPY_FILE     = "output.npy"
+PARQUET_FILE = "output.parquet"
+TARGET_FILE  = "output_target.txt"
+
+
+def getOutputRecords(prefix, metrics):
+   """
+   Combine the metrics of an archive with the session they belong to.
+
+   Params
+   ------
+      prefix  - Array with missionId, userId, sessionId, hasFault
+      metrics - Structured array with the fields of the metrics
+                (METRIC_TYPE_KEYS by default).
+
+   Return
+   ------
+      ndarray - Structured array with the fields in OUTPUT_TYPE_KEYS,
+                or the session fields followed by those of the metrics.
+   """
+   sessionKeys = OUTPUT_TYPE_KEYS[:len(OUTPUT_TYPE_KEYS) - len(METRIC_TYPE_KEYS)]
+   records = np.empty(len(metrics), dtype=sessionKeys + metrics.dtype.descr)
+   for (name, _), value in zip(sessionKeys, prefix):
+      records[name] = value
+   for name in metrics.dtype.names:
+      records[name] = metrics[name]
+   return records
+
+
+class TextWriter():
+   """
+   Writer of the legacy comma separated files: one file with every episode
+   and one file per session without the episodes where AFIRA misdiagnosed
+   the fault. Text is buffered and appended in large blocks, so no file is
+   kept open between writes.
+   """
+
+   def __init__(self, directory, numSessions, bufferBytes=BUFFER_BYTES):
+      """
+      Params
+      ------
+         directory   - Folder the files are written to.
+         numSessions - Number of session files.
+         bufferBytes - Amount of text buffered before writing.
+      """
+      self.bufferBytes  = bufferBytes
+      self.bytesWritten = 0
+      self.files   = [os.path.join(directory, TEXT_FILE)]
+      self.files  += [os.path.join(directory, SESSION_FILE % i) for i in range(numSessions)]
+      self.buffers = [[] for _ in self.files]
+      self.buffered = 0
+
+      # Start with empty files, as a run always replaces the previous output.
+      for filename in self.files:
+         open(filename, "w").close()
+
+
+   def add(self, prefix, metrics):
+      """
+      Add the metrics of an archive.
+
+      Params
+      ------
+         prefix  - Array with missionId, userId, sessionId, hasFault
+         metrics - Structured array with the fields in METRIC_TYPE_KEYS.
+      """
+      text = formatMetrics(metrics, prefix)
+      sessionText = formatMetrics(selectMetrics(metrics, True), prefix[:2])
+      self.buffers[0].append(text)
+      self.buffers[prefix[2]].append(sessionText)
+      self.buffered += len(text) + len(sessionText)
+      if(self.buffered >= self.bufferBytes):
+         self.flush()
+
+
+   def flush(self):
+      """
+      Append the buffered text to the files.
+      """
+      for filename, buffer in zip(self.files, self.buffers):
+         if(buffer):
+            text = "".join(buffer)
+            with open(filename, "a") as fp:
+               fp.write(text)
+            self.bytesWritten += len(text)
+            del buffer[:]
+      self.buffered = 0
+
+
+   def close(self):
+      self.flush()
+
+
+class NpyWriter():
+   """
+   Writer of a single record array with the fields in OUTPUT_TYPE_KEYS.
+   The file can be memory-mapped by loadOutput() instead of parsed.
+   """
+
+   def __init__(self, directory):
+      """
+      Params
+      ------
+         directory - Folder the file is written to.
+      """
+      self.filename = os.path.join(directory, NPY_FILE)
+      self.records  = []
+      self.bytesWritten = 0
+
+
+   def add(self, prefix, metrics):
+      self.records.append(getOutputRecords(prefix, metrics))
+
+
+   def getRecords(self):
+      """
+      Get every record added so far as a single array.
+      """
+      if(0 == len(self.records)):
+         return np.empty(0, dtype=OUTPUT_TYPE_KEYS)
+      return np.concatenate(self.records)
+
+
+   def close(self):
+      records = self.getRecords()
+      np.save(self.filename, records)
+      self.bytesWritten += records.nbytes
+
+
+class ParquetWriter(NpyWriter):
+   """
+   Writer of a single Parquet table with the columns in OUTPUT_TYPE_KEYS.
+   """
+
+   def __init__(self, directory):
+      if(pyarrow is None):
+         raise ImportError("Parquet output requires the pyarrow package.")
+      NpyWriter.__init__(self, directory)
+      self.filename = os.path.join(directory, PARQUET_FILE)
+
+
+   def close(self):
+      records = self.getRecords()
+      table = pyarrow.table(dict((name, records[name]) for name in records.dtype.names))
+      pyarrow.parquet.write_table(table, self.filename)
+      self.bytesWritten += os.path.getsize(self.filename)
+
+
+class OutputSet():
+   """
+   Group of writers receiving the same metrics.
+   """
+
+   def __init__(self, formats, directory, numSessions):
+      """
+      Params
+      ------
+         formats     - List of OutputFormat values.
+         directory   - Folder the files are written to.
+         numSessions - Number of sessions, for the text output.
+      """
+      self.writers = []
+      for outputFormat in formats:
+         if(OutputFormat.TEXT == outputFormat):
+            self.writers.append(TextWriter(directory, numSessions))
+         elif(OutputFormat.NPY == outputFormat):
+            self.writers.append(NpyWriter(directory))
+         elif(OutputFormat.PARQUET == outputFormat):
+            self.writers.append(ParquetWriter(directory))
+         else:
+            raise ValueError("Unknown output format: ", outputFormat)
+
+
+   def add(self, prefix, metrics):
+      for writer in self.writers:
+         writer.add(prefix, metrics)
+
+
+   def close(self):
+      for writer in self.writers:
+         writer.close()
+
+
+   def getBytesWritten(self):
+      return sum(writer.bytesWritten for writer in self.writers)
+
+
+def loadOutput(filename, session=None, skipFault=False):
+   """
+   Load the records written by NpyWriter without copying them.
+
+   Params
+   ------
+      filename  - Name of the .npy file.
+      session   - Only keep the rows of this session (1 to NUM_SESSIONS).
+      skipFault - Drop episodes where AFIRA misdiagnosed the fault, as in
+                  the session text files.
+
+   Return
+   ------
+      ndarray - Read-only structured array with the fields in OUTPUT_TYPE_KEYS.
+   """
+   try:
+      records = np.load(filename, mmap_mode='r')
+   except ValueError:
+      # Empty arrays cannot be memory-mapped.
+      records = np.load(filename)
+   if(session is not None):
+      records = records[records[O_SESSION] == session]
+   if(True == skipFault):
+      records = records[records[M_HAS_FAULT] == 0]
+   return records
+
+
+def loadTextOutput(filename, names=None, skipFault=False):
+   """
+   Load the records written by TextWriter. Fields written as MISSING_TEXT
+   are read as MISSING_TIME or MISSING_RATIO.
+
+   Params
+   ------
+      filename  - Name of the text file, e.g. TEXT_FILE.
+      names     - Names of the metrics written (None for DEFAULT_METRICS).
+      skipFault - Drop episodes where AFIRA misdiagnosed the fault.
+
+   Return
+   ------
+      ndarray - Structured array with the session fields of OUTPUT_TYPE_KEYS
+                followed by the fields in getMetricTypeKeys(names).
+   """
+   sessionKeys = OUTPUT_TYPE_KEYS[:len(OUTPUT_TYPE_KEYS) - len(METRIC_TYPE_KEYS)]
+   dtype   = np.dtype(sessionKeys + getMetricTypeKeys(names))
+   records = np.loadtxt(filename, delimiter=COMMA, dtype=dtype, converters=getTextConverters(dtype),
+                        encoding="utf-8", ndmin=1)
+   if(True == skipFault):
+      records = records[records[M_HAS_FAULT] == 0]
+   return records
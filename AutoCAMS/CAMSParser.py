@@ -0,0 +1,306 @@
+import re
+import numpy as np
+from .CAMSConstants import *
+from .CAMSCategorical import *
+from .CAMSCompress import *
+
+# Constants used in parsing the file.
+DELIM_CHAR   = b';'
+COMMENT_CHAR = b'#'
+NUM_FIELDS   = len(TYPE_KEYS)
+
+# Regular expressions applied to the whole buffer at once.
+# Comments run from the comment character to the end of the line,
+# and blank lines (including lines left empty by a comment) are
+# collapsed together with any spaces or carriage returns around them.
+# The newline expression is only used when the cheaper checks fail.
+COMMENT_RE = re.compile(re.escape(COMMENT_CHAR) + rb'[^\n]*')
+NEWLINE_RE = re.compile(rb'[ \r]*\n[ \r\n]*')
+
+
+def readBuffer(filename):
+   """
+   Read the whole archive into memory as a single bytes buffer.
+   Compressed archives are decompressed first.
+
+   Params
+   ------
+      filename - Name of the archive to read.
+
+   Return
+   ------
+      bytes - Raw contents of the file.
+   """
+   if(True == isCompressed(filename)):
+      return b''.join(readBlocks(filename))
+   with open(filename, "rb") as fp:
+      return fp.read()
+
+
+def getScriptName(line):
+   """
+   Extract the script name from the first line of an archive.
+
+   Params
+   ------
+      line - Header line, e.g. "# scriptfile: C:\\path\\SCRIPT.xml".
+
+   Return
+   ------
+      string - XML script name used for the run.
+   """
+   scriptPath = line.strip().split(':')[-1]
+   scriptName = scriptPath.split('\\')[-1]
+   return scriptName.strip()
+
+
+def getProjection(names=None):
+   """
+   Get the fields of an archive restricted to a set of columns.
+   The fields keep the order of TYPE_KEYS.
+
+   Params
+   ------
+      names - Names of the columns to keep (None for all).
+
+   Return
+   ------
+      list - Tuples (name, type) from TYPE_KEYS.
+   """
+   if(names is None):
+      return TYPE_KEYS
+   if(0 == len(names)):
+      raise ValueError("At least one archive column is needed.")
+   known = set(name for name, _ in TYPE_KEYS)
+   for name in names:
+      if(name not in known):
+         raise ValueError("Unknown archive column: ", name)
+   return [(name, kind) for name, kind in TYPE_KEYS if name in names]
+
+
+def selectColumns(array, names):
+   """
+   Copy a set of columns of an archive into a new structured array.
+
+   Params
+   ------
+      array - Structured array with the fields in TYPE_KEYS.
+      names - Names of the columns to keep.
+
+   Return
+   ------
+      ndarray - Structured array with the fields in getProjection(names).
+   """
+   result = np.empty(array.shape, dtype=getProjection(names))
+   for name in result.dtype.names:
+      result[name] = array[name]
+   return result
+
+
+def splitFields(buffer, max_rows=None):
+   """
+   Split a raw buffer into its individual fields.
+   Comments, carriage returns and empty lines are discarded in bulk
+   so that the remaining text can be split on the delimiter in one go.
+
+   Params
+   ------
+      buffer   - Raw contents of an archive.
+      max_rows - Maximum number of rows to keep (None for all).
+
+   Return
+   ------
+      int  - Number of rows found.
+      list - Flat list of byte fields, NUM_FIELDS per row.
+   """
+   if(max_rows is not None and max_rows < 1):
+      raise ValueError("'max_rows' must be at least 1.")
+
+   if(b'\r\n' in buffer):
+      buffer = buffer.replace(b'\r\n', b'\n')
+
+   # Header comments are dropped directly, any others need the expression.
+   while(buffer.startswith(COMMENT_CHAR)):
+      buffer = buffer[buffer.find(b'\n') + 1:] if b'\n' in buffer else b''
+   if(COMMENT_CHAR in buffer):
+      buffer = COMMENT_RE.sub(b'', buffer)
+   buffer = buffer.strip(b' \r\n')
+   if(b'\n\n' in buffer or b' \n' in buffer or b'\n ' in buffer or b'\r' in buffer):
+      buffer = NEWLINE_RE.sub(b'\n', buffer)
+   if(0 == len(buffer)):
+      return 0, []
+
+   # Trim the buffer to the requested number of rows.
+   if(max_rows is not None):
+      lines = buffer.split(b'\n', max_rows)
+      buffer = b'\n'.join(lines[:max_rows])
+
+   numRows = buffer.count(b'\n') + 1
+   fields  = buffer.replace(b'\n', DELIM_CHAR).split(DELIM_CHAR)
+
+   # Any mismatch means at least one line has the wrong number of columns.
+   if(len(fields) != numRows * NUM_FIELDS):
+      for i, line in enumerate(buffer.split(b'\n')):
+         count = line.count(DELIM_CHAR) + 1
+         if(count != NUM_FIELDS):
+            raise ValueError("Line #%d (got %d columns instead of %d)" % (i + 1, count, NUM_FIELDS))
+   return numRows, fields
+
+
+def toNumeric(columns, dtype):
+   """
+   Convert a group of numeric columns in a single vectorized step.
+   Decimal commas (European notation) are replaced by decimal points
+   before the values are parsed.
+
+   Params
+   ------
+      columns - List of columns, each a list of byte fields.
+      dtype   - Numpy type used to parse the values.
+
+   Return
+   ------
+      ndarray - 2D array with one row per column.
+   """
+   numRows = len(columns[0])
+   text = DELIM_CHAR.join([DELIM_CHAR.join(col) for col in columns])
+   if(b',' in text):
+      text = text.replace(b',', b'.')
+   values = np.fromstring(text, dtype=dtype, sep=DELIM_CHAR.decode())
+   if(values.size != numRows * len(columns)):
+      raise ValueError("Invalid numeric value found in archive.")
+   return values.reshape(len(columns), numRows)
+
+
+def toCategorical(column, vocabulary):
+   """
+   Encode a column of byte fields into codes of a vocabulary.
+   Only the unique values are decoded and looked up.
+
+   Params
+   ------
+      column     - List of byte fields.
+      vocabulary - Vocabulary used to encode the values.
+
+   Return
+   ------
+      ndarray - Array of codes.
+   """
+   if(0 == len(column)):
+      return np.empty(0, dtype=ENTRY_TYPE_CAT)
+   unique, inverse = np.unique(np.array(column), return_inverse=True)
+   return vocabulary.encodeUnique([value.decode('utf-8') for value in unique], inverse)
+
+
+def toStrings(column):
+   """
+   Decode a column of byte fields into Python strings.
+   Only the unique values are decoded, and rows holding the same
+   value share the same string object.
+
+   Params
+   ------
+      column - List of byte fields.
+
+   Return
+   ------
+      ndarray - Object array of strings.
+   """
+   if(0 == len(column)):
+      return np.empty(0, dtype=object)
+   unique, inverse = np.unique(np.array(column), return_inverse=True)
+   decoded = np.array([value.decode('utf-8') for value in unique], dtype=object)
+   return decoded[inverse.reshape(-1)]
+
+
+def parseBuffer(buffer, max_rows=None, names=None):
+   """
+   Parse the contents of an archive into a structured array
+   with the fields and types defined in TYPE_KEYS.
+
+   Params
+   ------
+      buffer   - Raw contents of an archive.
+      max_rows - Maximum number of rows to read (None for all).
+      names    - Columns to convert (None for all). The other columns 
+                 are split but left out of the result.
+
+   Return
+   ------
+      ndarray - Structured array with one entry per row and the 
+                fields in getProjection(names).
+   """
+   types = getProjection(names)
+   numRows, fields = splitFields(buffer, max_rows)
+   array = np.empty(numRows, dtype=types)
+   if(0 == numRows):
+      return array
+
+   # Group the fields by parsing rule.
+   selected = set(name for name, _ in types)
+   columns  = dict((name, fields[i::NUM_FIELDS]) for i, (name, _) in enumerate(TYPE_KEYS) if name in selected)
+   del fields   # Frees the fields of the columns left out.
+
+   catKeys = [name for name, _ in types if name in VOCABULARY]
+   intKeys = [name for name, kind in types if kind in (ENTRY_TYPE_INT, ENTRY_TYPE_LNG) and name not in catKeys]
+   dblKeys = [name for name, kind in types if kind in (ENTRY_TYPE_FLT, ENTRY_TYPE_DBL) and name not in catKeys]
+   strKeys = [name for name, kind in types if kind in (ENTRY_TYPE_STR, ENTRY_TYPE_OBJ) and name not in catKeys]
+
+   # Integers are parsed as 64-bit values and then narrowed to the field type.
+   if(intKeys):
+      values = toNumeric([columns[name] for name in intKeys], np.int64)
+      for i, name in enumerate(intKeys):
+         array[name] = values[i]
+
+   # Floats are parsed as doubles first so that rounding
+   # matches a float() cast followed by the field type.
+   if(dblKeys):
+      values = toNumeric([columns[name] for name in dblKeys], np.float64)
+      for i, name in enumerate(dblKeys):
+         array[name] = values[i]
+
+   for name in catKeys:
+      array[name] = toCategorical(columns[name], VOCABULARY[name])
+
+   for name in strKeys:
+      array[name] = toStrings(columns[name])
+
+   return array
+
+
+def parseBlocks(blocks, max_rows=None, names=None):
+   """
+   Parse an archive received in blocks of complete lines, e.g. from
+   readLines(). Each block is parsed as soon as it is available, so
+   reading or decompressing the next block overlaps with parsing.
+
+   Params
+   ------
+      blocks   - Iterable of blocks of complete lines.
+      max_rows - Maximum number of rows to read (None for all).
+      names    - Columns to convert (None for all).
+
+   Return
+   ------
+      ndarray - Structured array with one entry per row and the 
+                fields in getProjection(names), as parseBuffer().
+   """
+   if(max_rows is not None and max_rows < 1):
+      raise ValueError("'max_rows' must be at least 1.")
+
+   parts   = []
+   numRows = 0
+   for block in blocks:
+      part = parseBuffer(block, None if max_rows is None else max_rows - numRows, names)
+      if(0 == part.size):
+         continue
+      parts.append(part)
+      numRows += part.size
+      if(max_rows is not None and numRows >= max_rows):
+         break
+
+   if(0 == len(parts)):
+      return np.empty(0, dtype=getProjection(names))
+   if(1 == len(parts)):
+      return parts[0]
+   return np.concatenate(parts)
@@ -0,0 +1,312 @@
+import json
+import time
+
+# Names of the timers recorded by the package [seconds].
+T_FILE    = "file"              # Wall time of each archive processed
+T_LOAD    = "archive.load"      # Archive construction, including the cache
+T_READ    = "archive.read"      # Reading the file from disk
+T_PARSE   = "archive.parse"     # Converting the text into columns
+T_LAZY    = "archive.lazy"      # Loading columns left out of the projection
+T_SCRIPT  = "archive.script"    # Reading the script name from the header
+T_METRICS = "archive.metrics"   # Extracting the metrics of the episodes
+T_TARGET  = "archive.target"    # Time out of target of the cabin sensors
+T_MERGE   = "session.merge"     # Merging the fragments of a session
+T_WRITE   = "output.write"      # Writing and flushing the output files
+
+# Names of the counters recorded by the package.
+C_ROWS       = "rows.parsed"       # Rows converted from text
+C_CONVERTER  = "converter.calls"   # Calls to the genfromtxt converter functions
+C_EPISODES   = "episodes"          # Fault episodes found
+C_READ       = "bytes.read"        # Bytes read from the archives
+C_WRITTEN    = "bytes.written"     # Bytes written to the output files
+C_CACHE_HIT  = "cache.hits"        # Archives loaded from the cache
+C_CACHE_MISS = "cache.misses"      # Archives parsed and stored in the cache
+C_LAZY       = "columns.lazy"      # Columns loaded on first access
+C_DUPLICATE  = "rows.duplicate"    # Rows repeated at the seams of fragments
+
+
+class NullTimer():
+   """
+   Timer used while profiling is disabled. It does nothing.
+   """
+
+   def __enter__(self):
+      return self
+
+
+   def __exit__(self, *args):
+      return False
+
+
+# Shared instance, so disabled timers do not allocate anything.
+NULL_TIMER = NullTimer()
+
+
+class Timer():
+   """
+   Context manager adding the time spent in a block to a named timer.
+   """
+
+   def __init__(self, profiler, name):
+      self.profiler = profiler
+      self.name     = name
+      self.start    = None
+
+
+   def __enter__(self):
+      self.start = time.perf_counter()
+      return self
+
+
+   def __exit__(self, *args):
+      self.profiler.addTime(self.name, time.perf_counter() - self.start)
+      return False
+
+
+class FileScope():
+   """
+   Context manager attributing everything recorded in a block to a file.
+   The wall time of the block is added to the T_FILE timer if requested.
+   """
+
+   def __init__(self, profiler, filename, wall=True):
+      self.profiler = profiler
+      self.filename = filename
+      self.previous = None
+      self.timer    = Timer(profiler, T_FILE) if wall else NULL_TIMER
+
+
+   def __enter__(self):
+      self.previous = self.profiler.current
+      self.profiler.current = self.profiler.getFile(self.filename)
+      self.timer.__enter__()
+      return self
+
+
+   def __exit__(self, *args):
+      self.timer.__exit__(*args)
+      self.profiler.current = self.previous
+      return False
+
+
+def newSection():
+   """
+   Get an empty set of timers and counters.
+   """
+   return {"timers" : {}, "counters" : {}}
+
+
+class Profiler():
+   """
+   Opt-in collection of named timers and counters.
+
+   Everything recorded is added to the totals of the run and, inside a
+   file() block, to the totals of that file. While disabled, timer() and
+   file() return a shared no-op context and count() returns at once, so
+   the instrumentation costs one attribute check per call.
+   """
+
+   def __init__(self, enabled=False):
+      """
+      Params
+      ------
+         enabled - Start recording immediately.
+      """
+      self.enabled = enabled
+      self.current = None
+      self.clear()
+
+
+   def clear(self):
+      """
+      Discard everything recorded so far.
+      """
+      self.run     = newSection()
+      self.files   = {}
+      self.current = None
+
+
+   def timer(self, name):
+      """
+      Get a context manager measuring the time spent in a block.
+
+      Params
+      ------
+         name - Name of the timer (e.g. T_PARSE).
+      """
+      if(False == self.enabled):
+         return NULL_TIMER
+      return Timer(self, name)
+
+
+   def file(self, filename, wall=True):
+      """
+      Get a context manager attributing a block to an archive.
+
+      Params
+      ------
+         filename - Name of the archive being processed.
+         wall     - Add the time spent in the block to the T_FILE timer.
+      """
+      if(False == self.enabled):
+         return NULL_TIMER
+      return FileScope(self, filename, wall)
+
+
+   def count(self, name, value=1):
+      """
+      Add a value to a counter.
+
+      Params
+      ------
+         name  - Name of the counter (e.g. C_ROWS).
+         value - Amount to add.
+      """
+      if(False == self.enabled):
+         return
+      for section in self.__sections():
+         section["counters"][name] = section["counters"].get(name, 0) + value
+
+
+   def counted(self, name, function):
+      """
+      Wrap a function so each call increments a counter.
+      The function is returned unchanged while disabled.
+      """
+      if(False == self.enabled):
+         return function
+      def wrapper(*args):
+         self.count(name)
+         return function(*args)
+      return wrapper
+
+
+   def addTime(self, name, seconds):
+      """
+      Add a measurement to a timer.
+      """
+      for section in self.__sections():
+         calls, total = section["timers"].get(name, (0, 0.0))
+         section["timers"][name] = (calls + 1, total + seconds)
+
+
+   def getFile(self, filename):
+      """
+      Get the section of a file, creating it if needed.
+      """
+      if(filename not in self.files):
+         self.files[filename] = newSection()
+      return self.files[filename]
+
+
+   def __sections(self):
+      if(self.current is None):
+         return (self.run,)
+      return (self.run, self.current)
+
+
+   def collect(self):
+      """
+      Get everything recorded so far and start again.
+      Used to send the results of a worker process to the main process.
+
+      Return
+      ------
+         dict - Report as returned by getReport(), None while disabled.
+      """
+      if(False == self.enabled):
+         return None
+      report = self.getReport()
+      self.clear()
+      return report
+
+
+   def merge(self, report):
+      """
+      Add a report (see collect()) to the results of this profiler.
+      """
+      if(report is None):
+         return
+      sections = [(self.run, report["run"])]
+      sections += [(self.getFile(name), section) for name, section in report["files"].items()]
+      for target, source in sections:
+         for name, (calls, total) in source["timers"].items():
+            oldCalls, oldTotal = target["timers"].get(name, (0, 0.0))
+            target["timers"][name] = (oldCalls + calls, oldTotal + total)
+         for name, value in source["counters"].items():
+            target["counters"][name] = target["counters"].get(name, 0) + value
+
+
+   def getReport(self):
+      """
+      Get the results recorded.
+
+      Return
+      ------
+         dict - {"run" : section, "files" : {filename : section}}, where
+                each section holds "timers" as name : (calls, seconds)
+                and "counters" as name : value.
+      """
+      copy = lambda section: {"timers"   : dict(section["timers"]),
+                              "counters" : dict(section["counters"])}
+      return {"run"   : copy(self.run),
+              "files" : dict((name, copy(section)) for name, section in self.files.items())}
+
+
+   def formatTable(self):
+      """
+      Get a summary of the results as a text table.
+
+      Return
+      ------
+         string - Timers and counters of the run, then one line per file.
+      """
+      lines = ["%-20s %8s %12s %12s" % ("Timer", "Calls", "Total [s]", "Mean [ms]")]
+      for name, (calls, total) in sorted(self.run["timers"].items()):
+         lines.append("%-20s %8d %12.4f %12.3f" % (name, calls, total, 1000.0 * total / calls))
+      lines.append("")
+      lines.append("%-20s %14s" % ("Counter", "Value"))
+      for name, value in sorted(self.run["counters"].items()):
+         lines.append("%-20s %14d" % (name, value))
+
+      if(self.files):
+         lines.append("")
+         lines.append("%-50s %10s %10s %9s %12s" % ("File", "Wall [s]", C_ROWS, C_EPISODES, C_READ))
+         for name, section in sorted(self.files.items()):
+            wall = section["timers"].get(T_FILE, (0, 0.0))[1]
+            counters = section["counters"]
+            lines.append("%-50s %10.4f %10d %9d %12d" % (name[-50:], wall, counters.get(C_ROWS, 0),
+                                                         counters.get(C_EPISODES, 0), counters.get(C_READ, 0)))
+      return "\n".join(lines) + "\n"
+
+
+   def writeJson(self, filename):
+      """
+      Export the results as JSON.
+
+      Params
+      ------
+         filename - Name of the file to write.
+      """
+      report = self.getReport()
+      toJson = lambda section: {
+         "timers"   : dict((name, {"calls" : calls, "seconds" : total})
+                           for name, (calls, total) in section["timers"].items()),
+         "counters" : section["counters"]
+         }
+      data = {"run"   : toJson(report["run"]),
+              "files" : dict((name, toJson(section)) for name, section in report["files"].items())}
+      with open(filename, "w") as fp:
+         json.dump(data, fp, indent=1, sort_keys=True)
+
+
+# Profiler shared by the whole package. Disabled by default.
+PROFILER = Profiler()
+
+
+def enableProfiling(enabled=True):
+   """
+   Enable or disable the shared profiler.
+   Also used to initialize worker processes.
+   """
+   PROFILER.enabled = enabled
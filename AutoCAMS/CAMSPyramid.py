@@ -0,0 +1,351 @@
+import numpy as np
+from .CAMSConstants import *
+from .CAMSQuery import *
+
+# Sensor columns summarized by the pyramid.
+PYRAMID_SENSORS = [I_CABIN_O2, I_CABIN_P, I_CABIN_T, I_CABIN_CO2, I_CABIN_H, I_TANK_O2, I_TANK_N2]
+
+# Version of the stored pyramids. Increment when the layout changes.
+PYRAMID_VERSION = 1
+
+# Name of the pyramid stored next to the columns by ArchiveCache.
+PYRAMID_NAME = "pyramid"
+
+# Buckets of the finest level span 2**BASE_SHIFT milliseconds (about 4 s),
+# every level above doubles the span.
+BASE_SHIFT = 12
+
+# Default number of points returned for a time window.
+DEFAULT_POINTS = 1000
+
+# Fields of the buckets of a level.
+P_BUCKET = 'BUCKET'   # Bucket of the rows: I_OSMET >> (BASE_SHIFT + level)
+P_FIRST  = 'FIRST'    # First row of the bucket, in time order
+P_ROWS   = 'ROWS'     # Number of rows in the bucket
+P_TIME   = 'TIME'     # Start of a point [milliseconds]
+
+# Summaries of each sensor. Missing values (nan) are left out.
+S_MIN   = 'MIN'       # Lowest value
+S_MAX   = 'MAX'       # Highest value
+S_SUM   = 'SUM'       # Sum of the values
+S_COUNT = 'COUNT'     # Number of values
+S_MEAN  = 'MEAN'      # Mean value
+
+
+def getSummaryField(sensor, summary):
+   """
+   Get the name of the field holding a summary of a sensor, e.g. 'CABIN_O2_MIN'.
+   """
+   return sensor + '_' + summary
+
+
+LEVEL_TYPE_KEYS = [(P_BUCKET, ENTRY_TYPE_LNG), (P_FIRST, ENTRY_TYPE_LNG), (P_ROWS, ENTRY_TYPE_LNG)] + [
+   (getSummaryField(sensor, summary), kind) for sensor in PYRAMID_SENSORS
+   for summary, kind in ((S_MIN, ENTRY_TYPE_FLT), (S_MAX, ENTRY_TYPE_FLT), (S_SUM, ENTRY_TYPE_DBL), (S_COUNT, ENTRY_TYPE_LNG))]
+
+
+def getPointTypeKeys(sensors=None):
+   """
+   Get the fields of the points returned for a time window.
+
+   Params
+   ------
+      sensors - Sensor columns (None for PYRAMID_SENSORS).
+
+   Return
+   ------
+      list - Tuples (name, type) with P_TIME, P_ROWS and the lowest,
+             highest and mean value of each sensor.
+   """
+   sensors = PYRAMID_SENSORS if sensors is None else sensors
+   return [(P_TIME, ENTRY_TYPE_LNG), (P_ROWS, ENTRY_TYPE_LNG)] + [
+      (getSummaryField(sensor, summary), kind) for sensor in sensors
+      for summary, kind in ((S_MIN, ENTRY_TYPE_FLT), (S_MAX, ENTRY_TYPE_FLT), (S_MEAN, ENTRY_TYPE_DBL))]
+
+
+def expandRanges(starts, stops):
+   """
+   Get every position of several ranges [start, stop), without a loop.
+
+   Return
+   ------
+      ndarray - Positions of the ranges, one range after the other.
+   """
+   starts = np.asarray(starts, dtype=np.int64)
+   counts = np.asarray(stops, dtype=np.int64) - starts
+   total  = int(counts.sum())
+   if(0 == total):
+      return np.empty(0, dtype=np.int64)
+   return np.repeat(starts - (np.cumsum(counts) - counts), counts) + np.arange(total)
+
+
+def reduceBuckets(keys, counts, minimum, maximum, sums, values):
+   """
+   Summarize groups of rows or buckets with the same key.
+   Keys are sorted, so each group is a run of rows summarized by reduceat.
+
+   Params
+   ------
+      keys    - Bucket of each row (sorted).
+      counts  - Number of rows held by each row (1 for raw rows).
+      minimum - Dictionary with the lowest value of each sensor.
+      maximum - Dictionary with the highest value of each sensor.
+      sums    - Dictionary with the sum of each sensor.
+      values  - Dictionary with the number of values of each sensor.
+
+   Return
+   ------
+      ndarray - Structured array with the fields in LEVEL_TYPE_KEYS.
+                P_FIRST holds the first position of each bucket in keys.
+   """
+   starts = np.flatnonzero(np.concatenate(([True], keys[1:] != keys[:-1]))) if len(keys) > 0 else np.empty(0, dtype=np.int64)
+   level = np.zeros(len(starts), dtype=LEVEL_TYPE_KEYS)
+   if(0 == len(starts)):
+      return level
+   level[P_BUCKET] = keys[starts]
+   level[P_FIRST]  = starts
+   level[P_ROWS]   = np.add.reduceat(counts, starts)
+   for sensor in PYRAMID_SENSORS:
+      level[getSummaryField(sensor, S_MIN)]   = np.fmin.reduceat(minimum[sensor], starts)
+      level[getSummaryField(sensor, S_MAX)]   = np.fmax.reduceat(maximum[sensor], starts)
+      level[getSummaryField(sensor, S_SUM)]   = np.add.reduceat(sums[sensor], starts)
+      level[getSummaryField(sensor, S_COUNT)] = np.add.reduceat(values[sensor], starts)
+   return level
+
+
+def buildLevels(times, sensors):
+   """
+   Build the levels of the pyramid. The finest level is computed from the
+   rows and every level above from the one below, two buckets at a time.
+
+   Params
+   ------
+      times   - Column I_OSMET in time order.
+      sensors - Dictionary with every column in PYRAMID_SENSORS, in time order.
+
+   Return
+   ------
+      list - Structured arrays with the fields in LEVEL_TYPE_KEYS, from the
+             finest level to a single bucket.
+   """
+   times = np.asarray(times, dtype=np.int64)
+   minimum, maximum, sums, values = {}, {}, {}, {}
+   for sensor in PYRAMID_SENSORS:
+      column = np.asarray(sensors[sensor], dtype=np.float64)
+      valid  = ~np.isnan(column)
+      minimum[sensor] = maximum[sensor] = column
+      sums[sensor]    = np.where(valid, column, 0.0)
+      values[sensor]  = valid.astype(np.int64)
+   levels = [reduceBuckets(times >> BASE_SHIFT, np.ones(len(times), dtype=np.int64), minimum, maximum, sums, values)]
+
+   while(len(levels[-1]) > 1):
+      level = levels[-1]
+      parent = reduceBuckets(level[P_BUCKET] >> 1, level[P_ROWS],
+                             dict((sensor, level[getSummaryField(sensor, S_MIN)]) for sensor in PYRAMID_SENSORS),
+                             dict((sensor, level[getSummaryField(sensor, S_MAX)]) for sensor in PYRAMID_SENSORS),
+                             dict((sensor, level[getSummaryField(sensor, S_SUM)]) for sensor in PYRAMID_SENSORS),
+                             dict((sensor, level[getSummaryField(sensor, S_COUNT)]) for sensor in PYRAMID_SENSORS))
+      # First row of each parent bucket, from the first child.
+      parent[P_FIRST] = level[P_FIRST][parent[P_FIRST]]
+      levels.append(parent)
+   return levels
+
+
+def packPyramid(levels):
+   """
+   Get the arrays used to store the levels of a pyramid (see unpackPyramid()).
+   """
+   arrays = dict(("level" + str(iLevel), level) for iLevel, level in enumerate(levels))
+   arrays["version"] = np.array([PYRAMID_VERSION, BASE_SHIFT], dtype=np.int64)
+   return arrays
+
+
+def unpackPyramid(arrays, rows):
+   """
+   Get the levels of a stored pyramid.
+
+   Params
+   ------
+      arrays - Arrays written by packPyramid().
+      rows   - Number of rows of the archive.
+
+   Return
+   ------
+      list - Levels of the pyramid, None if they do not match the
+             current layout or the archive.
+   """
+   try:
+      if(list(arrays["version"]) != [PYRAMID_VERSION, BASE_SHIFT]):
+         return None
+      levels = []
+      while(("level" + str(len(levels))) in arrays):
+         levels.append(arrays["level" + str(len(levels))])
+   except (KeyError, ValueError):
+      return None
+   if(0 == len(levels) or any(level.dtype != np.dtype(LEVEL_TYPE_KEYS) for level in levels)):
+      return None
+   if(int(levels[0][P_ROWS].sum()) != rows):
+      return None
+   return levels
+
+
+class SensorPyramid():
+   """
+   Min/max/mean decimation of the sensor columns over I_OSMET. Level k
+   summarizes the rows in buckets of 2**(BASE_SHIFT + k) milliseconds,
+   aligned on multiples of the bucket size, up to a single bucket for the
+   whole archive. A time window is rendered from the finest level giving
+   at most the requested number of points, and limit excursions are found
+   by descending only into the buckets whose range crosses a limit, so
+   both cost time in proportion to the output rather than the archive.
+   """
+
+   def __init__(self, timeIndex, sensors, levels=None):
+      """
+      Params
+      ------
+         timeIndex - TimeIndex of the column I_OSMET of the archive.
+         sensors   - Dictionary with every column in PYRAMID_SENSORS.
+         levels    - Levels of a stored pyramid (None to build them).
+      """
+      self.timeIndex = timeIndex
+      self.sensors   = sensors
+      self.levels    = levels
+      if(self.levels is None):
+         self.levels = buildLevels(timeIndex.values, dict((sensor, self.__getSorted(sensor)) for sensor in PYRAMID_SENSORS))
+
+
+   def __getRows(self, positions):
+      # Rows of the archive at positions in time order.
+      return positions if self.timeIndex.isSorted() else self.timeIndex.order[positions]
+
+
+   def __getSorted(self, sensor, positions=slice(None)):
+      # Values of a sensor at positions in time order.
+      return np.asarray(self.sensors[sensor])[self.__getRows(positions)]
+
+
+   def getBuckets(self, iLevel, start=None, end=None):
+      """
+      Get the buckets of a level overlapping a time window [start, end].
+
+      Return
+      ------
+         int - First bucket in the window.
+         int - Bucket after the last one in the window.
+      """
+      keys  = self.levels[iLevel][P_BUCKET]
+      shift = BASE_SHIFT + iLevel
+      lo = 0 if start is None else int(np.searchsorted(keys, int(start) >> shift, 'left'))
+      hi = len(keys) if end is None else int(np.searchsorted(keys, int(end) >> shift, 'right'))
+      return lo, max(lo, hi)
+
+
+   def getLevel(self, start=None, end=None, maxPoints=DEFAULT_POINTS):
+      """
+      Get the finest level with at most maxPoints buckets in a time window.
+
+      Return
+      ------
+         int - Level (the coarsest one if none is small enough).
+      """
+      for iLevel in range(len(self.levels)):
+         lo, hi = self.getBuckets(iLevel, start, end)
+         if(hi - lo <= maxPoints):
+            return iLevel
+      return len(self.levels) - 1
+
+
+   def getPoints(self, start=None, end=None, maxPoints=DEFAULT_POINTS, sensors=None):
+      """
+      Get at most maxPoints points describing the sensors in a time window.
+      Windows with few enough rows are returned row by row. Otherwise each
+      point is a bucket of the chosen level, returned whole when it crosses
+      the edges of the window.
+
+      Params
+      ------
+         start     - First time of the window (None for the start of the archive).
+         end       - Last time of the window (None for the end of the archive).
+         maxPoints - Largest number of points returned.
+         sensors   - Sensor columns returned (None for PYRAMID_SENSORS).
+
+      Return
+      ------
+         ndarray - Structured array with the fields in getPointTypeKeys(sensors).
+      """
+      if(maxPoints < 1):
+         raise ValueError("'maxPoints' must be at least 1.")
+      sensors = PYRAMID_SENSORS if sensors is None else sensors
+      lo, hi  = self.timeIndex.getBounds(start, end)
+      if(hi - lo <= maxPoints):
+         points = np.zeros(hi - lo, dtype=getPointTypeKeys(sensors))
+         points[P_TIME] = self.timeIndex.values[lo:hi]
+         points[P_ROWS] = 1
+         for sensor in sensors:
+            values = self.__getSorted(sensor, slice(lo, hi))
+            for summary in (S_MIN, S_MAX, S_MEAN):
+               points[getSummaryField(sensor, summary)] = values
+         return points
+
+      iLevel = self.getLevel(start, end, maxPoints)
+      lo, hi = self.getBuckets(iLevel, start, end)
+      level  = self.levels[iLevel][lo:hi]
+      points = np.zeros(len(level), dtype=getPointTypeKeys(sensors))
+      points[P_TIME] = level[P_BUCKET] << (BASE_SHIFT + iLevel)
+      points[P_ROWS] = level[P_ROWS]
+      for sensor in sensors:
+         counts = level[getSummaryField(sensor, S_COUNT)]
+         points[getSummaryField(sensor, S_MIN)]  = level[getSummaryField(sensor, S_MIN)]
+         points[getSummaryField(sensor, S_MAX)]  = level[getSummaryField(sensor, S_MAX)]
+         points[getSummaryField(sensor, S_MEAN)] = np.where(counts > 0, level[getSummaryField(sensor, S_SUM)] / np.maximum(counts, 1), np.nan)
+      return points
+
+
+   def findExcursions(self, sensor, low=None, high=None, start=None, end=None):
+      """
+      Find the rows where a sensor is outside its limits in a time window.
+      Values equal to a limit are inside, and missing values (nan) never
+      count as outside, as done by getOutsideTime().
+
+      Params
+      ------
+         sensor - Sensor column, e.g. I_CABIN_O2.
+         low    - Lowest value inside the limits (None for no limit).
+         high   - Highest value inside the limits (None for no limit).
+         start  - First time of the window (None for the start of the archive).
+         end    - Last time of the window (None for the end of the archive).
+
+      Return
+      ------
+         ndarray - Sorted rows of the archive.
+      """
+      low  = -np.inf if low is None else low
+      high =  np.inf if high is None else high
+      fieldMin = getSummaryField(sensor, S_MIN)
+      fieldMax = getSummaryField(sensor, S_MAX)
+
+      def getCrossing(iLevel, buckets):
+         # Buckets inside the window with values outside the limits.
+         level = self.levels[iLevel]
+         lo, hi = self.getBuckets(iLevel, start, end)
+         buckets = buckets[(buckets >= lo) & (buckets < hi)]
+         return buckets[(level[fieldMin][buckets] < low) | (level[fieldMax][buckets] > high)]
+
+      # Descend from the whole archive into the buckets crossing a limit.
+      iLevel  = len(self.levels) - 1
+      buckets = getCrossing(iLevel, np.arange(len(self.levels[iLevel])))
+      while(iLevel > 0 and len(buckets) > 0):
+         children = self.levels[iLevel - 1][P_BUCKET]
+         parents  = self.levels[iLevel][P_BUCKET][buckets]
+         buckets  = expandRanges(np.searchsorted(children, parents << 1, 'left'),
+                                 np.searchsorted(children, (parents << 1) + 2, 'left'))
+         iLevel -= 1
+         buckets = getCrossing(iLevel, buckets)
+
+      level = self.levels[0]
+      positions = expandRanges(level[P_FIRST][buckets], level[P_FIRST][buckets] + level[P_ROWS][buckets])
+      lo, hi = self.timeIndex.getBounds(start, end)
+      positions = positions[(positions >= lo) & (positions < hi)]
+      values = self.__getSorted(sensor, positions)
+      return np.sort(self.__getRows(positions[(values < low) | (values > high)]))
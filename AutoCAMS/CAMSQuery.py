@@ -0,0 +1,151 @@
+import numpy as np
+from .CAMSConstants import *
+from .CAMSCategorical import *
+
+
+class TimeIndex():
+   """
+   Sorted view of a time column (I_OSMET or I_MET) for window queries.
+   Archives are written in time order, so the column is normally used
+   as is. Otherwise the rows are sorted once, keeping ties in file order.
+   """
+
+   def __init__(self, column):
+      """
+      Params
+      ------
+         column - Time column of the archive.
+      """
+      column = np.atleast_1d(np.asarray(column))
+      if(column.size < 2 or bool(np.all(column[1:] >= column[:-1]))):
+         self.values = column
+         self.order  = None
+      else:
+         self.order  = np.argsort(column, kind='stable')
+         self.values = column[self.order]
+
+
+   def isSorted(self):
+      """
+      Check whether the rows of the archive are already in time order.
+      """
+      return self.order is None
+
+
+   def getBounds(self, start=None, end=None):
+      """
+      Get the positions in the sorted values of a time window [start, end].
+
+      Return
+      ------
+         int - First position in the window.
+         int - Position after the last one in the window.
+      """
+      lo = 0 if start is None else int(np.searchsorted(self.values, start, 'left'))
+      hi = len(self.values) if end is None else int(np.searchsorted(self.values, end, 'right'))
+      return lo, max(lo, hi)
+
+
+   def getRows(self, start=None, end=None):
+      """
+      Get the rows inside a time window [start, end].
+
+      Params
+      ------
+         start - First time of the window (None for the start of the archive).
+         end   - Last time of the window (None for the end of the archive).
+
+      Return
+      ------
+         ndarray - Sorted row positions.
+      """
+      lo, hi = self.getBounds(start, end)
+      if(True == self.isSorted()):
+         return np.arange(lo, hi)
+      return np.sort(self.order[lo:hi])
+
+
+class EventIndex():
+   """
+   Inverted index from each value of a column to the rows holding it.
+   The rows of every value are kept in increasing order.
+   """
+
+   def __init__(self, column):
+      """
+      Params
+      ------
+         column - Column of the archive. Categorical columns are indexed
+                  by code, any other column by value.
+      """
+      column = np.atleast_1d(column)
+      self.vocabulary = getattr(column, 'vocabulary', None)
+      if(isinstance(column, Categorical)):
+         column = column.getCodes()
+      column = np.asarray(column)
+
+      self.order = np.argsort(column, kind='stable')
+      self.keys, self.starts = np.unique(column[self.order], return_index=True)
+      self.ends = np.append(self.starts[1:], len(column))
+
+
+   def getKey(self, value):
+      """
+      Translate a value into the key used by the index (None if unknown).
+      """
+      if(self.vocabulary is not None):
+         code = self.vocabulary.code(value)
+         return None if MISSING_CODE == code else code
+      return value
+
+
+   def getRows(self, value):
+      """
+      Get the rows holding a value.
+
+      Params
+      ------
+         value - Value to look up.
+
+      Return
+      ------
+         ndarray - Sorted row positions.
+      """
+      key = self.getKey(value)
+      if(key is None or 0 == len(self.keys)):
+         return np.empty(0, dtype=np.intp)
+      i = int(np.searchsorted(self.keys, key))
+      if(i >= len(self.keys) or self.keys[i] != key):
+         return np.empty(0, dtype=np.intp)
+      return self.order[self.starts[i]:self.ends[i]]
+
+
+   def getRowsIn(self, values):
+      """
+      Get the rows holding any of several values.
+
+      Return
+      ------
+         ndarray - Sorted row positions.
+      """
+      rows = [self.getRows(value) for value in values]
+      if(0 == len(rows)):
+         return np.empty(0, dtype=np.intp)
+      return np.unique(np.concatenate(rows))
+
+
+   def count(self, value):
+      """
+      Get the number of rows holding a value.
+      """
+      return len(self.getRows(value))
+
+
+def clipRows(rows, firstRow=None, lastRow=None):
+   """
+   Keep the sorted rows inside a row window [firstRow, lastRow].
+   """
+   lo = 0 if firstRow is None else int(np.searchsorted(rows, firstRow, 'left'))
+   hi = len(rows) if lastRow is None else int(np.searchsorted(rows, lastRow, 'right'))
+   return rows[lo:max(lo, hi)]
+
@@ -0,0 +1,331 @@
+import re
+import time
+import asyncio
+from .CAMSConstants import *
+from .CAMSMetrics import *
+from .CAMSStream import *
+from .CAMSCompress import *
+from .CAMSIndex import *
+
+# Address the server listens on: "host:port" or "unix:PATH".
+DEFAULT_ADDRESS = "127.0.0.1:7420"
+
+# Number of bytes read from a connection at a time.
+READ_SIZE = 64 * 1024
+
+# Longest line accepted from a client [bytes].
+MAX_LINE_BYTES = 64 * 1024
+
+# Number of completed episodes waiting to be published. Clients stop being
+# read while the queue is full, which slows them down through TCP flow control.
+QUEUE_SIZE = 1024
+
+# Number of lines the replay client sends at a time.
+REPLAY_BATCH = 256
+
+# Valid client identifiers, e.g. the "192.168.7.8" prefix of the archives.
+CLIENT_ID_RE = re.compile(r'^[0-9A-Za-z.:\-]+$')
+
+# Prefix of the address of a Unix socket.
+UNIX_PREFIX = "unix:"
+
+
+def parseAddress(address):
+   """
+   Split the address of the server.
+
+   Params
+   ------
+      address - "host:port" for TCP or "unix:PATH" for a Unix socket.
+
+   Return
+   ------
+      tuple - ("unix", path) or ("tcp", host, port).
+   """
+   if(address.startswith(UNIX_PREFIX)):
+      path = address[len(UNIX_PREFIX):]
+      if(0 == len(path)):
+         raise ValueError("Missing socket path: " + address)
+      return ("unix", path)
+
+   host, _, port = address.rpartition(':')
+   if(0 == len(host) or False == port.isdigit()):
+      raise ValueError("Invalid address (expected host:port or unix:PATH): " + address)
+   return ("tcp", host, int(port))
+
+
+def getLineOsmet(line):
+   """
+   Get the time code of a line of an archive.
+
+   Params
+   ------
+      line - Raw line (bytes).
+
+   Return
+   ------
+      int - Column I_OSMET of the line, None for comments and invalid lines.
+   """
+   if(line.startswith(b'#')):
+      return None
+   fields = line.split(b';', 2)
+   if(len(fields) < 3):
+      return None
+   try:
+      return int(fields[1])
+   except ValueError:
+      return None
+
+
+async def openConnection(address, limit=MAX_LINE_BYTES):
+   """
+   Connect to a server, see parseAddress() for the address format.
+
+   Return
+   ------
+      tuple - asyncio (reader, writer) of the connection.
+   """
+   parts = parseAddress(address)
+   if("unix" == parts[0]):
+      return await asyncio.open_unix_connection(parts[1], limit=limit)
+   return await asyncio.open_connection(parts[1], parts[2], limit=limit)
+
+
+class EpisodeServer():
+   """
+   Ingestion server receiving archives line by line from many clients at
+   the same time, e.g. the AutoCAMS machines of an experiment. Each client
+   sends its identifier on the first line, followed by the lines of its
+   archive. Every connection runs its own EpisodeStream, so each episode
+   is published as soon as its GREEN phase change is received, and only
+   one block of lines and the current episode are kept per connection.
+
+   When the client closes its side, the server replies "OK <episodes>".
+   Invalid data is answered with "ERROR <reason>" and the connection is
+   closed.
+   """
+
+   def __init__(self, publish=None, queueSize=QUEUE_SIZE, readSize=READ_SIZE,
+                maxLineBytes=MAX_LINE_BYTES):
+      """
+      Params
+      ------
+         publish      - Function called with (clientId, record) for every
+                        completed episode, record having the fields in
+                        METRIC_TYPE_KEYS (default: print the episode).
+         queueSize    - Number of episodes waiting to be published before
+                        the clients stop being read.
+         readSize     - Number of bytes read from a connection at a time.
+         maxLineBytes - Longest line accepted from a client.
+      """
+      if(readSize < 1 or maxLineBytes < 1):
+         raise ValueError("'readSize' and 'maxLineBytes' must be at least 1.")
+      self.publish      = publish if publish is not None else printEpisode
+      self.queueSize    = queueSize
+      self.readSize     = readSize
+      self.maxLineBytes = maxLineBytes
+      self.clients = {}        # Number of open connections of each client.
+      self.server  = None
+      self.queue   = None
+      self.publisher = None
+
+
+   async def start(self, address=DEFAULT_ADDRESS):
+      """
+      Start listening, see parseAddress() for the address format.
+      """
+      self.queue = asyncio.Queue(self.queueSize)
+      self.publisher = asyncio.ensure_future(self.__publishEpisodes())
+      parts = parseAddress(address)
+      if("unix" == parts[0]):
+         self.server = await asyncio.start_unix_server(self.__handleClient, parts[1], limit=self.maxLineBytes)
+      else:
+         self.server = await asyncio.start_server(self.__handleClient, parts[1], parts[2], limit=self.maxLineBytes)
+
+
+   async def serveForever(self):
+      await self.server.serve_forever()
+
+
+   async def close(self):
+      """
+      Stop accepting clients and publish the episodes still queued.
+      """
+      if(self.server is not None):
+         self.server.close()
+         await self.server.wait_closed()
+      if(self.queue is not None):
+         await self.queue.join()
+         self.publisher.cancel()
+
+
+   async def __publishEpisodes(self):
+      while(True):
+         clientId, record = await self.queue.get()
+         try:
+            self.publish(clientId, record)
+         finally:
+            self.queue.task_done()
+
+
+   async def __readClientId(self, reader):
+      try:
+         line = await reader.readuntil(b'\n')
+      except asyncio.LimitOverrunError:
+         raise ValueError("client identifier longer than " + str(self.maxLineBytes) + " bytes")
+      except asyncio.IncompleteReadError:
+         raise ValueError("missing client identifier")
+
+      clientId = line.decode("ascii", "replace").strip()
+      if(CLIENT_ID_RE.match(clientId) is None):
+         raise ValueError("invalid client identifier: " + clientId)
+      return clientId
+
+
+   async def __handleClient(self, reader, writer):
+      clientId = None
+      try:
+         clientId = await self.__readClientId(reader)
+         self.clients[clientId] = self.clients.get(clientId, 0) + 1
+         stream  = EpisodeStream()
+         count   = 0
+         pending = b''
+         while(True):
+            data = await reader.read(self.readSize)
+            if(not data):
+               break
+            pending += data
+            end = pending.rfind(b'\n') + 1
+            if(0 == end):
+               if(len(pending) > self.maxLineBytes):
+                  raise ValueError("line longer than " + str(self.maxLineBytes) + " bytes")
+               continue
+            buffer, pending = pending[:end], pending[end:]
+            count += await self.__feed(stream, clientId, buffer)
+
+         # Last line may not end with a newline.
+         if(pending.strip(b' \r\n')):
+            count += await self.__feed(stream, clientId, pending)
+         writer.write(("OK " + str(count) + "\n").encode("ascii"))
+      except (ValueError, IndexError) as e:
+         writer.write(("ERROR " + str(e) + "\n").encode("ascii", "replace"))
+      except ConnectionError:
+         pass
+      finally:
+         if(clientId is not None):
+            self.clients[clientId] -= 1
+            if(0 == self.clients[clientId]):
+               del self.clients[clientId]
+         try:
+            await writer.drain()
+            writer.close()
+            await writer.wait_closed()
+         except ConnectionError:
+            pass
+
+
+   async def __feed(self, stream, clientId, buffer):
+      # Waiting for room in the queue stops reading this client only.
+      records = stream.feed(buffer)
+      for record in records:
+         await self.queue.put((clientId, record))
+      return len(records)
+
+
+def printEpisode(clientId, record):
+   """
+   Print a completed episode, prefixed by the client it comes from.
+   """
+   print(formatMetrics([record], [clientId]), end="", flush=True)
+
+
+async def replayArchive(filename, address=DEFAULT_ADDRESS, speed=1.0, clientId=None):
+   """
+   Send an archive to the server, pacing the lines by their time code.
+
+   Params
+   ------
+      filename - Name of the archive to send.
+      address  - Address of the server.
+      speed    - Replay speed (1 for real time, 10 for ten times faster,
+                 0 to send as fast as the server accepts).
+      clientId - Identifier sent to the server (default: getArchivePrefix(filename)).
+
+   Return
+   ------
+      string - Reply of the server: "OK <episodes>" or "ERROR <reason>".
+   """
+   if(speed < 0):
+      raise ValueError("'speed' must not be negative.")
+   if(clientId is None):
+      clientId = getArchivePrefix(filename)
+
+   reader, writer = await openConnection(address)
+   try:
+      writer.write((clientId + "\n").encode("ascii"))
+      batch = []
+      firstOsmet = None
+      startTime  = time.monotonic()
+      with openArchive(filename) as fp:
+         for line in fp:
+            osmet = getLineOsmet(line) if speed > 0 else None
+            if(osmet is not None):
+               if(firstOsmet is None):
+                  firstOsmet = osmet
+               delay = startTime + (osmet - firstOsmet) / (1000.0 * speed) - time.monotonic()
+               if(delay > 0):
+                  writer.write(b''.join(batch))
+                  batch = []
+                  await writer.drain()
+                  await asyncio.sleep(delay)
+
+            batch.append(line)
+            if(len(batch) >= REPLAY_BATCH):
+               writer.write(b''.join(batch))
+               batch = []
+               await writer.drain()   # Waits while the server is busy.
+
+      writer.write(b''.join(batch))
+      await writer.drain()
+      if(writer.can_write_eof()):
+         writer.write_eof()
+      reply = await reader.read()
+      return reply.decode("ascii", "replace").strip()
+   finally:
+      writer.close()
+      try:
+         await writer.wait_closed()
+      except ConnectionError:
+         pass
+
+
+async def replayArchives(filenames, address=DEFAULT_ADDRESS, speed=1.0):
+   """
+   Send several archives to the server at the same time, one connection each.
+
+   Return
+   ------
+      list - Reply of the server to each archive.
+   """
+   return await asyncio.gather(*[replayArchive(filename, address, speed) for filename in filenames])
+
+
+def runServer(address=DEFAULT_ADDRESS, publish=None):
+   """
+   Run the ingestion server until interrupted.
+   """
+   async def serve():
+      server = EpisodeServer(publish)
+      await server.start(address)
+      try:
+         await server.serveForever()
+      finally:
+         await server.close()
+   asyncio.run(serve())
+
+
+def runReplay(filenames, address=DEFAULT_ADDRESS, speed=1.0):
+   """
+   Send archives to a running server, see replayArchives().
+   """
+   return asyncio.run(replayArchives(filenames, address, speed))
@@ -0,0 +1,281 @@
+import os
+import heapq
+import numpy as np
+from .CAMSConstants import *
+from .CAMSArchive import *
+from .CAMSCategorical import *
+from .CAMSCompress import *
+from .CAMSIndex import *
+from .CAMSMetrics import *
+from .CAMSProfile import *
+from .CAMSTarget import *
+
+# Longest pause between two fragments of the same session [milliseconds].
+# Archives with the same prefix and script starting later are separate runs.
+SEAM_GAP = 60 * 1000
+
+
+def groupFragments(entries, maxGap=SEAM_GAP):
+   """
+   Group the archives a session was logged to. Fragments share the folder,
+   the prefix and the script, and each one starts before the previous ones
+   end or at most maxGap after. Only the index entries are read.
+
+   Params
+   ------
+      entries - Index entries of the archives (see ArchiveIndex.get()).
+      maxGap  - Longest pause between two fragments [milliseconds].
+
+   Return
+   ------
+      list - Positions in entries of the archives of each session, ordered
+             by time code. Sessions are in the order of their first archive
+             in entries.
+   """
+   groups = {}
+   for position, entry in enumerate(entries):
+      # Archives without a valid first and last record are never merged.
+      if(entry[X_FIRST_OSMET] is None or entry[X_LAST_OSMET] is None):
+         key = position
+      else:
+         key = (os.path.dirname(getSourceFile(entry[X_PATH])), getArchivePrefix(entry[X_PATH]), entry[X_SCRIPT])
+      groups.setdefault(key, []).append(position)
+
+   sessions = []
+   for positions in groups.values():
+      positions.sort(key=lambda position: (entries[position][X_FIRST_OSMET] or 0, entries[position][X_FIRST_ID] or 0))
+      session = [positions[0]]
+      end = entries[positions[0]][X_LAST_OSMET]
+      for position in positions[1:]:
+         entry = entries[position]
+         if(entry[X_FIRST_OSMET] > end + maxGap):
+            sessions.append(session)
+            session = []
+            end = entry[X_LAST_OSMET]
+         session.append(position)
+         end = max(end, entry[X_LAST_OSMET])
+      sessions.append(session)
+
+   sessions.sort(key=min)
+   return sessions
+
+
+def getSeamRows(osmets):
+   """
+   Find the rows of each fragment inside the time span of another fragment,
+   the only rows that may be logged twice.
+
+   Params
+   ------
+      osmets - Column I_OSMET of each fragment.
+
+   Return
+   ------
+      list - Boolean mask of the seam rows of each fragment.
+   """
+   spans = [(osmet.min(), osmet.max()) if len(osmet) > 0 else None for osmet in osmets]
+   seams = []
+   for iFragment, osmet in enumerate(osmets):
+      seam = np.zeros(len(osmet), dtype=bool)
+      for iOther, span in enumerate(spans):
+         if(iOther != iFragment and span is not None):
+            seam |= (osmet >= span[0]) & (osmet <= span[1])
+      seams.append(seam)
+   return seams
+
+
+def mergeFragments(osmets, ids):
+   """
+   Merge the rows of several fragments by time code and running number.
+   This is a k-way merge of runs: the fragment with the earliest next row
+   gives every row up to the next row of the other fragments at once,
+   found by a binary search, so rows are not compared one by one. The
+   rows of a fragment keep the order of the file, and rows logged in
+   more than one fragment (same I_OSMET and I_ID) are kept once.
+
+   Params
+   ------
+      osmets - Column I_OSMET of each fragment.
+      ids    - Column I_ID of each fragment.
+
+   Return
+   ------
+      list - Runs (fragment, start, stop) of rows, in merged order.
+      int  - Number of duplicate rows left out.
+   """
+   osmets = [np.asarray(osmet, dtype=np.int64) for osmet in osmets]
+   ids    = [np.asarray(rowIds, dtype=np.int64) for rowIds in ids]
+
+   # Running maximum of the time codes, so rows logged out of order
+   # stay with the rows before them.
+   keys  = [np.maximum.accumulate(osmet) if len(osmet) > 0 else osmet for osmet in osmets]
+   seams = getSeamRows(osmets)
+
+   heads = [0] * len(keys)
+   heap  = [(int(key[0]), int(ids[iFragment][0]), iFragment) for iFragment, key in enumerate(keys) if len(key) > 0]
+   heapq.heapify(heap)
+   runs = []
+   seen = set()
+   duplicates = 0
+   while(heap):
+      _, _, iFragment = heapq.heappop(heap)
+      key   = keys[iFragment]
+      start = heads[iFragment]
+      stop  = len(key)
+      if(heap):
+         stop = max(start + 1, int(np.searchsorted(key, heap[0][0], 'right')))
+      heads[iFragment] = stop
+      if(stop < len(key)):
+         heapq.heappush(heap, (int(key[stop]), int(ids[iFragment][stop]), iFragment))
+
+      # Only the seam rows are checked against the rows already merged.
+      kept = np.ones(stop - start, dtype=bool)
+      for row in np.flatnonzero(seams[iFragment][start:stop]) + start:
+         pair = (int(osmets[iFragment][row]), int(ids[iFragment][row]))
+         if(pair in seen):
+            kept[row - start] = False
+         else:
+            seen.add(pair)
+      duplicates += int(len(kept) - np.count_nonzero(kept))
+
+      edges = np.flatnonzero(np.diff(np.concatenate(([0], kept.view(np.int8), [0]))))
+      for first, last in zip(edges[0::2] + start, edges[1::2] + start):
+         if(runs and runs[-1][0] == iFragment and runs[-1][2] == first):
+            runs[-1] = (iFragment, runs[-1][1], int(last))
+         else:
+            runs.append((iFragment, int(first), int(last)))
+   return runs, duplicates
+
+
+class Session():
+   """
+   One logical archive made of the fragments a session was logged to,
+   e.g. when AutoCAMS was restarted during a run. Each fragment is read
+   as an Archive and the rows are merged by time code (see
+   mergeFragments), so fault episodes crossing the end of a file are
+   found whole. The fragments are not copied into a new archive: the
+   merge is a list of runs of rows, and only the columns read are
+   gathered in merged order.
+   """
+
+   def __init__(self, filenames, max_rows=None, engine=LoadEngine.BULK, cache=None, columns=None):
+      """
+      Params
+      ------
+         filenames - Names of the fragments (see groupFragments()).
+         max_rows  - Maximum number of rows to read from each fragment (None for all).
+         engine    - LoadEngine used to read the fragments.
+         cache     - Optional ArchiveCache used to read the fragments.
+         columns   - Columns read from the fragments (None for all).
+                     I_OSMET and I_ID are always read for the merge.
+      """
+      if(0 == len(filenames)):
+         raise ValueError("A session needs at least one archive.")
+      if(columns is not None):
+         columns = list(columns) + [name for name in (I_OSMET, I_ID) if name not in columns]
+      self.filenames = list(filenames)
+      self.fragments = [Archive(filename, max_rows, engine, cache, columns) for filename in self.filenames]
+      with PROFILER.timer(T_MERGE):
+         self.runs, duplicates = mergeFragments([fragment[I_OSMET] for fragment in self.fragments],
+                                                [fragment[I_ID] for fragment in self.fragments])
+      PROFILER.count(C_DUPLICATE, duplicates)
+      self.__columns = {}
+      self.__metrics = None
+      self.__target  = None
+
+
+   def __len__(self):
+      return sum(stop - start for _, start, stop in self.runs)
+
+
+   def __getitem__(self, name):
+      """
+      Get a column of the session in merged order.
+      Categorical columns are returned as views of their codes.
+      """
+      if(name not in self.__columns):
+         blocks = [block[name] for block in self.iterBlocks([name])]
+         if(0 == len(blocks)):
+            blocks = [np.asarray(self.fragments[0][name])[:0]]
+         column = np.concatenate(blocks)
+         if(name in VOCABULARY):
+            column = Categorical(column, VOCABULARY[name])
+         self.__columns[name] = column
+      return self.__columns[name]
+
+
+   def iterBlocks(self, names):
+      """
+      Read columns of the session in merged order, one run of rows at a
+      time. Each block is a view of a fragment.
+
+      Params
+      ------
+         names - Names of the columns to read.
+
+      Return
+      ------
+         generator - Dictionaries with the rows of each column of the block.
+      """
+      columns = [dict((name, np.asarray(fragment[name])) for name in names) for fragment in self.fragments]
+      for iFragment, start, stop in self.runs:
+         yield dict((name, column[start:stop]) for name, column in columns[iFragment].items())
+
+
+   def getScript(self):
+      """
+      Get the script used for this run, from the first fragment.
+
+      Return
+      ------
+         string - XML script name used for this run.
+      """
+      return self.fragments[0].getScript()
+
+
+   def parseData(self, prefix, skipFault=False, engine=ParseEngine.VECTOR):
+      """
+      Extract the metrics for every fault episode of the session,
+      see Archive.parseData().
+      """
+      return formatMetrics(self.getMetrics(engine), prefix, skipFault)
+
+
+   def getMetrics(self, engine=ParseEngine.VECTOR, names=None):
+      """
+      Extract the metrics for every fault episode of the session,
+      see Archive.getMetrics(). Only ParseEngine.VECTOR is supported.
+
+      Return
+      ------
+         ndarray - Structured array with the fields in getMetricTypeKeys(names),
+                   i.e. METRIC_TYPE_KEYS for the default metrics.
+      """
+      if(ParseEngine.VECTOR != engine):
+         raise ValueError("Sessions only support the vector engine: ", engine)
+      key = None if names is None else tuple(names)
+      if(self.__metrics is None or self.__metrics[0] != key):
+         with PROFILER.timer(T_METRICS):
+            metrics = getTableMetrics(self, names)
+         PROFILER.count(C_EPISODES, metrics.size)
+         self.__metrics = (key, metrics)
+      return self.__metrics[1]
+
+
+   def getOutOfTarget(self):
+      """
+      Compute the time each cabin sensor spent outside its green and red
+      bands, for every fault episode and for the whole session,
+      see Archive.getOutOfTarget().
+
+      Return
+      ------
+         ndarray - Structured array with the fields in TARGET_TYPE_KEYS,
+                   one record per episode.
+         np.void - Record with the fields in TARGET_TYPE_KEYS for the
+                   whole session.
+      """
+      if(self.__target is None):
+         with PROFILER.timer(T_TARGET):
+            self.__target = getTargetTables(self)
+      return self.__target
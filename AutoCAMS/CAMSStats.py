@@ -0,0 +1,376 @@
+import numpy as np
+from .CAMSConstants import *
+from .CAMSJoin import *
+
+# Metrics compared across sessions by default.
+STATS_METRICS = [M_FIT, M_AVT, M_AVS_RP, M_AVS_NP, M_CON_CHECK, M_LOGGING]
+
+# Fields the records can be grouped by.
+GROUP_FIELDS = [O_MISSION, O_USER, O_SESSION, O_FAULT]
+
+# Default number of bootstrap resamples and permutations.
+DEFAULT_RESAMPLES = 10000
+
+# Default confidence level of the bootstrap intervals.
+DEFAULT_CONFIDENCE = 0.95
+
+# Largest number of values drawn at a time. Resamples are generated and
+# reduced in batches, so memory does not grow with the number of resamples.
+BATCH_VALUES = 4 * 1024 * 1024
+
+# Field names for the description of a metric in a group.
+G_METRIC  = 'METRIC'    # Name of the metric
+G_COUNT   = 'COUNT'     # Number of episodes with a value
+G_MEAN    = 'MEAN'      # Mean value
+G_STD     = 'STD'       # Sample standard deviation
+G_MIN     = 'MIN'       # Lowest value
+G_MEDIAN  = 'MEDIAN'    # Median value
+G_MAX     = 'MAX'       # Highest value
+G_CI_LOW  = 'CI_LOW'    # Lower bound of the bootstrap confidence interval of the mean
+G_CI_HIGH = 'CI_HIGH'   # Upper bound of the bootstrap confidence interval of the mean
+
+DESCRIBE_TYPE_KEYS = [
+   (G_METRIC,  'U32'),
+   (G_COUNT,   ENTRY_TYPE_LNG),
+   (G_MEAN,    ENTRY_TYPE_DBL),
+   (G_STD,     ENTRY_TYPE_DBL),
+   (G_MIN,     ENTRY_TYPE_DBL),
+   (G_MEDIAN,  ENTRY_TYPE_DBL),
+   (G_MAX,     ENTRY_TYPE_DBL),
+   (G_CI_LOW,  ENTRY_TYPE_DBL),
+   (G_CI_HIGH, ENTRY_TYPE_DBL)
+   ]
+
+# Field names for the comparison of the sessions with and without an automation fault.
+H_COUNT_FAULT  = 'COUNT_FAULT'    # Episodes of the sessions with a fault
+H_COUNT_NORMAL = 'COUNT_NORMAL'   # Episodes of the sessions without a fault
+H_MEAN_FAULT   = 'MEAN_FAULT'     # Mean value in the sessions with a fault
+H_MEAN_NORMAL  = 'MEAN_NORMAL'    # Mean value in the sessions without a fault
+H_DIFF         = 'DIFF'           # MEAN_FAULT - MEAN_NORMAL
+H_P_VALUE      = 'P_VALUE'        # Two-sided permutation p-value of DIFF
+
+COMPARE_TYPE_KEYS = [
+   (G_METRIC,       'U32'),
+   (H_COUNT_FAULT,  ENTRY_TYPE_LNG),
+   (H_COUNT_NORMAL, ENTRY_TYPE_LNG),
+   (H_MEAN_FAULT,   ENTRY_TYPE_DBL),
+   (H_MEAN_NORMAL,  ENTRY_TYPE_DBL),
+   (H_DIFF,         ENTRY_TYPE_DBL),
+   (H_P_VALUE,      ENTRY_TYPE_DBL)
+   ]
+
+
+def getValidMask(values):
+   """
+   Get the episodes where a metric could be computed: MISSING_RATIO (nan)
+   for decimal metrics and MISSING_TIME for the others are left out.
+
+   Return
+   ------
+      ndarray - Boolean mask, True for valid values.
+   """
+   values = np.asarray(values)
+   if('f' == values.dtype.kind):
+      return ~np.isnan(values)
+   return (values != MISSING_TIME)
+
+
+def getGroups(records, by):
+   """
+   Find the groups of records sharing the same values of some fields.
+
+   Params
+   ------
+      records - Structured array with the fields in OUTPUT_TYPE_KEYS.
+      by      - Fields to group by, from GROUP_FIELDS (empty for a single group).
+
+   Return
+   ------
+      ndarray - Structured array with the fields in by, one sorted record per group.
+      ndarray - Group of each record.
+   """
+   keys = np.empty(len(records), dtype=[(name, records.dtype[name]) for name in by])
+   for name in by:
+      keys[name] = records[name]
+   if(0 == len(by)):
+      return np.empty(1, dtype=keys.dtype), np.zeros(len(records), dtype=np.int64)
+   keys, groups = np.unique(keys, return_inverse=True)
+   return keys, groups.astype(np.int64)
+
+
+def getKeyTypes(keys):
+   """
+   Get the fields of the groups found by getGroups(), as (name, type) tuples.
+   """
+   return [(name, keys.dtype[name]) for name in (keys.dtype.names or ())]
+
+
+def getGroupStarts(groups, numGroups):
+   """
+   Get the number of values of each group and the position of its first
+   value once sorted by group.
+   """
+   counts = np.bincount(groups, minlength=numGroups)
+   return counts, np.cumsum(counts) - counts
+
+
+def bootstrapMeans(ordered, counts, resamples=DEFAULT_RESAMPLES, rng=None):
+   """
+   Resample the values of every group with replacement and take the mean
+   of each resample. All the groups are resampled together: one batch of
+   uniform draws gives a resample of every group, and the means are
+   reduced with reduceat, so there is no loop over resamples or groups.
+
+   Params
+   ------
+      ordered   - Values sorted by group.
+      counts    - Number of values of each group.
+      resamples - Number of resamples.
+      rng       - numpy.random.Generator (None for a new unseeded one).
+
+   Return
+   ------
+      ndarray - Mean of each resample (rows) and group (columns),
+                nan for groups without values.
+   """
+   rng = np.random.default_rng() if rng is None else rng
+   ordered = np.asarray(ordered, dtype=np.float64)
+   counts  = np.asarray(counts, dtype=np.int64)
+   starts  = np.cumsum(counts) - counts
+   found   = (counts > 0)
+   means   = np.full((resamples, len(counts)), np.nan)
+   if(0 == len(ordered)):
+      return means
+
+   # Every position draws from the values of its own group.
+   group = np.repeat(np.arange(len(counts)), counts)
+   first, size = starts[group], counts[group]
+   batch = max(1, BATCH_VALUES // len(ordered))
+   for lo in range(0, resamples, batch):
+      hi = min(lo + batch, resamples)
+      draws = first + (rng.random((hi - lo, len(ordered))) * size).astype(np.int64)
+      sums  = np.add.reduceat(ordered[draws], starts[found], axis=1)
+      means[lo:hi, found] = sums / counts[found]
+   return means
+
+
+def permutationTest(values, labels, resamples=DEFAULT_RESAMPLES, rng=None, strata=None):
+   """
+   Test the difference between the mean of two conditions by shuffling
+   the labels. Each batch of permutations is a matrix of shuffled labels,
+   and the sums of the first condition are taken with one matrix product.
+
+   Params
+   ------
+      values    - Values of the episodes.
+      labels    - True for the episodes of the first condition (e.g. a fault).
+      resamples - Number of permutations.
+      rng       - numpy.random.Generator (None for a new unseeded one).
+      strata    - Optional stratum of each episode (e.g. the subject). Labels
+                  are only shuffled within a stratum.
+
+   Return
+   ------
+      float - Observed difference (first condition minus second one).
+      float - Two-sided p-value, nan if a condition has no values.
+   """
+   rng = np.random.default_rng() if rng is None else rng
+   values = np.asarray(values, dtype=np.float64)
+   labels = np.asarray(labels, dtype=bool)
+   numFirst  = int(np.count_nonzero(labels))
+   numSecond = len(labels) - numFirst
+   if(0 == numFirst or 0 == numSecond):
+      return np.nan, np.nan
+   total    = values.sum()
+   observed = values[labels].mean() - values[~labels].mean()
+
+   # Sort by stratum, so shuffling the order within each block of a
+   # stratum keeps the labels of the stratum together.
+   if(strata is None):
+      codes = np.zeros(len(values), dtype=np.int64)
+   else:
+      codes = np.unique(np.asarray(strata), return_inverse=True)[1].astype(np.int64)
+   base   = np.argsort(codes, kind='stable')
+   codes  = codes[base]
+   values = values[base]
+   labels = labels[base]
+
+   # Differences equal to the observed one up to rounding count as extreme.
+   threshold = abs(observed) - 1e-9 * max(1.0, abs(observed))
+   extreme = 0
+   batch = max(1, BATCH_VALUES // len(values))
+   for lo in range(0, resamples, batch):
+      size = min(batch, resamples - lo)
+      if(strata is None):
+         shuffled = rng.permuted(np.tile(labels, (size, 1)), axis=1)
+      else:
+         shuffled = labels[np.argsort(codes + rng.random((size, len(values))), axis=1)]
+      sums = shuffled.astype(np.float64) @ values
+      diff = sums / numFirst - (total - sums) / numSecond
+      extreme += int(np.count_nonzero(np.abs(diff) >= threshold))
+   return observed, (extreme + 1.0) / (resamples + 1.0)
+
+
+def describeValues(values, groups, numGroups, resamples=DEFAULT_RESAMPLES, confidence=DEFAULT_CONFIDENCE, rng=None):
+   """
+   Describe the values of every group. The values are sorted once by group
+   and value, so the lowest, median and highest values are read from known
+   positions, see getSortedQuantile().
+
+   Params
+   ------
+      values     - Valid values of a metric.
+      groups     - Group of each value (0 to numGroups - 1).
+      numGroups  - Number of groups.
+      resamples  - Number of bootstrap resamples (0 for no confidence interval).
+      confidence - Confidence level of the intervals.
+      rng        - numpy.random.Generator (None for a new unseeded one).
+
+   Return
+   ------
+      ndarray - Structured array with the fields in DESCRIBE_TYPE_KEYS
+                (G_METRIC left empty), one record per group.
+   """
+   values = np.asarray(values, dtype=np.float64)
+   groups = np.asarray(groups, dtype=np.int64)
+   counts, starts = getGroupStarts(groups, numGroups)
+   ordered = values[np.lexsort((values, groups))]
+
+   stats = np.zeros(numGroups, dtype=DESCRIBE_TYPE_KEYS)
+   stats[G_COUNT] = counts
+   for name, _ in DESCRIBE_TYPE_KEYS[2:]:
+      stats[name] = np.nan
+   found = (counts > 0)
+   first = starts[found]
+   last  = first + counts[found] - 1
+   means = np.bincount(groups, values, minlength=numGroups)[found] / counts[found]
+   stats[G_MEAN][found] = means
+   stats[G_MIN][found]  = ordered[first]
+   stats[G_MAX][found]  = ordered[last]
+
+   stats[G_MEDIAN][found] = getSortedQuantile(ordered, first, last, 0.5)
+
+   several = (counts > 1)
+   deviation = np.bincount(groups, (values - stats[G_MEAN][groups]) ** 2, minlength=numGroups)
+   stats[G_STD][several] = np.sqrt(deviation[several] / (counts[several] - 1))
+
+   if(resamples > 0 and np.any(found)):
+      alpha = (1.0 - confidence) / 2.0
+      bounds = np.quantile(bootstrapMeans(ordered, counts, resamples, rng)[:, found], [alpha, 1.0 - alpha], axis=0)
+      stats[G_CI_LOW][found]  = bounds[0]
+      stats[G_CI_HIGH][found] = bounds[1]
+   return stats
+
+
+def checkMetrics(records, metrics):
+   """
+   Get the metrics to describe and check that the records hold them.
+
+   Params
+   ------
+      records - Structured array with the fields in OUTPUT_TYPE_KEYS.
+      metrics - Names of the metric fields (None for STATS_METRICS).
+
+   Return
+   ------
+      list - Names of the metric fields.
+   """
+   metrics = STATS_METRICS if metrics is None else metrics
+   missing = [name for name in metrics if name not in records.dtype.names]
+   if(len(missing) > 0):
+      raise ValueError("Metrics missing from the records: ", missing)
+   return metrics
+
+
+def describeMetrics(records, metrics=None, by=(O_FAULT,), resamples=DEFAULT_RESAMPLES,
+                    confidence=DEFAULT_CONFIDENCE, seed=None):
+   """
+   Describe the metrics of the episodes in each group, with a bootstrap
+   confidence interval of the mean. Episodes where a metric could not be
+   computed are left out of that metric.
+
+   Params
+   ------
+      records    - Structured array with the fields in OUTPUT_TYPE_KEYS,
+                   e.g. from loadOutput() or loadTextOutput().
+      metrics    - Names of the metric fields (None for STATS_METRICS).
+      by         - Fields to group by, from GROUP_FIELDS.
+      resamples  - Number of bootstrap resamples (0 for no confidence interval).
+      confidence - Confidence level of the intervals.
+      seed       - Seed of the resamples, for reproducible intervals.
+
+   Return
+   ------
+      ndarray - Structured array with the fields in by followed by those in
+                DESCRIBE_TYPE_KEYS, one record per group and metric.
+   """
+   metrics = checkMetrics(records, metrics)
+   rng = np.random.default_rng(seed)
+   keys, groups = getGroups(records, by)
+   results = np.zeros(len(keys) * len(metrics), dtype=getKeyTypes(keys) + DESCRIBE_TYPE_KEYS)
+   for iMetric, name in enumerate(metrics):
+      values = np.asarray(records[name])
+      valid  = getValidMask(values)
+      stats  = describeValues(values[valid], groups[valid], len(keys), resamples, confidence, rng)
+      rows   = np.arange(len(keys)) * len(metrics) + iMetric
+      for field in keys.dtype.names:
+         results[field][rows] = keys[field]
+      for field in stats.dtype.names:
+         results[field][rows] = stats[field]
+      results[G_METRIC][rows] = name
+   return results
+
+
+def compareConditions(records, metrics=None, by=(), resamples=DEFAULT_RESAMPLES, seed=None, strata=None):
+   """
+   Compare the metrics of the sessions with and without an automation
+   fault (O_FAULT) with permutation tests, in each group.
+
+   Params
+   ------
+      records   - Structured array with the fields in OUTPUT_TYPE_KEYS.
+      metrics   - Names of the metric fields (None for STATS_METRICS).
+      by        - Fields to group by, from GROUP_FIELDS (O_FAULT excluded).
+      resamples - Number of permutations.
+      seed      - Seed of the permutations, for reproducible p-values.
+      strata    - Optional field, e.g. O_USER. Fault labels are only
+                  shuffled between episodes with the same value.
+
+   Return
+   ------
+      ndarray - Structured array with the fields in by followed by those in
+                COMPARE_TYPE_KEYS, one record per group and metric.
+   """
+   if(O_FAULT in by):
+      raise ValueError("The conditions cannot be compared within a fault condition.")
+   metrics = checkMetrics(records, metrics)
+   rng = np.random.default_rng(seed)
+   keys, groups = getGroups(records, by)
+   results = np.zeros(len(keys) * len(metrics), dtype=getKeyTypes(keys) + COMPARE_TYPE_KEYS)
+   for iGroup in range(len(keys)):
+      for iMetric, name in enumerate(metrics):
+         values = np.asarray(records[name])
+         rows   = (groups == iGroup) & getValidMask(values)
+         labels = (np.asarray(records[O_FAULT])[rows] != 0)
+         result = results[iGroup * len(metrics) + iMetric]
+         for field in keys.dtype.names:
+            result[field] = keys[iGroup][field]
+         result[G_METRIC]       = name
+         result[H_COUNT_FAULT]  = np.count_nonzero(labels)
+         result[H_COUNT_NORMAL] = len(labels) - np.count_nonzero(labels)
+         result[H_MEAN_FAULT]   = values[rows][labels].mean() if np.any(labels) else np.nan
+         result[H_MEAN_NORMAL]  = values[rows][~labels].mean() if not np.all(labels) else np.nan
+         result[H_DIFF], result[H_P_VALUE] = permutationTest(values[rows], labels, resamples, rng,
+                                                             None if strata is None else np.asarray(records[strata])[rows])
+   return results
+
+
+def formatStats(stats):
+   """
+   Render statistics as an aligned text table, one line per record.
+   Decimals are written with three digits.
+   """
+   formats = [(name, "{0:.3f}".format if 'f' == stats.dtype.fields[name][0].kind else str) for name in stats.dtype.names]
+   table  = [list(stats.dtype.names)] + [[render(record[name]) for name, render in formats] for record in stats]
+   widths = [max(len(row[iColumn]) for row in table) for iColumn in range(len(formats))]
+   return "".join("  ".join(cell.rjust(width) for cell, width in zip(row, widths)) + "\n" for row in table)
@@ -0,0 +1,206 @@
+import os
+import time
+import numpy as np
+from .CAMSConstants import *
+from .CAMSParser import *
+from .CAMSCompress import *
+from .CAMSCategorical import *
+from .CAMSMetrics import *
+
+# Number of bytes read from the archive at a time.
+DEFAULT_CHUNK_SIZE = 1024 * 1024
+
+# Time to wait for new data when following an archive [seconds].
+DEFAULT_POLL_INTERVAL = 1.0
+
+# Bytes at the start of a followed archive compared to find out whether
+# it was rewritten in place [bytes].
+HEADER_BYTES = 4096
+
+# Columns read by the episode state machine.
+STREAM_COLUMNS = [I_OSMET, I_EVENT_SOURCE, I_EVENT_DESC, I_ERROR_PHASE]
+
+
+def isReplaced(filename, fp, header):
+   """
+   Check whether a followed archive is no longer the file read so far:
+   it was replaced by another file, truncated, or rewritten in place.
+
+   Params
+   ------
+      filename - Name of the archive.
+      fp       - File object of the archive, opened in binary mode.
+      header   - First bytes read from fp, up to HEADER_BYTES.
+
+   Return
+   ------
+      bool - True if the archive has to be read again from the start.
+   """
+   try:
+      stat = os.stat(filename)
+   except OSError:
+      # The archive is being replaced, check again at the next poll.
+      return False
+   opened = os.fstat(fp.fileno())
+   if(stat.st_ino != opened.st_ino or stat.st_dev != opened.st_dev):
+      return True
+   if(stat.st_size < fp.tell()):
+      return True
+
+   # Same file and size, the start of the file changed when it was rewritten.
+   position = fp.tell()
+   fp.seek(0)
+   start = fp.read(len(header))
+   fp.seek(position)
+   return start != header
+
+
+def readChunks(filename, chunkSize=DEFAULT_CHUNK_SIZE, follow=False,
+               pollInterval=DEFAULT_POLL_INTERVAL, idleTimeout=None):
+   """
+   Read an archive in blocks of complete lines.
+   A line cut at the end of a block is carried over to the next one,
+   so the memory used is bounded by the chunk size plus one line.
+
+   Params
+   ------
+      filename     - Name of the archive to read.
+      chunkSize    - Number of bytes read at a time.
+      follow       - Keep waiting for new lines at the end of the file
+                     (like tail -f) instead of stopping.
+      pollInterval - Time between checks for new data when following [seconds].
+      idleTimeout  - Stop following after this long without new data
+                     [seconds] (None to follow forever).
+
+   Return
+   ------
+      generator - Tuples (restarted, buffer). restarted is True when the
+                  file was truncated, rewritten or replaced while following, and
+                  the buffer holds complete lines only.
+   """
+   if(chunkSize < 1):
+      raise ValueError("'chunkSize' must be at least 1.")
+   if(True == follow and True == isCompressed(filename)):
+      raise ValueError("Compressed archives cannot be followed: " + filename)
+
+   fp = openArchive(filename)
+   try:
+      pending   = b''
+      header    = b''
+      restarted = False
+      idleSince = time.time()
+      while(True):
+         data = fp.read(chunkSize)
+         if(data):
+            idleSince = time.time()
+            if(len(header) < HEADER_BYTES):
+               header += data[:HEADER_BYTES - len(header)]
+            pending += data
+            end = pending.rfind(b'\n') + 1
+            if(end > 0):
+               yield restarted, pending[:end]
+               pending   = pending[end:]
+               restarted = False
+            continue
+
+         # End of file reached.
+         if(False == follow):
+            break
+         if(idleTimeout is not None and time.time() - idleSince >= idleTimeout):
+            break
+
+         # The archive was truncated, rewritten or replaced by a new session.
+         if(True == isReplaced(filename, fp, header)):
+            fp.close()
+            fp = open(filename, "rb")
+            pending   = b''
+            header    = b''
+            restarted = True
+            continue
+         time.sleep(pollInterval)
+
+      # Last line may not end with a newline.
+      if(pending.strip(b' \r\n')):
+         yield restarted, pending
+   finally:
+      fp.close()
+
+
+class EpisodeStream():
+   """
+   Incremental extraction of the metrics of a session received in blocks
+   of complete lines. Only the state of the current episode is kept
+   between blocks.
+   """
+
+   def __init__(self):
+      self.tracker = EpisodeTracker()
+
+
+   def reset(self):
+      """
+      Start a new session.
+      """
+      self.tracker = EpisodeTracker()
+
+
+   def feed(self, buffer):
+      """
+      Process a block of complete lines.
+
+      Params
+      ------
+         buffer - Raw lines of the archive, comments included.
+
+      Return
+      ------
+         list - One record with the fields in METRIC_TYPE_KEYS for each
+                episode completed in the block.
+      """
+      rows = np.atleast_1d(parseBuffer(buffer, names=STREAM_COLUMNS))
+      if(0 == rows.size):
+         return []
+
+      # Decode the categorical columns once for the whole block.
+      osmet  = rows[I_OSMET].tolist()
+      source = VOCABULARY[I_EVENT_SOURCE].decode(rows[I_EVENT_SOURCE])
+      desc   = VOCABULARY[I_EVENT_DESC].decode(rows[I_EVENT_DESC])
+      phase  = VOCABULARY[I_ERROR_PHASE].decode(rows[I_ERROR_PHASE])
+
+      records = []
+      for i in range(rows.size):
+         record = self.tracker.feed(osmet[i], source[i], desc[i], phase[i])
+         if(record is not None):
+            records.append(np.array([record], dtype=METRIC_TYPE_KEYS)[0])
+      return records
+
+
+def streamEpisodes(filename, chunkSize=DEFAULT_CHUNK_SIZE, follow=False,
+                   pollInterval=DEFAULT_POLL_INTERVAL, idleTimeout=None):
+   """
+   Extract the metrics of each fault episode while the archive is read.
+   Every episode is returned as soon as its GREEN phase change is read,
+   and only the current block of lines and the state of the current
+   episode are kept in memory, regardless of the length of the file.
+
+   Params
+   ------
+      filename     - Name of the archive to read.
+      chunkSize    - Number of bytes read at a time.
+      follow       - Keep waiting for new episodes at the end of the file,
+                     to monitor an archive AutoCAMS is still writing.
+      pollInterval - Time between checks for new data when following [seconds].
+      idleTimeout  - Stop following after this long without new data
+                     [seconds] (None to follow forever).
+
+   Return
+   ------
+      generator - One record with the fields in METRIC_TYPE_KEYS per episode,
+                  the same values as Archive.getMetrics().
+   """
+   stream = EpisodeStream()
+   for restarted, buffer in readChunks(filename, chunkSize, follow, pollInterval, idleTimeout):
+      if(True == restarted):
+         stream.reset()
+      for record in stream.feed(buffer):
+         yield record
@@ -0,0 +1,203 @@
+import numpy as np
+from .CAMSConstants import *
+from .CAMSEpisodes import *
+
+# Cabin sensors and the limits they are checked against.
+SENSOR_LIMITS = [
+   (I_CABIN_O2,  Limits.O2),
+   (I_CABIN_P,   Limits.P),
+   (I_CABIN_T,   Limits.T),
+   (I_CABIN_CO2, Limits.CO2),
+   (I_CABIN_H,   Limits.H)
+   ]
+
+# Columns of the archive read by the out-of-target engine.
+TARGET_COLUMNS = [I_OSMET, I_EVENT_SOURCE, I_EVENT_DESC, I_ERROR_PHASE] + [sensor for sensor, _ in SENSOR_LIMITS]
+
+# Bands checked for every sensor, as (name, index of low limit, index of high limit).
+BAND_GREEN = ('GREEN', Limits.GREEN_LOW, Limits.GREEN_HIGH)
+BAND_RED   = ('RED',   Limits.RED_LOW,   Limits.RED_HIGHT)
+BANDS      = [BAND_GREEN, BAND_RED]
+
+
+def getTargetField(sensor, band):
+   """
+   Get the name of the field holding the time a sensor spent outside a band.
+
+   Params
+   ------
+      sensor - Sensor column, e.g. I_CABIN_O2.
+      band   - BAND_GREEN or BAND_RED.
+
+   Return
+   ------
+      string - Field name, e.g. 'CABIN_O2_OUT_GREEN'.
+   """
+   return sensor + '_OUT_' + band[0]
+
+
+# Time outside each band, per sensor [milliseconds].
+TARGET_TYPE_KEYS = [(getTargetField(sensor, band), 'i8') for sensor, _ in SENSOR_LIMITS for band in BANDS]
+
+
+def getHoldTimes(osmet):
+   """
+   Get the time each row is valid: the sensor values of a row hold until
+   the time code of the next row. The last row holds for no time, and
+   rows out of time order are given no time instead of a negative one.
+
+   Params
+   ------
+      osmet - Column I_OSMET of the archive.
+
+   Return
+   ------
+      ndarray - Duration of each row [milliseconds].
+   """
+   osmet = np.atleast_1d(osmet).astype(np.int64)
+   hold = np.zeros(len(osmet), dtype=np.int64)
+   if(len(osmet) > 1):
+      np.maximum(np.diff(osmet), 0, out=hold[:-1])
+   return hold
+
+
+def getOutsideTime(values, limits, band, hold):
+   """
+   Get the running total of the time a sensor spent outside a band.
+   Values equal to a limit are inside the band. Missing values (nan)
+   are never counted as outside.
+
+   Params
+   ------
+      values - Sensor column of the archive.
+      limits - Limits of the sensor (e.g. Limits.O2).
+      band   - BAND_GREEN or BAND_RED.
+      hold   - Duration of each row, see getHoldTimes().
+
+   Return
+   ------
+      ndarray - Time outside the band before each row, with one more
+                entry for the end of the archive [milliseconds].
+   """
+   values  = np.atleast_1d(values)
+   outside = (values < limits[band[1]]) | (values > limits[band[2]])
+   total = np.zeros(len(values) + 1, dtype=np.int64)
+   np.cumsum(np.where(outside, hold, 0), out=total[1:])
+   return total
+
+
+def computeOutOfTarget(osmet, sensors, lo, hi):
+   """
+   Compute the time every sensor spent outside its green and red bands
+   in a set of row windows. Each window [lo, hi] covers the time from
+   row lo until row hi. The masks and running totals are built once for
+   the whole archive, so every window costs two lookups per field.
+
+   Params
+   ------
+      osmet   - Column I_OSMET of the archive.
+      sensors - Dictionary with the column of every sensor in SENSOR_LIMITS.
+      lo      - First row of each window (negative for a missing window).
+      hi      - Last row of each window.
+
+   Return
+   ------
+      ndarray - Structured array with the fields in TARGET_TYPE_KEYS, with
+                MISSING_TIME for missing windows.
+   """
+   lo = np.atleast_1d(lo).astype(np.int64)
+   hi = np.atleast_1d(hi).astype(np.int64)
+   found = (lo >= 0)
+   hold  = getHoldTimes(osmet)
+
+   results = np.zeros(len(lo), dtype=TARGET_TYPE_KEYS)
+   for sensor, limits in SENSOR_LIMITS:
+      for band in BANDS:
+         total = getOutsideTime(sensors[sensor], limits, band, hold)
+         field = getTargetField(sensor, band)
+         results[field] = MISSING_TIME
+         results[field][found] = total[hi[found]] - total[lo[found]]
+   return results
+
+
+def computeEpisodeTarget(osmet, sensors, episodes):
+   """
+   Compute the time out of target while a fault was present: from the
+   first RED phase change of each episode until the GREEN one closing it.
+
+   Params
+   ------
+      osmet    - Column I_OSMET of the archive.
+      sensors  - Dictionary with the column of every sensor in SENSOR_LIMITS.
+      episodes - Structured array with the fields in EPISODE_TYPE_KEYS.
+
+   Return
+   ------
+      ndarray - Structured array with the fields in TARGET_TYPE_KEYS, one
+                record per episode.
+   """
+   return computeOutOfTarget(osmet, sensors, episodes[E_RED_FIRST], episodes[E_GREEN])
+
+
+def computeSessionTarget(osmet, sensors):
+   """
+   Compute the time out of target over the whole archive.
+
+   Return
+   ------
+      np.void - Record with the fields in TARGET_TYPE_KEYS.
+   """
+   last = max(len(np.atleast_1d(osmet)) - 1, 0)
+   return computeOutOfTarget(osmet, sensors, [0], [last])[0]
+
+
+def getTargetTables(table):
+   """
+   Compute the time out of target of an archive or a session, for every
+   fault episode and for the whole table.
+
+   Params
+   ------
+      table - Archive or Session with the columns in TARGET_COLUMNS.
+
+   Return
+   ------
+      ndarray - Structured array with the fields in TARGET_TYPE_KEYS,
+                one record per episode (see computeEpisodeTarget()).
+      np.void - Record with the fields in TARGET_TYPE_KEYS for the
+                whole table (see computeSessionTarget()).
+   """
+   osmet    = table[I_OSMET]
+   sensors  = dict((sensor, table[sensor]) for sensor, _ in SENSOR_LIMITS)
+   episodes = findEpisodes(table[I_EVENT_SOURCE], table[I_EVENT_DESC], table[I_ERROR_PHASE])[0]
+   return computeEpisodeTarget(osmet, sensors, episodes), computeSessionTarget(osmet, sensors)
+
+
+# Field numbering the records of getTargetRecords(), 0 for the whole archive.
+T_EPISODE = 'EPISODE'
+
+
+def getTargetRecords(episodes, session):
+   """
+   Combine the time out of target of the whole archive and of its episodes
+   in one table, e.g. to render them with formatMetrics().
+
+   Params
+   ------
+      episodes - Structured array with the fields in TARGET_TYPE_KEYS, one
+                 record per episode (see computeEpisodeTarget()).
+      session  - Record with the fields in TARGET_TYPE_KEYS for the whole
+                 archive (see computeSessionTarget()).
+
+   Return
+   ------
+      ndarray - Structured array with the field T_EPISODE followed by those
+                in TARGET_TYPE_KEYS: the whole archive first, then each
+                episode numbered from 1.
+   """
+   records = np.zeros(len(episodes) + 1, dtype=[(T_EPISODE, 'i8')] + TARGET_TYPE_KEYS)
+   records[T_EPISODE] = np.arange(len(records))
+   for name, _ in TARGET_TYPE_KEYS:
+      records[name][0]  = session[name]
+      records[name][1:] = episodes[name]
+   return records
@@ -0,0 +1,475 @@
+import json
+import numpy as np
+from .CAMSConstants import *
+from .CAMSCategorical import *
+from .CAMSParser import *
+from .CAMSEpisodes import *
+from .CAMSBatch import *
+
+# Largest time between two rows before it is reported [milliseconds].
+# AutoCAMS writes a row about every second.
+MAX_TIME_GAP = 5000
+
+# Sources of the fault managers of AutoCAMS, e.g. "OxygenManualManager".
+MANAGER_SUFFIX = "Manager"
+
+# Event sources found in valid archives.
+KNOWN_SOURCES = set(getConstants(EventSource)) | PARAMS_TOTAL
+
+# Prefixes of the descriptions naming a fault.
+REPAIR_PREFIX   = EventDesc.REPAIR + ": "
+INJECTED_PREFIX = EventDesc.INJECTED + ": "
+
+# Fields of each problem found in an archive.
+V_CHECK    = "check"      # Check that failed (see Check)
+V_SEVERITY = "severity"   # Severity of the problem (see Severity)
+V_COUNT    = "count"      # Number of lines with the problem
+V_LINE     = "line"       # First line with the problem (None for the whole file)
+V_MESSAGE  = "message"    # Description of the problem
+
+# Byte values used to scan the raw archive.
+NEWLINE_BYTE = ord('\n')
+DELIM_BYTE   = ord(DELIM_CHAR)
+COMMENT_BYTE = ord(COMMENT_CHAR)
+BLANK_BYTES  = [ord(' '), ord('\r'), ord('\n')]
+
+
+def isValidFault(value):
+   return value in PARAMS_NECESSARY
+
+
+def isValidDiagnosis(value):
+   # Buttons of the AFIRA dialog, or "injected:detected".
+   parts = value.split(":")
+   if(1 == len(parts)):
+      return True
+   return 2 == len(parts) and isValidFault(parts[0]) and isValidFault(parts[1])
+
+
+def isValidSystemEvent(value):
+   # Only the events naming a fault are checked.
+   for prefix in (REPAIR_PREFIX, INJECTED_PREFIX):
+      if(value.startswith(prefix)):
+         return isValidFault(value[len(prefix):])
+   return True
+
+
+# Checks of the descriptions of the sources with a known set of events.
+DESC_RULES = {
+   EventSource.CONNECTION_CHECK : lambda value: value in (EventDesc.ICON_APPEARS, EventDesc.ICON_CONFIRMED, EventDesc.ICON_CLOSED),
+   EventSource.DETECTOR         : isValidFault,
+   EventSource.GRAPH_MONITOR    : lambda value: value in PARAMS_TOTAL,
+   EventSource.AFIRA            : isValidDiagnosis,
+   EventSource.A_CAMS_SYSTEM    : isValidSystemEvent
+   }
+
+
+def getRunningCount(mask):
+   """
+   Get the number of bytes of a buffer matching a mask before each offset,
+   so the matches in any range of the buffer are found with two lookups.
+
+   Params
+   ------
+      mask - Boolean mask over the bytes of the buffer.
+
+   Return
+   ------
+      ndarray - Running count, with one more entry for the end of the buffer.
+   """
+   total = np.zeros(len(mask) + 1, dtype=np.int64)
+   np.cumsum(mask, out=total[1:])
+   return total
+
+
+def countInLines(total, starts, ends):
+   """
+   Count the matching bytes in each line of a buffer.
+
+   Params
+   ------
+      total  - Running count of the matches, see getRunningCount().
+      starts - Offset of the first byte of each line.
+      ends   - Offset after the last byte of each line.
+
+   Return
+   ------
+      ndarray - Number of matching bytes per line.
+   """
+   return total[ends] - total[starts]
+
+
+def getLineBounds(data):
+   """
+   Locate the lines of a buffer, without their line breaks.
+
+   Params
+   ------
+      data - Bytes of the buffer as an uint8 array.
+
+   Return
+   ------
+      ndarray - Offset of the first byte of each line.
+      ndarray - Offset of the line break ending each line.
+   """
+   ends = np.flatnonzero(data == NEWLINE_BYTE)
+   if(0 == len(data) or NEWLINE_BYTE != data[-1]):
+      ends = np.append(ends, len(data))
+   starts = np.concatenate(([0], ends[:-1] + 1)).astype(np.int64)
+   return starts, ends
+
+
+def isInteger(value):
+   try:
+      int(value)
+      return True
+   except ValueError:
+      return False
+
+
+def isFloat(value):
+   try:
+      float(value.replace(b',', b'.'))
+      return True
+   except ValueError:
+      return False
+
+
+class ArchiveReport():
+   """
+   Problems found in an archive by validateArchive().
+   """
+
+   def __init__(self, filename):
+      self.filename = filename
+      self.script   = None
+      self.rows     = 0
+      self.diagnostics = []
+
+
+   def add(self, check, severity, lines, message):
+      """
+      Record a problem.
+
+      Params
+      ------
+         check    - Check that failed (see Check).
+         severity - Severity of the problem (see Severity).
+         lines    - Lines of the file with the problem (None for the whole file).
+         message  - Description of the problem.
+      """
+      if(lines is not None and 0 == len(lines)):
+         return
+      self.diagnostics.append({
+         V_CHECK    : check,
+         V_SEVERITY : severity,
+         V_COUNT    : 1 if lines is None else int(len(lines)),
+         V_LINE     : None if lines is None else int(lines[0]),
+         V_MESSAGE  : message
+         })
+
+
+   def count(self, severity):
+      """
+      Get the number of problems of a given severity.
+      """
+      return sum(1 for entry in self.diagnostics if severity == entry[V_SEVERITY])
+
+
+   def isValid(self):
+      """
+      Check whether the archive has no errors (warnings are allowed).
+      """
+      return 0 == self.count(Severity.ERROR)
+
+
+   def getChecks(self, severity=None):
+      """
+      Get the names of the checks that failed.
+      """
+      return [entry[V_CHECK] for entry in self.diagnostics if severity in (None, entry[V_SEVERITY])]
+
+
+   def toDict(self):
+      return {"file" : self.filename, "script" : self.script, "rows" : self.rows,
+              "valid" : self.isValid(), "diagnostics" : self.diagnostics}
+
+
+def checkLines(report, buffer):
+   """
+   Check the layout of every line: number of columns and decimal style.
+   The bytes of the whole buffer are scanned at once.
+
+   Return
+   ------
+      list    - Raw contents of the valid rows.
+      ndarray - Position of each valid row among the lines of the file.
+   """
+   data = np.frombuffer(buffer, dtype=np.uint8)
+   starts, ends = getLineBounds(data)
+   isText = np.ones(256, dtype=bool)
+   isText[BLANK_BYTES] = False
+   blank = (countInLines(getRunningCount(isText[data]), starts, ends) == 0)
+   firstByte = data[np.minimum(starts, len(data) - 1)] if len(data) > 0 else np.zeros(len(starts), dtype=np.uint8)
+   comment = ~blank & (firstByte == COMMENT_BYTE)
+
+   if(len(starts) > 0 and True == comment[0]):
+      report.script = getScriptName(buffer[starts[0]:ends[0]].decode('utf-8', 'replace'))
+   else:
+      report.add(Check.HEADER, Severity.ERROR, None, "missing '# scriptfile:' header")
+
+   rows = np.flatnonzero(~blank & ~comment)
+   if(0 == len(rows)):
+      report.add(Check.EMPTY, Severity.ERROR, None, "no rows")
+      return [], rows
+
+   # Number of columns.
+   isDelim = (data == DELIM_BYTE)
+   numFields = countInLines(getRunningCount(isDelim), starts[rows], ends[rows]) + 1
+   wrong = (numFields != NUM_FIELDS)
+   report.add(Check.COLUMNS, Severity.ERROR, rows[wrong] + 1,
+              "expected %d columns, got %s" % (NUM_FIELDS, ", ".join(str(value) for value in np.unique(numFields[wrong]))))
+   rows = rows[~wrong]
+   if(0 == len(rows)):
+      return [], rows
+
+   # Bounds of every field, from the delimiters of each valid row.
+   delims = np.flatnonzero(isDelim)
+   first  = np.searchsorted(delims, starts[rows])
+   fieldEnds = np.empty((len(rows), NUM_FIELDS), dtype=np.int64)
+   fieldEnds[:, :-1] = delims[first[:, None] + np.arange(NUM_FIELDS - 1)]
+   fieldEnds[:, -1]  = ends[rows]
+   fieldStarts = np.empty_like(fieldEnds)
+   fieldStarts[:, 0]  = starts[rows]
+   fieldStarts[:, 1:] = fieldEnds[:, :-1] + 1
+
+   # Decimal commas and points mixed in the float columns.
+   floatKeys = [i for i, (name, kind) in enumerate(TYPE_KEYS) if kind in (ENTRY_TYPE_FLT, ENTRY_TYPE_DBL) and name not in VOCABULARY]
+   isComma = getRunningCount(data == ord(','))
+   isPoint = getRunningCount(data == ord('.'))
+   commas = np.zeros(len(rows), dtype=np.int64)
+   points = np.zeros(len(rows), dtype=np.int64)
+   for i in floatKeys:
+      commas += countInLines(isComma, fieldStarts[:, i], fieldEnds[:, i])
+      points += countInLines(isPoint, fieldStarts[:, i], fieldEnds[:, i])
+   numComma, numPoint = np.count_nonzero(commas), np.count_nonzero(points)
+   if(numComma > 0 and numPoint > 0):
+      minority = (commas > 0) if numComma <= numPoint else (points > 0)
+      report.add(Check.DECIMAL_STYLE, Severity.WARNING, rows[minority] + 1,
+                 "%d line(s) with decimal commas and %d with decimal points" % (numComma, numPoint))
+
+   return [buffer[start:end] for start, end in zip(starts[rows], ends[rows])], rows
+
+
+def checkNumeric(report, raw, rows):
+   """
+   Find the rows with invalid numeric values. Only used when the archive
+   cannot be parsed: each numeric column is converted in bulk and only
+   searched value by value when the conversion fails.
+
+   Params
+   ------
+      raw  - Raw contents of the rows, see checkLines().
+      rows - Position of each row among the lines of the file.
+
+   Return
+   ------
+      list    - Raw contents of the valid rows.
+      ndarray - Position of each valid row among the lines of the file.
+   """
+   _, fields = splitFields(b'\n'.join(raw))
+   invalid = np.zeros(len(rows), dtype=bool)
+   for i, (name, kind) in enumerate(TYPE_KEYS):
+      if(name in VOCABULARY or kind in (ENTRY_TYPE_STR, ENTRY_TYPE_OBJ)):
+         continue
+      isInt  = kind in (ENTRY_TYPE_SHT, ENTRY_TYPE_INT, ENTRY_TYPE_LNG)
+      column = fields[i::NUM_FIELDS]
+      try:
+         toNumeric([column], np.int64 if isInt else np.float64)
+         continue
+      except ValueError:
+         pass
+      check = isInteger if isInt else isFloat
+      bad = np.array([not check(value) for value in column], dtype=bool)
+      report.add(Check.NUMERIC, Severity.ERROR, rows[bad] + 1, "invalid value in column " + name)
+      invalid |= bad
+   return [line for line, bad in zip(raw, invalid) if not bad], rows[~invalid]
+
+
+def checkOrder(report, array, lines):
+   """
+   Check the running number and the time columns.
+   """
+   ids   = np.asarray(array[I_ID]).astype(np.int64)
+   met   = np.asarray(array[I_MET]).astype(np.int64)
+   osmet = np.asarray(array[I_OSMET]).astype(np.int64)
+   after = lines[1:]
+
+   report.add(Check.ID_ORDER, Severity.ERROR, after[np.diff(ids) <= 0], "ID not increasing")
+   report.add(Check.MET_ORDER, Severity.WARNING, after[np.diff(met) < 0], "MET decreasing")
+   report.add(Check.OSMET_ORDER, Severity.WARNING, after[np.diff(osmet) < 0], "OSMET decreasing")
+   gaps = np.diff(osmet)
+   found = (gaps > MAX_TIME_GAP)
+   if(np.any(found)):
+      report.add(Check.TIME_GAP, Severity.WARNING, after[found],
+                 "gap of more than %d ms between rows (largest %d ms)" % (MAX_TIME_GAP, gaps.max()))
+
+
+def checkEvents(report, array, lines):
+   """
+   Check the event columns. Every distinct value (or pair of source and
+   description) is checked once and the result mapped back to the rows.
+
+   Return
+   ------
+      bool - True if the faults named in the archive are all known.
+   """
+   sourceCodes = np.asarray(array[I_EVENT_SOURCE]).astype(np.int64)
+   descCodes   = np.asarray(array[I_EVENT_DESC]).astype(np.int64)
+   phaseCodes  = np.asarray(array[I_ERROR_PHASE]).astype(np.int64)
+   sources = VOCABULARY[I_EVENT_SOURCE]
+   descs   = VOCABULARY[I_EVENT_DESC]
+   phases  = VOCABULARY[I_ERROR_PHASE]
+
+   codes = np.unique(sourceCodes)
+   unknown = [code for code in codes if sources[code] not in KNOWN_SOURCES and False == sources[code].endswith(MANAGER_SUFFIX)]
+   bad = np.isin(sourceCodes, unknown)
+   report.add(Check.UNKNOWN_SOURCE, Severity.WARNING, lines[bad],
+              "unknown event source: " + ", ".join(sorted(set(sources[code] for code in unknown))))
+
+   known = set(getConstants(ErrorState))
+   codes = np.unique(phaseCodes)
+   unknown = [code for code in codes if phases[code] not in known]
+   bad = np.isin(phaseCodes, unknown)
+   report.add(Check.UNKNOWN_PHASE, Severity.WARNING, lines[bad],
+              "unknown error phase: " + ", ".join(sorted(set(phases[code] for code in unknown))))
+
+   # Pairs of source and description.
+   pairs = np.unique((sourceCodes << 32) | descCodes)
+   invalid = []
+   for pair in pairs:
+      source, desc = sources[int(pair >> 32)], descs[int(pair & 0xFFFFFFFF)]
+      rule = DESC_RULES.get(source)
+      if(rule is not None and False == rule(desc)):
+         invalid.append((pair, source, desc))
+
+   isFault = [pair for pair, source, _ in invalid if EventSource.AFIRA == source]
+   bad = np.isin((sourceCodes << 32) | descCodes, isFault)
+   report.add(Check.UNKNOWN_FAULT, Severity.ERROR, lines[bad],
+              "unknown fault diagnosed by AFIRA: " + ", ".join(sorted(set(desc for pair, _, desc in invalid if pair in isFault))))
+   other = [pair for pair, source, _ in invalid if EventSource.AFIRA != source]
+   bad = np.isin((sourceCodes << 32) | descCodes, other)
+   report.add(Check.UNKNOWN_DESC, Severity.WARNING, lines[bad],
+              "unknown event description: " + ", ".join(sorted(set(source + "/" + desc for pair, source, desc in invalid if pair in other))))
+   return 0 == len(isFault)
+
+
+def checkEpisodes(report, array, lines):
+   """
+   Check that every fault episode has the rows the metrics depend on.
+   """
+   source = VOCABULARY[I_EVENT_SOURCE].decode(array[I_EVENT_SOURCE])
+   desc   = VOCABULARY[I_EVENT_DESC].decode(array[I_EVENT_DESC])
+   phase  = VOCABULARY[I_ERROR_PHASE].decode(array[I_ERROR_PHASE])
+   episodes, _, _ = findEpisodes(source, desc, phase)
+   if(0 == len(episodes)):
+      report.add(Check.NO_EPISODES, Severity.WARNING, None, "no GREEN phase change")
+
+   greenLines = lines[episodes[E_GREEN]]
+   noRed = (episodes[E_AFIRA] >= 0) & (episodes[E_RED_FIRST] < 0)
+   report.add(Check.EPISODE_RED, Severity.WARNING, greenLines[noRed],
+              "fault diagnosed without a RED phase change, FIT and AVT are missing")
+   noRepair = (episodes[E_RED_FIRST] >= 0) & (episodes[E_CORRECT_REPAIR] < 0)
+   report.add(Check.EPISODE_REPAIR, Severity.WARNING, greenLines[noRepair],
+              "fault episode without a correct repair order, FIT is missing")
+
+   lastGreen = episodes[E_GREEN][-1] if len(episodes) > 0 else -1
+   redRows = np.flatnonzero((desc == EventDesc.PHASE_CHANGE) & (phase == ErrorState.RED))
+   report.add(Check.EPISODE_OPEN, Severity.WARNING, lines[redRows[redRows > lastGreen]],
+              "RED phase change after the last GREEN one, the episode is dropped")
+
+
+def validateBuffer(buffer, filename=None):
+   """
+   Check the contents of an archive.
+
+   Params
+   ------
+      buffer   - Raw contents of the archive.
+      filename - Name of the archive, for the report.
+
+   Return
+   ------
+      ArchiveReport - Problems found.
+   """
+   report = ArchiveReport(filename)
+   raw, rows = checkLines(report, buffer)
+   report.rows = len(raw)
+   if(0 == len(raw)):
+      return report
+
+   try:
+      array = parseBuffer(b'\n'.join(raw))
+   except ValueError:
+      raw, rows = checkNumeric(report, raw, rows)
+      if(0 == len(raw)):
+         return report
+      array = parseBuffer(b'\n'.join(raw))
+
+   # Line of the file of each row, as used by text editors.
+   lines = rows + 1
+   checkOrder(report, array, lines)
+   if(True == checkEvents(report, array, lines)):
+      checkEpisodes(report, array, lines)
+   return report
+
+
+def validateArchive(filename):
+   """
+   Check an archive, see validateBuffer().
+   """
+   return validateBuffer(readBuffer(filename), filename)
+
+
+def validateArchives(filenames, jobs=1):
+   """
+   Check many archives, in a process pool when jobs > 1.
+
+   Return
+   ------
+      list - ArchiveReport of each archive, in the order given.
+   """
+   reports = []
+   for filename, report, _, error, _ in runBatch(validateArchive, filenames, jobs):
+      if(error is not None):
+         report = ArchiveReport(filename)
+         report.add(Check.READ, Severity.ERROR, None, error)
+      reports.append(report)
+   return reports
+
+
+def formatReports(reports):
+   """
+   Describe the problems found in a set of archives, one line per problem.
+   """
+   text = []
+   for report in reports:
+      if(0 == len(report.diagnostics)):
+         continue
+      text.append("- %s: %d error(s), %d warning(s)\n" % (report.filename, report.count(Severity.ERROR), report.count(Severity.WARNING)))
+      for entry in report.diagnostics:
+         where = "" if entry[V_LINE] is None else " at line %d" % entry[V_LINE]
+         if(entry[V_COUNT] > 1):
+            where += " (%d lines)" % entry[V_COUNT]
+         text.append("   %-7s %-15s %s%s\n" % (entry[V_SEVERITY], entry[V_CHECK], entry[V_MESSAGE], where))
+   invalid = sum(1 for report in reports if False == report.isValid())
+   text.append("--- %d archive(s) checked, %d invalid.\n" % (len(reports), invalid))
+   return "".join(text)
+
+
+def writeReports(reports, filename):
+   """
+   Export the reports to a JSON file.
+   """
+   with open(filename, "w") as fp:
+      json.dump([report.toDict() for report in reports], fp, indent=1)
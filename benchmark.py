@@ -0,0 +1,170 @@
+import io
+import gzip
+import os
+import json
+import time
+import argparse
+import platform
+import subprocess
+import contextlib
+import tracemalloc
+import numpy as np
+from AutoCAMS.CAMSArchive import *
+from AutoCAMS.CAMSConstants import *
+from AutoCAMS.CAMSGenerator import *
+
+BENCH_DIR   = "./Cache/Benchmark/"   # Synthetic archives are kept here between runs.
+OUTPUT_FILE = "./benchmark.json"
+
+# Archive sizes measured by default [rows].
+DEFAULT_ROWS = [1000, 10000, 100000, 1000000]
+
+# Prefix used for the metrics (missionId, userId, sessionId, hasFault).
+PREFIX = [0, 1, 1, 1]
+
+
+def getArchive(numRows, decimalComma=False, seed=0):
+   """
+   Get a synthetic archive, generating it if it does not exist yet.
+
+   Return
+   ------
+      string - Name of the archive.
+   """
+   style = "comma" if decimalComma else "point"
+   filename = os.path.join(BENCH_DIR, "synthetic_%d_%s_%d.txt" % (numRows, style, seed))
+   if(False == os.path.exists(filename)):
+      os.makedirs(BENCH_DIR, exist_ok=True)
+      SyntheticSession(seed, decimalComma).write(filename + ".tmp", numRows)
+      os.replace(filename + ".tmp", filename)
+   return filename
+
+
+def getCompressedArchive(filename):
+   """
+   Get a gzip copy of an archive, compressing it if it does not exist yet.
+
+   Return
+   ------
+      string - Name of the compressed archive.
+   """
+   compressed = filename + ".gz"
+   if(False == os.path.exists(compressed)):
+      with open(filename, "rb") as fp, gzip.open(compressed + ".tmp", "wb") as out:
+         out.write(fp.read())
+      os.replace(compressed + ".tmp", compressed)
+   return compressed
+
+
+def measure(function, repeat=1):
+   """
+   Measure the wall time and the peak memory allocated by a function.
+   The best time of all the repetitions is kept, and the peak memory
+   is measured on a separate run so tracing does not affect the time.
+
+   Return
+   ------
+      float - Wall time [seconds].
+      int   - Peak memory allocated [bytes].
+   """
+   best = None
+   for _ in range(repeat):
+      with contextlib.redirect_stdout(io.StringIO()):
+         start = time.perf_counter()
+         function()
+         elapsed = time.perf_counter() - start
+      best = elapsed if best is None else min(best, elapsed)
+
+   tracemalloc.start()
+   try:
+      with contextlib.redirect_stdout(io.StringIO()):
+         function()
+      _, peak = tracemalloc.get_traced_memory()
+   finally:
+      tracemalloc.stop()
+   return best, peak
+
+
+def getStages(filename, engine):
+   """
+   Get the stages measured for an archive. Each run works on a new
+   view of the archive so results cached by a previous run are not reused.
+
+   Return
+   ------
+      list - Tuples (name, function).
+   """
+   archive = Archive(filename, engine=engine)
+   compressed = getCompressedArchive(filename)
+   return [
+      ("load",                lambda: Archive(filename, engine=engine)),
+      ("load_gzip",           lambda: Archive(compressed, engine=engine)),
+      ("load_projected",      lambda: Archive(filename, engine=engine, columns=getRequiredColumns())),
+      ("getScript",           lambda: archive.view(Archive).getScript()),
+      ("parseData",           lambda: archive.view(Archive).parseData(PREFIX)),
+      ("parseData_skipFault", lambda: archive.view(Archive).parseData(PREFIX, True)),
+      ("outOfTarget",         lambda: archive.view(Archive).getOutOfTarget())
+      ]
+
+
+def getRevision():
+   """
+   Get the git revision of the working tree (None outside of a repository).
+   """
+   try:
+      return subprocess.check_output(["git", "rev-parse", "HEAD"], stderr=subprocess.DEVNULL).decode().strip()
+   except (OSError, subprocess.CalledProcessError):
+      return None
+
+
+def main():
+   parser = argparse.ArgumentParser(description="Measure archive loading and metric extraction on synthetic AutoCAMS logs.")
+   parser.add_argument("--rows", type=int, nargs="+", default=DEFAULT_ROWS,
+                       help="Archive sizes to measure [rows].")
+   parser.add_argument("--repeat", type=int, default=3,
+                       help="Number of timed runs per stage (the best one is kept).")
+   parser.add_argument("--engine", default=LoadEngine.BULK, choices=[LoadEngine.BULK, LoadEngine.GENFROMTXT],
+                       help="Engine used to load the archives.")
+   parser.add_argument("--output", default=OUTPUT_FILE,
+                       help="JSON file the results are written to.")
+   args = parser.parse_args()
+
+   results = []
+   for numRows in args.rows:
+      for decimalComma in (False, True):
+         filename = getArchive(numRows, decimalComma)
+         size = os.path.getsize(filename)
+         style = "comma" if decimalComma else "point"
+
+         for stage, function in getStages(filename, args.engine):
+            seconds, peak = measure(function, args.repeat)
+            result = {
+               "stage"      : stage,
+               "rows"       : numRows,
+               "decimal"    : style,
+               "bytes"      : size,
+               "seconds"    : seconds,
+               "rowsPerSec" : numRows / seconds if seconds > 0 else None,
+               "mbPerSec"   : size / 1e6 / seconds if seconds > 0 else None,
+               "peakBytes"  : peak
+               }
+            results.append(result)
+            print("%-20s %9d rows %-5s %10.4f s %12.0f rows/s %8.1f MB/s %8.1f MB peak" % (
+               stage, numRows, style, seconds, result["rowsPerSec"] or 0, result["mbPerSec"] or 0, peak / 1e6))
+
+   report = {
+      "revision" : getRevision(),
+      "engine"   : args.engine,
+      "python"   : platform.python_version(),
+      "numpy"    : np.__version__,
+      "platform" : platform.platform(),
+      "time"     : time.strftime("%Y-%m-%dT%H:%M:%S"),
+      "results"  : results
+      }
+   with open(args.output, "w") as fp:
+      json.dump(report, fp, indent=1)
+   print("Results written to " + args.output)
+
+
+if __name__ == "__main__":
+   main()
@@ -1,11 +1,32 @@
 import numpy as np
 import os
+import argparse
+import functools
 from AutoCAMS.CAMSArchive import *
 from AutoCAMS.CAMSConstants import *
+from AutoCAMS.CAMSCache import *
+from AutoCAMS.CAMSBatch import *
+from AutoCAMS.CAMSMetrics import *
+from AutoCAMS.CAMSStream import *
+from AutoCAMS.CAMSIndex import *
+from AutoCAMS.CAMSProfile import *
+from AutoCAMS.CAMSOutput import *
+from AutoCAMS.CAMSDataset import *
+from AutoCAMS.CAMSServer import *
+from AutoCAMS.CAMSManifest import *
+from AutoCAMS.CAMSValidate import *
+from AutoCAMS.CAMSCompress import *
+from AutoCAMS.CAMSSession import *
+from AutoCAMS.CAMSStats import *
 
 ARCHIVE_DIR = "./Data/"
 MISSION_DIR = ["M5_Logs/", "M6_Logs/"]
 SUBJECT_DIR = ["S1/", "S2/", "S3/"]
+CACHE_DIR   = "./Cache/"      # Parsed archives are cached here between runs.
+INDEX_FILE  = CACHE_DIR + "index.json"   # Manifest of the archives in ARCHIVE_DIR.
+RUN_FILE    = CACHE_DIR + "run.json"     # Archives processed by the previous runs.
+RESULT_DIR  = CACHE_DIR + "results/"     # Metrics of each processed archive.
+OUTPUT_DIR  = "./"
 
 # Key for data anlysis. 
 FAULT_TRUE  = 1   # Session has automation fault
@@ -37,57 +58,375 @@ SESSION_SCRIPT = {
 
 NUM_SESSIONS = 6
 
-fp  = open("./output.txt", "w")
-fps = []
-for i in range(0, NUM_SESSIONS):
-   fps.append(open("./output_session_" + str(i) + ".txt", "w"))
 
+def findArchives():
+   """
+   Find all the archives to process, in processing order.
+   Compressed logs are read directly, and every log of a zip file
+   is a separate archive.
+   
+   Return
+   ------
+      list - Tuples (missionId, filename) for each archive.
+   """
+   tasks = []
+   
+   # Iterate through each mission and subject
+   for iDir in range(len(MISSION_DIR)):
+      for iSubject in range(len(SUBJECT_DIR)):
+         
+         # Current folder name being processed
+         folder = ARCHIVE_DIR + MISSION_DIR[iDir] + SUBJECT_DIR[iSubject]
+         
+         # Skip missing mission/subject combinations.
+         if(False == os.path.exists(folder)):
+            continue
+         
+         # Iterate through all the files in a folder
+         for filename in os.listdir(folder):
+            
+            # Skip invalid files
+            if(False == isArchiveFile(filename)):
+               continue
+            
+            for archive in listArchives(folder + filename):
+               tasks.append((iDir, archive))
+   return tasks
 
-# Iterate through each mission and subject
-for iDir in range(len(MISSION_DIR)):
-   for iSubject in range(len(SUBJECT_DIR)):
+
+def getPrefix(iDir, script):
+   """
+   Get the session an archive belongs to.
+   
+   Params
+   ------
+      iDir   - Index of the mission folder.
+      script - Script name of the archive (a key of SESSION_SCRIPT).
+   
+   Return
+   ------
+      list - missionId, userId, sessionId, hasFault
+   """
+   prefix = [iDir] + SESSION_SCRIPT[script]
+   prefix[1] += (iDir * len(SUBJECT_DIR))       # Make each user unique
+   return prefix
+
+
+def processArchive(task, names=None, sessions=None):
+   """
+   Extract the metrics from a single archive.
+   
+   Params
+   ------
+      task     - Tuple (missionId, filename) from findArchives().
+      names    - Names of the metrics to compute (None for DEFAULT_METRICS).
+      sessions - Fragments of the archives logged to several files, by the
+                 filename of the task (see groupFragments()).
+   
+   Return
+   ------
+      tuple - Prefix (missionId, userId, sessionId, hasFault) and the 
+              metrics of the archive. None if the script is not mapped.
+   """
+   iDir, filename = task
+   fragments = sessions.get(filename) if sessions is not None else None
+   print("- Parsing " + (" + ".join(fragments) if fragments is not None else filename))
+   
+   with PROFILER.file(filename):
+      # Read the archive and determine which file it belongs to. 
+      if(fragments is not None):
+         archive = Session(fragments, cache=ArchiveCache(CACHE_DIR), columns=getRequiredColumns(names))
+      else:
+         archive = Archive(filename, cache=ArchiveCache(CACHE_DIR), columns=getRequiredColumns(names))
+      testFile = archive.getScript()
+      
+      # Skip file if the script name is invalid. 
+      if(testFile not in SESSION_SCRIPT):
+         print("--- ERROR: File not found.")
+         return None
       
-      # Current folder name being processed
-      folder = ARCHIVE_DIR + MISSION_DIR[iDir] + SUBJECT_DIR[iSubject]
+      # Extract the metrics once, every output is a view of the same episodes.
+      metrics = archive.getMetrics(names=names)
       
-      # Skip missing mission/subject combinations.
-      if(False == os.path.exists(folder)):
+      prefix = getPrefix(iDir, testFile)
+      
+      # Episodes left out of the session specific files.
+      for _ in range(len(metrics) - len(selectMetrics(metrics, True))):
+         print("Skipping...")
+      
+      return prefix, metrics
+
+
+def processTarget(task, sessions=None):
+   """
+   Compute the time out of target of the cabin sensors in a single archive.
+   
+   Params
+   ------
+      task     - Tuple (missionId, filename) from findArchives().
+      sessions - Fragments of the archives logged to several files, by the
+                 filename of the task (see groupFragments()).
+   
+   Return
+   ------
+      tuple - Prefix (missionId, userId, sessionId, hasFault) and the 
+              records of getTargetRecords(). None if the script is not mapped.
+   """
+   iDir, filename = task
+   fragments = sessions.get(filename) if sessions is not None else None
+   print("- Parsing " + (" + ".join(fragments) if fragments is not None else filename))
+   
+   with PROFILER.file(filename):
+      if(fragments is not None):
+         archive = Session(fragments, cache=ArchiveCache(CACHE_DIR), columns=TARGET_COLUMNS)
+      else:
+         archive = Archive(filename, cache=ArchiveCache(CACHE_DIR), columns=TARGET_COLUMNS)
+      testFile = archive.getScript()
+      
+      # Skip file if the script name is invalid. 
+      if(testFile not in SESSION_SCRIPT):
+         print("--- ERROR: File not found.")
+         return None
+      
+      return getPrefix(iDir, testFile), getTargetRecords(*archive.getOutOfTarget())
+
+
+def runIncremental(function, tasks, jobs, reused):
+   """
+   Process the archives without results from a previous run.
+   
+   Params
+   ------
+      function - Function called for each task, see runBatch().
+      tasks    - Tuples (missionId, filename) from findArchives().
+      jobs     - Number of worker processes.
+      reused   - Results of the unchanged archives, by filename.
+   
+   Return
+   ------
+      generator - Tuples (task, result, log, error, profile) for every task,
+                  in task order, as returned by runBatch().
+   """
+   batch = runBatch(function, [task for task in tasks if task[1] not in reused], jobs)
+   for task in tasks:
+      if(task[1] in reused):
+         yield task, reused[task[1]], "", None, None
+      else:
+         yield next(batch)
+
+
+def main():
+   parser = argparse.ArgumentParser(description="Extract AutoCAMS metrics for every archive in " + ARCHIVE_DIR)
+   parser.add_argument("--jobs", type=int, default=1, 
+                       help="Number of worker processes (1 processes the archives sequentially).")
+   parser.add_argument("--format", nargs="+", default=[OutputFormat.TEXT],
+                       choices=[OutputFormat.TEXT, OutputFormat.NPY, OutputFormat.PARQUET],
+                       help="Output formats written to " + OUTPUT_DIR + " (text is the legacy format).")
+   parser.add_argument("--profile", action="store_true",
+                       help="Print the time spent in each stage and a summary per archive.")
+   parser.add_argument("--profile-json", metavar="FILE",
+                       help="Export the profiling results to a JSON file.")
+   parser.add_argument("--follow", metavar="FILE",
+                       help="Monitor an archive AutoCAMS is still writing and print each episode as it completes.")
+   parser.add_argument("--metrics", nargs="+", choices=list(METRIC_REGISTRY.keys()),
+                       help="Metrics to compute (default: " + " ".join(DEFAULT_METRICS) + ").")
+   parser.add_argument("--dataset", metavar="DIR",
+                       help="Consolidate every archive into one memory-mapped dataset in DIR instead of extracting the metrics.")
+   parser.add_argument("--target", action="store_true",
+                       help="Write the time each cabin sensor spent out of target, per archive and per episode, to " + TARGET_FILE + " instead of the metrics.")
+   parser.add_argument("--full", action="store_true",
+                       help="Process every archive again instead of only the new or changed ones.")
+   parser.add_argument("--validate", action="store_true",
+                       help="Check every archive for malformed or incomplete data instead of extracting the metrics.")
+   parser.add_argument("--validate-json", metavar="FILE",
+                       help="Export the problems found by --validate or --skip-invalid to a JSON file.")
+   parser.add_argument("--skip-invalid", action="store_true",
+                       help="Check the archives first and leave out those with errors.")
+   parser.add_argument("--no-stitch", action="store_true",
+                       help="Process every file as a separate archive, even when a session was logged to several files.")
+   parser.add_argument("--serve", action="store_true",
+                       help="Receive archives from many clients over --address and print each episode as it completes.")
+   parser.add_argument("--replay", nargs="+", metavar="FILE",
+                       help="Send archives to a running server, one connection each.")
+   parser.add_argument("--address", default=DEFAULT_ADDRESS,
+                       help="Address of the server: host:port or unix:PATH (default: " + DEFAULT_ADDRESS + ").")
+   parser.add_argument("--speed", type=float, default=1.0,
+                       help="Replay speed (1 for real time, 0 to send as fast as possible).")
+   parser.add_argument("--stats", action="store_true",
+                       help="Describe the metrics of the last run and compare the sessions with and without a fault.")
+   parser.add_argument("--stats-input", metavar="FILE",
+                       help="Output file read by --stats (default: the newest of " + NPY_FILE + " and " + TEXT_FILE + " in " + OUTPUT_DIR + ").")
+   parser.add_argument("--stats-by", nargs="*", default=[O_FAULT], choices=GROUP_FIELDS,
+                       help="Fields the statistics are grouped by (default: " + O_FAULT + ").")
+   parser.add_argument("--strata", choices=GROUP_FIELDS,
+                       help="Only shuffle the fault conditions between episodes with the same value of this field.")
+   parser.add_argument("--resamples", type=int, default=DEFAULT_RESAMPLES,
+                       help="Number of bootstrap resamples and permutations (default: " + str(DEFAULT_RESAMPLES) + ").")
+   parser.add_argument("--seed", type=int,
+                       help="Seed of the resamples, for reproducible statistics.")
+   args = parser.parse_args()
+   enableProfiling(args.profile or args.profile_json is not None)
+   if(OutputFormat.PARQUET in args.format and pyarrow is None):
+      parser.error("the parquet format requires the pyarrow package")
+   
+   # Live monitoring of a single archive.
+   if(args.follow is not None):
+      prefix = [os.path.basename(args.follow)]
+      try:
+         for record in streamEpisodes(args.follow, follow=True):
+            print(formatMetrics([record], prefix), end="", flush=True)
+      except KeyboardInterrupt:
+         pass
+      return
+   
+   # Live ingestion from many clients.
+   if(True == args.serve):
+      try:
+         runServer(args.address)
+      except KeyboardInterrupt:
+         pass
+      return
+   if(args.replay is not None):
+      try:
+         for filename, reply in zip(args.replay, runReplay(args.replay, args.address, args.speed)):
+            print("- " + filename + ": " + reply)
+      except KeyboardInterrupt:
+         pass
+      return
+   
+   # Statistics of the output written by the last run.
+   if(True == args.stats):
+      # Without an explicit input, use the output of the latest run,
+      # since output.npy is only rewritten by runs with --format npy.
+      filename = args.stats_input
+      if(filename is None):
+         found = [name for name in (OUTPUT_DIR + NPY_FILE, OUTPUT_DIR + TEXT_FILE) if os.path.exists(name)]
+         if(0 == len(found)):
+            parser.error("--stats needs the output of a previous run (" + TEXT_FILE + " or " + NPY_FILE + " in " + OUTPUT_DIR + ")")
+         filename = max(found, key=os.path.getmtime)
+      elif(False == os.path.exists(filename)):
+         parser.error("--stats-input file not found: " + filename)
+      print("- Statistics of " + filename)
+      if(filename.endswith(".npy")):
+         records = loadOutput(filename)
+      else:
+         records = loadTextOutput(filename, args.metrics)
+      print(formatStats(describeMetrics(records, by=args.stats_by, resamples=args.resamples, seed=args.seed)), end="")
+      print()
+      by = [field for field in args.stats_by if field != O_FAULT]
+      print(formatStats(compareConditions(records, by=by, resamples=args.resamples, seed=args.seed, strata=args.strata)), end="")
+      return
+   
+   # Use the manifest to drop archives of unknown scripts without parsing them.
+   archives = findArchives()
+   index = ArchiveIndex(INDEX_FILE)
+   index.refresh([filename for _, filename in archives])
+   
+   # Check the archives without extracting the metrics.
+   if(True == args.validate):
+      reports = validateArchives([filename for _, filename in archives], args.jobs)
+      print(formatReports(reports), end="")
+      if(args.validate_json is not None):
+         writeReports(reports, args.validate_json)
+      return
+   
+   tasks = []
+   for task in archives:
+      if(index.getScript(task[1]) in SESSION_SCRIPT):
+         tasks.append(task)
+      else:
+         print("- Skipping " + task[1] + " (unknown script: " + str(index.getScript(task[1])) + ")")
+   
+   # Leave out the archives that would fail or give wrong metrics.
+   if(True == args.skip_invalid):
+      reports = validateArchives([filename for _, filename in tasks], args.jobs)
+      for report in reports:
+         if(False == report.isValid()):
+            print("- Skipping " + report.filename + " (invalid: " + ", ".join(report.getChecks(Severity.ERROR)) + ")")
+      if(args.validate_json is not None):
+         writeReports(reports, args.validate_json)
+      tasks = [task for task, report in zip(tasks, reports) if report.isValid()]
+   
+   # Single table with every archive, for queries across sessions.
+   if(args.dataset is not None):
+      archives = [(filename, getPrefix(iDir, index.getScript(filename))) for iDir, filename in tasks]
+      dataset = buildDataset(args.dataset, archives, ArchiveCache(CACHE_DIR))
+      print("- Dataset " + args.dataset + ": " + str(len(dataset)) + " rows from " + str(len(dataset.files)) + " archives")
+      return
+   
+   # Sessions logged to several files are processed as one archive,
+   # in place of their first file.
+   sessions = {}
+   if(False == args.no_stitch):
+      for positions in groupFragments([index.get(filename) for _, filename in tasks]):
+         if(len(positions) > 1):
+            sessions[tasks[min(positions)][1]] = [tasks[position][1] for position in positions]
+      merged = set(filename for fragments in sessions.values() for filename in fragments) - set(sessions)
+      tasks = [task for task in tasks if task[1] not in merged]
+   
+   # Time out of target instead of the metrics. Each line holds the session,
+   # the episode (0 for the whole archive) and the fields in TARGET_TYPE_KEYS.
+   if(True == args.target):
+      errors = 0
+      with open(OUTPUT_DIR + TARGET_FILE, "w") as fp:
+         for task, result, log, error, profile in runBatch(functools.partial(processTarget, sessions=sessions), tasks, args.jobs):
+            PROFILER.merge(profile)
+            print(log, end="")
+            if(error is not None):
+               print("--- ERROR: " + error)
+               errors += 1
+            if(result is not None):
+               fp.write(formatMetrics(result[1], result[0]))
+      if(errors > 0):
+         print("--- " + str(errors) + " archive(s) failed.")
+      return
+   
+   # Archives, mappings and metrics unchanged since the last run keep their results.
+   # Stitched sessions span several files and are always processed again.
+   manifest = RunManifest(RUN_FILE, RESULT_DIR, args.full)
+   reused = {}
+   for iDir, filename in tasks:
+      if(filename in sessions):
+         continue
+      prefix  = getPrefix(iDir, index.getScript(filename))
+      metrics = manifest.getResult(filename, prefix, args.metrics)
+      if(metrics is not None):
+         reused[filename] = (prefix, metrics)
+   if(len(reused) > 0):
+      print("- Reusing the results of " + str(len(reused)) + " unchanged archive(s)")
+   
+   output = OutputSet(args.format, OUTPUT_DIR, NUM_SESSIONS)
+   
+   # Results come back in the same order as the sequential run. 
+   errors = 0
+   for task, result, log, error, profile in runIncremental(functools.partial(processArchive, names=args.metrics, sessions=sessions), tasks, args.jobs, reused):
+      PROFILER.merge(profile)
+      print(log, end="")
+      if(error is not None):
+         print("--- ERROR: " + error)
+         errors += 1
+      if(result is None):
          continue
       
-      # Iterate through all the files in a folder
-      for filename in os.listdir(folder):
-         
-         # Skip invalid files
-         if(".txt" not in filename):
-            continue
-         
-         print("- Parsing " + folder + filename)
-         
-         # Read the archive and determine which file it belongs to. 
-         archive = Archive(folder + filename)
-         testFile = archive.getScript()
-         
-         # Skip file if the script name is invalid. 
-         if(testFile not in SESSION_SCRIPT):
-            print("--- ERROR: File not found.")
-            continue
-         
-         
-         # Process current archive and write to general file
-         prefix = [iDir] + SESSION_SCRIPT[testFile]
-         prefix[1] += (iDir * len(SUBJECT_DIR))       # Make each user unique
-         output = archive.parseData(prefix)
-         fp.write(output)
-         fp.flush()
-         
-         # Write output to session specific file
-         prefix = [iDir, SESSION_SCRIPT[testFile][0]]
-         prefix[1] += (iDir * len(SUBJECT_DIR))
-         output = archive.parseData(prefix, True)
-         fps[SESSION_SCRIPT[testFile][1]-1].write(output)
-         fps[SESSION_SCRIPT[testFile][1]-1].flush()
-   
-fp.close()
-for i in range(0, NUM_SESSIONS):
-   fps[i].close()
+      prefix, metrics = result
+      if(task[1] not in reused and task[1] not in sessions):
+         manifest.add(task[1], prefix, metrics, args.metrics)
+      with PROFILER.file(task[1], False), PROFILER.timer(T_WRITE):
+         output.add(prefix, metrics)
       
+   with PROFILER.timer(T_WRITE):
+      output.close()
+   manifest.save()
+   PROFILER.count(C_WRITTEN, output.getBytesWritten())
+   
+   if(errors > 0):
+      print("--- " + str(errors) + " archive(s) failed.")
+   
+   if(True == args.profile):
+      print(PROFILER.formatTable(), end="")
+   if(args.profile_json is not None):
+      PROFILER.writeJson(args.profile_json)
+
+
+if __name__ == "__main__":
+   main()
@@ -0,0 +1,6 @@
+import os
+import sys
+
+# Root of the repository, the tests read the archives in Data/ and SampleData/.
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
@@ -0,0 +1,25 @@
+import os
+import numpy as np
+from AutoCAMS.CAMSArchive import *
+from AutoCAMS.CAMSCache import *
+from conftest import ROOT_DIR
+
+ARCHIVE = os.path.join(ROOT_DIR, "Data", "M5_Logs", "S1", "192.168.7.8_0000.txt")
+
+
+def test_load(tmp_path):
+   cache = ArchiveCache(str(tmp_path))
+   parsed = Archive(ARCHIVE, cache=cache)
+   cached = Archive(ARCHIVE, cache=cache)
+   assert cache.isValid(ARCHIVE)
+   for name in parsed.dtype.names:
+      assert np.array_equal(np.asarray(parsed[name]), np.asarray(cached[name])), name
+
+
+def test_clear(tmp_path):
+   cache = ArchiveCache(str(tmp_path))
+   Archive(ARCHIVE, cache=cache)
+   os.makedirs(str(tmp_path / "results"))
+   cache.clear()
+   assert False == cache.isValid(ARCHIVE)
+   assert os.listdir(str(tmp_path)) == ["results"]
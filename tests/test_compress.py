@@ -0,0 +1,96 @@
+import os
+import bz2
+import gzip
+import lzma
+import zipfile
+import numpy as np
+import pytest
+from AutoCAMS.CAMSArchive import *
+from AutoCAMS.CAMSCache import *
+from AutoCAMS.CAMSCompress import *
+from AutoCAMS.CAMSIndex import *
+from AutoCAMS.CAMSStream import *
+from conftest import ROOT_DIR
+
+ARCHIVE = os.path.join(ROOT_DIR, "Data", "M5_Logs", "S1", "192.168.7.8_0000.txt")
+OTHER   = os.path.join(ROOT_DIR, "Data", "M5_Logs", "S1", "192.168.7.8_0004.txt")
+
+# Fields of the index entries that depend on the file on disk.
+FILE_FIELDS = [X_PATH, X_SIZE, X_MTIME]
+
+
+def writeCompressed(folder, ext):
+   """
+   Write ARCHIVE in a compressed format.
+
+   Return
+   ------
+      string - Name of the compressed archive.
+   """
+   name = os.path.basename(ARCHIVE)
+   with open(ARCHIVE, "rb") as fp:
+      data = fp.read()
+   if(ZIP_EXT == ext or "/" == ext):
+      # Explicit member of a zip file holding another log first.
+      filename = os.path.join(folder, "Logs" + ZIP_EXT)
+      with zipfile.ZipFile(filename, "w", zipfile.ZIP_DEFLATED) as archive:
+         if("/" == ext):
+            archive.write(OTHER, os.path.basename(OTHER))
+         archive.writestr(name, data)
+      return filename + "/" + name if "/" == ext else filename
+   
+   filename = os.path.join(folder, name + ext)
+   if(ZSTD_EXT == ext):
+      zstandard = pytest.importorskip("zstandard")
+      data = zstandard.ZstdCompressor().compress(data)
+   else:
+      data = {GZIP_EXT : gzip, BZIP2_EXT : bz2, XZ_EXT : lzma}[ext].compress(data)
+   with open(filename, "wb") as fp:
+      fp.write(data)
+   return filename
+
+
+@pytest.fixture(params=[GZIP_EXT, BZIP2_EXT, XZ_EXT, ZSTD_EXT, ZIP_EXT, "/"],
+                ids=["gz", "bz2", "xz", "zst", "zip", "zip-member"])
+def compressed(request, tmp_path):
+   # Same mission and subject folders as ARCHIVE.
+   folder = tmp_path / "M5_Logs" / "S1"
+   folder.mkdir(parents=True)
+   return writeCompressed(str(folder), request.param)
+
+
+def assertSameRows(archive, reference):
+   assert archive.dtype == reference.dtype
+   for name in reference.dtype.names:
+      assert np.array_equal(np.asarray(archive[name]), np.asarray(reference[name])), name
+
+
+@pytest.mark.parametrize("engine", [LoadEngine.BULK, LoadEngine.GENFROMTXT])
+def test_rows(compressed, engine):
+   reference = Archive(ARCHIVE, engine=engine)
+   archive = Archive(compressed, engine=engine)
+   assertSameRows(archive, reference)
+   assert archive.getScript() == reference.getScript()
+   assert archive.getMetrics().tobytes() == reference.getMetrics().tobytes()
+
+
+def test_summary(compressed):
+   reference = readSummary(ARCHIVE)
+   entry = readSummary(compressed)
+   for name in FILE_FIELDS:
+      del reference[name], entry[name]
+   assert entry == reference
+
+
+def test_stream(compressed):
+   reference = list(streamEpisodes(ARCHIVE, 4096))
+   assert list(streamEpisodes(compressed, 4096)) == reference
+   with pytest.raises(ValueError):
+      next(streamEpisodes(compressed, follow=True))
+
+
+def test_cache(compressed, tmp_path):
+   cache = ArchiveCache(str(tmp_path / "cache"))
+   Archive(compressed, cache=cache)
+   assert cache.isValid(compressed)
+   assertSameRows(Archive(compressed, cache=cache), Archive(ARCHIVE))
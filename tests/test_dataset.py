@@ -0,0 +1,18 @@
+import os
+from AutoCAMS.CAMSCache import *
+from AutoCAMS.CAMSDataset import *
+from conftest import ROOT_DIR
+
+ARCHIVES = [
+   (os.path.join(ROOT_DIR, "Data", "M5_Logs", "S1", "192.168.7.8_0000.txt"), [0, 1, 2, 1]),
+   (os.path.join(ROOT_DIR, "Data", "M5_Logs", "S2", "192.168.7.8_0001.txt"), [0, 2, 3, 0]),
+   ]
+
+
+def test_group_order(tmp_path):
+   dataset = buildDataset(str(tmp_path / "dataset"), ARCHIVES, ArchiveCache(str(tmp_path / "cache")))
+   results = dataset.groupBy([O_USER, I_ERROR_PHASE, I_EVENT_SOURCE])
+   keys = [(record[O_USER], record[I_ERROR_PHASE], record[I_EVENT_SOURCE]) for record in results]
+   assert len(keys) > 1
+   assert keys == sorted(keys)
+   assert results[Aggregate.COUNT].sum() == len(dataset)
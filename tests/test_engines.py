@@ -0,0 +1,77 @@
+import os
+import shutil
+import subprocess
+import sys
+import numpy as np
+import pytest
+from AutoCAMS.CAMSArchive import *
+from AutoCAMS.CAMSConstants import *
+from conftest import ROOT_DIR
+
+SAMPLE_DIR = os.path.join(ROOT_DIR, "SampleData")
+DATA_DIR   = os.path.join(ROOT_DIR, "Data")
+
+# Archives of the sample folder and a few of the study, with and without faults.
+ARCHIVES = sorted(os.path.join(SAMPLE_DIR, name) for name in os.listdir(SAMPLE_DIR) if name.endswith(".txt")) + [
+   os.path.join(DATA_DIR, "M5_Logs", "S1", "192.168.7.8_0000.txt"),
+   os.path.join(DATA_DIR, "M5_Logs", "S3", "192.168.7.8_0008.txt"),
+   os.path.join(DATA_DIR, "M6_Logs", "S2", "192.168.7.23_0001_10_12_S2.txt"),
+   ]
+
+# Archives processed by main.py in the --jobs test.
+RUN_ARCHIVES = [
+   os.path.join("M5_Logs", "S1", "192.168.7.8_0000.txt"),
+   os.path.join("M5_Logs", "S1", "192.168.7.48_0000.txt"),
+   os.path.join("M5_Logs", "S2", "192.168.7.8_0001.txt"),
+   os.path.join("M6_Logs", "S1", "192.168.7.23_0001_10_12_S1.txt"),
+   os.path.join("M6_Logs", "S3", "192.168.7.23_0002_10_12_S3.txt"),
+   ]
+
+
+@pytest.mark.parametrize("filename", ARCHIVES, ids=os.path.basename)
+def test_load_engines(filename):
+   bulk = Archive(filename)
+   reference = Archive(filename, engine=LoadEngine.GENFROMTXT)
+   assert bulk.dtype == reference.dtype
+   assert bulk.shape == reference.shape
+   for name in bulk.dtype.names:
+      assert np.array_equal(np.asarray(bulk[name]), np.asarray(reference[name])), name
+
+
+@pytest.mark.parametrize("filename", ARCHIVES, ids=os.path.basename)
+@pytest.mark.parametrize("skipFault", [False, True])
+def test_parse_engines(filename, skipFault):
+   archive = Archive(filename)
+   prefix = [0, 1, 2, 3]
+   vector = archive.parseData(prefix, skipFault, ParseEngine.VECTOR)
+   loop = archive.parseData(prefix, skipFault, ParseEngine.LOOP)
+   assert vector.encode("utf-8") == loop.encode("utf-8")
+
+
+def runMain(folder, jobs):
+   """
+   Run main.py on a copy of RUN_ARCHIVES and return the files written.
+   """
+   os.makedirs(folder)
+   shutil.copy(os.path.join(ROOT_DIR, "main.py"), folder)
+   os.symlink(os.path.join(ROOT_DIR, "AutoCAMS"), os.path.join(folder, "AutoCAMS"))
+   for name in RUN_ARCHIVES:
+      target = os.path.join(folder, "Data", name)
+      os.makedirs(os.path.dirname(target), exist_ok=True)
+      shutil.copy(os.path.join(DATA_DIR, name), target)
+
+   result = subprocess.run([sys.executable, "main.py", "--jobs", str(jobs)], cwd=folder,
+                           stdout=subprocess.PIPE, stderr=subprocess.STDOUT, check=True)
+   outputs = {"log" : result.stdout}
+   for name in sorted(os.listdir(folder)):
+      if(name.startswith("output")):
+         with open(os.path.join(folder, name), "rb") as fp:
+            outputs[name] = fp.read()
+   return outputs
+
+
+def test_jobs_order(tmp_path):
+   sequential = runMain(str(tmp_path / "jobs1"), 1)
+   parallel = runMain(str(tmp_path / "jobs3"), 3)
+   assert len(sequential) > 1
+   assert sequential == parallel
@@ -0,0 +1,77 @@
+import os
+import numpy as np
+import pytest
+from AutoCAMS.CAMSArchive import *
+from AutoCAMS.CAMSEpisodes import *
+from AutoCAMS.CAMSJoin import *
+from conftest import ROOT_DIR
+
+# Archive in time order and archive with rows out of time order.
+SORTED   = os.path.join(ROOT_DIR, "Data", "M5_Logs", "S1", "192.168.7.8_0000.txt")
+UNSORTED = os.path.join(ROOT_DIR, "Data", "M5_Logs", "S3", "192.168.7.8_0008.txt")
+
+# Start and end events of the connection checks.
+CHECK_START = {"desc" : EventDesc.ICON_APPEARS}
+CHECK_END   = {"source" : EventSource.CONNECTION_CHECK, "desc" : [EventDesc.ICON_CONFIRMED, EventDesc.ICON_CLOSED]}
+
+
+@pytest.fixture(scope="module", params=[SORTED, UNSORTED], ids=["sorted", "unsorted"])
+def archive(request):
+   return Archive(request.param)
+
+
+def test_pair_events():
+   startRows = np.array([2, 5, 9])
+   endRows   = np.array([1, 3, 6, 7, 9, 12])
+   assert np.array_equal(pairEvents(startRows, endRows), [MISSING_ROW, 2, 5, 5, 5, 9])
+   assert np.array_equal(pairEvents(startRows, endRows, lo=6), [MISSING_ROW, MISSING_ROW, MISSING_ROW, MISSING_ROW, MISSING_ROW, 9])
+   assert np.array_equal(pairEvents([], endRows), [MISSING_ROW] * len(endRows))
+   assert np.array_equal(pairEvents(startRows, endRows, fallback=-2)[:1], [-2])
+
+   times   = np.array([0, 10, 20, 35, 50, 60, 80, 90, 100, 120, 130, 140, 150])
+   latency = getLatencies(times, pairEvents(startRows, endRows), endRows)
+   assert np.array_equal(latency, [MISSING_TIME, 15, 20, 30, 60, 30])
+
+
+def test_join_events(archive):
+   times     = np.asarray(archive[I_OSMET], dtype=np.int64)
+   startRows = archive.query(**CHECK_START)
+   endRows, pairs, latency = archive.joinEvents(CHECK_START, CHECK_END)
+   assert len(endRows) > 0
+   assert np.array_equal(endRows, archive.query(**CHECK_END))
+   for row, pair, value in zip(endRows, pairs, latency):
+      before = startRows[startRows < row]
+      if(0 == len(before)):
+         assert (pair, value) == (MISSING_ROW, MISSING_TIME)
+      else:
+         assert (pair, value) == (before[-1], times[row] - times[before[-1]])
+
+   # End events before the first start event are not paired.
+   endRows, pairs, latency = archive.joinEvents(startRows[1:], [startRows[0]])
+   assert (pairs[0], latency[0]) == (MISSING_ROW, MISSING_TIME)
+
+
+@pytest.mark.parametrize("start, end", [(CHECK_START, CHECK_END), (CHECK_END, CHECK_START)], ids=["checks", "reversed"])
+def test_latency_stats(archive, start, end):
+   # Reversed, the first icon of each fault has no start event before it.
+   times    = np.asarray(archive[I_OSMET], dtype=np.float64)
+   episodes = findEpisodes(archive[I_EVENT_SOURCE], archive[I_EVENT_DESC], archive[I_ERROR_PHASE])[0]
+   stats    = archive.getLatencyStats(start, end)
+   assert len(stats) == len(episodes)
+
+   startRows = archive.query(**start)
+   endRows   = archive.query(**end)
+   for episode, record in zip(episodes, stats):
+      latency = []
+      if(episode[E_RED_FIRST] >= 0):
+         for row in endRows[(endRows >= episode[E_RED_FIRST]) & (endRows <= episode[E_GREEN])]:
+            before = startRows[(startRows < row) & (startRows >= episode[E_RED_FIRST])]
+            if(len(before) > 0):
+               latency.append(times[row] - times[before[-1]])
+      assert record[L_COUNT] == len(latency)
+      if(0 == len(latency)):
+         assert record[L_MEAN] == MISSING_RATIO or np.isnan(record[L_MEAN])
+         continue
+      assert np.isclose(record[L_MEAN], np.mean(latency))
+      assert np.isclose(record[L_MEDIAN], np.median(latency))
+      assert np.isclose(record[L_P95], np.percentile(latency, 95))
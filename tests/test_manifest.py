@@ -0,0 +1,80 @@
+import os
+import shutil
+import numpy as np
+import pytest
+from AutoCAMS.CAMSArchive import *
+from AutoCAMS.CAMSManifest import *
+from AutoCAMS.CAMSMetrics import *
+from conftest import ROOT_DIR
+
+ARCHIVE = os.path.join(ROOT_DIR, "Data", "M5_Logs", "S1", "192.168.7.8_0000.txt")
+PREFIX  = [0, 1, 2, 1]
+
+
+@pytest.fixture
+def run(tmp_path):
+   """
+   Copy of ARCHIVE recorded by a previous run.
+   Return the archive, the manifest file and the result folder.
+   """
+   filename = str(tmp_path / os.path.basename(ARCHIVE))
+   shutil.copy(ARCHIVE, filename)
+   manifestFile = str(tmp_path / "run.json")
+   resultDir = str(tmp_path / "results")
+   manifest = RunManifest(manifestFile, resultDir)
+   manifest.add(filename, PREFIX, Archive(filename).getMetrics())
+   manifest.save()
+   return filename, manifestFile, resultDir
+
+
+def test_reuse(run):
+   filename, manifestFile, resultDir = run
+   metrics = RunManifest(manifestFile, resultDir).getResult(filename, PREFIX)
+   assert metrics is not None
+   assert metrics.tobytes() == Archive(filename).getMetrics().tobytes()
+
+
+def test_reuse_touched(run):
+   filename, manifestFile, resultDir = run
+   stat = os.stat(filename)
+   os.utime(filename, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+   assert RunManifest(manifestFile, resultDir).getResult(filename, PREFIX) is not None
+
+
+def test_mapping_changed(run):
+   filename, manifestFile, resultDir = run
+   assert RunManifest(manifestFile, resultDir).getResult(filename, [0, 1, 3, 0]) is None
+
+
+def test_metrics_changed(run):
+   filename, manifestFile, resultDir = run
+   names = DEFAULT_METRICS[:2]
+   assert RunManifest(manifestFile, resultDir).getResult(filename, PREFIX, names) is None
+
+
+@pytest.mark.parametrize("sameSize", [False, True])
+def test_content_changed(run, sameSize):
+   filename, manifestFile, resultDir = run
+   with open(filename, "rb") as fp:
+      data = fp.read()
+   data = data.replace(b"CAMS_SYSTEM", b"CAMS_SYSTEN", 1) if sameSize else data + data.splitlines(True)[-1]
+   stat = os.stat(filename)
+   with open(filename, "wb") as fp:
+      fp.write(data)
+   os.utime(filename, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+   assert RunManifest(manifestFile, resultDir).getResult(filename, PREFIX) is None
+
+
+def test_full(run):
+   filename, manifestFile, resultDir = run
+   assert RunManifest(manifestFile, resultDir, full=True).getResult(filename, PREFIX) is None
+
+
+def test_removed(run):
+   filename, manifestFile, resultDir = run
+   assert len(os.listdir(resultDir)) == 1
+   
+   # Archives not used by a run are dropped with their results.
+   RunManifest(manifestFile, resultDir).save()
+   assert len(os.listdir(resultDir)) == 0
+   assert RunManifest(manifestFile, resultDir).getResult(filename, PREFIX) is None
@@ -0,0 +1,40 @@
+import numpy as np
+from AutoCAMS.CAMSConstants import *
+from AutoCAMS.CAMSMetrics import *
+from AutoCAMS.CAMSOutput import *
+
+PREFIX = [1, 7, 2, 1]
+
+
+def getMetrics():
+   """
+   Three episodes, the last two with missing times and ratios.
+   """
+   metrics = np.zeros(3, dtype=METRIC_TYPE_KEYS)
+   metrics[M_FAULT_INDEX] = [1, 2, 3]
+   metrics[M_FIT]    = [12000, MISSING_TIME, -250]
+   metrics[M_AVT]    = [-3000, 4000, MISSING_TIME]
+   metrics[M_AVS_RP] = [0.5, MISSING_RATIO, 0.25]
+   metrics[M_AVS_NP] = [MISSING_RATIO, 1.0, MISSING_RATIO]
+   return metrics
+
+
+def test_format_missing():
+   lines = formatMetrics(getMetrics(), PREFIX).splitlines()
+   assert lines[0] == "1,7,2,1,1,0,0,12000,-3000,0.500," + MISSING_TEXT + ",0.000,0.000"
+   assert lines[1].split(COMMA)[7:10] == ["NA", "4000", "NA"]
+   for line in lines:
+      assert "nan" not in line
+      assert str(MISSING_TIME) not in line
+
+
+def test_text_roundtrip(tmp_path):
+   writer = TextWriter(str(tmp_path), 3)
+   writer.add(PREFIX, getMetrics())
+   writer.close()
+
+   records  = loadTextOutput(str(tmp_path / TEXT_FILE))
+   expected = getOutputRecords(PREFIX, getMetrics())
+   assert records.dtype == expected.dtype
+   for name in expected.dtype.names:
+      assert np.array_equal(records[name], expected[name], equal_nan=('f' == expected.dtype[name].kind)), name
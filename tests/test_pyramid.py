@@ -0,0 +1,128 @@
+import os
+import numpy as np
+import pytest
+import AutoCAMS.CAMSPyramid
+from AutoCAMS.CAMSArchive import *
+from AutoCAMS.CAMSCache import *
+from AutoCAMS.CAMSPyramid import *
+from conftest import ROOT_DIR
+
+ARCHIVES = [os.path.join(ROOT_DIR, "Data", "M5_Logs", folder, name) for folder, name in (
+   ("S1", "192.168.7.8_0000.txt"), ("S1", "192.168.7.8_0006.txt"), ("S2", "192.168.7.8_0001.txt"),
+   ("S2", "192.168.7.8_0010.txt"), ("S3", "192.168.7.8_0005.txt"), ("S3", "192.168.7.8_0008.txt"))]
+
+
+@pytest.fixture(scope="module", params=ARCHIVES, ids=os.path.basename)
+def archive(request):
+   return Archive(request.param)
+
+
+def getWindows(archive):
+   # Whole archive, a middle part, a short window and a window before the start.
+   times = np.sort(np.asarray(archive[I_OSMET], dtype=np.int64))
+   first, last = int(times[0]), int(times[-1])
+   span = last - first
+   return [(None, None), (first + span // 4, last - span // 4), (first + span // 2, first + span // 2 + 20000),
+           (first - 10000, first - 1)]
+
+
+def test_points(archive):
+   times = np.asarray(archive[I_OSMET], dtype=np.int64)
+   for start, end in getWindows(archive):
+      inside = np.ones(len(times), dtype=bool)
+      if(start is not None):
+         inside &= (times >= start) & (times <= end)
+      for maxPoints in (1, 50, DEFAULT_POINTS, len(times)):
+         points = archive.getSensorPoints(start, end, maxPoints)
+         if(np.count_nonzero(inside) <= maxPoints):
+            # Row by row, in time order.
+            order = np.flatnonzero(inside)[np.argsort(times[inside], kind='stable')]
+            assert np.array_equal(points[P_TIME], times[order])
+            assert np.all(points[P_ROWS] == 1)
+            for sensor in PYRAMID_SENSORS:
+               values = np.asarray(archive[sensor])[order]
+               for summary in (S_MIN, S_MAX, S_MEAN):
+                  assert np.array_equal(points[getSummaryField(sensor, summary)], values, equal_nan=True)
+            continue
+
+         # One point per bucket of a level overlapping the window.
+         iLevel = archive.getPyramid().getLevel(start, end, maxPoints)
+         shift  = BASE_SHIFT + iLevel
+         buckets = np.unique(times[inside] >> shift)
+         assert np.array_equal(points[P_TIME], buckets << shift)
+         assert len(points) <= maxPoints or iLevel == len(archive.getPyramid().levels) - 1
+         for point in points:
+            rows = ((times >> shift) == (point[P_TIME] >> shift))
+            assert point[P_ROWS] == np.count_nonzero(rows)
+            for sensor in PYRAMID_SENSORS:
+               values = np.asarray(archive[sensor], dtype=np.float64)[rows]
+               values = values[~np.isnan(values)]
+               if(0 == len(values)):
+                  assert np.isnan(point[getSummaryField(sensor, S_MEAN)])
+                  continue
+               assert point[getSummaryField(sensor, S_MIN)] == np.float32(values.min())
+               assert point[getSummaryField(sensor, S_MAX)] == np.float32(values.max())
+               assert np.isclose(point[getSummaryField(sensor, S_MEAN)], values.mean())
+
+
+def test_sensors(archive):
+   points = archive.getSensorPoints(maxPoints=10, sensors=[I_CABIN_CO2])
+   assert list(points.dtype.names) == [name for name, _ in getPointTypeKeys([I_CABIN_CO2])]
+   with pytest.raises(ValueError):
+      archive.getSensorPoints(maxPoints=0)
+
+
+def test_excursions(archive):
+   times = np.asarray(archive[I_OSMET], dtype=np.int64)
+   for sensor in PYRAMID_SENSORS:
+      values = np.asarray(archive[sensor], dtype=np.float64)
+      valid  = values[~np.isnan(values)]
+      if(0 == len(valid)):
+         continue
+      quantiles = np.quantile(valid, [0.05, 0.25, 0.75, 0.95])
+      limits = [(quantiles[1], quantiles[2]), (quantiles[0], quantiles[3]), (None, quantiles[2]),
+                (quantiles[1], None), (None, None), (valid.min(), valid.max())]
+      for low, high in limits:
+         outside = (values < (-np.inf if low is None else low)) | (values > (np.inf if high is None else high))
+         for start, end in getWindows(archive):
+            expected = outside if start is None else outside & (times >= start) & (times <= end)
+            assert np.array_equal(archive.findExcursions(sensor, low, high, start, end), np.flatnonzero(expected))
+
+
+def test_reload(tmp_path, monkeypatch):
+   cache = ArchiveCache(str(tmp_path))
+   stored = Archive(ARCHIVES[-1], cache=cache).getPyramid()
+   assert cache.loadDerived(ARCHIVES[-1], PYRAMID_NAME) is not None
+
+   def failBuild(times, sensors):
+      raise AssertionError("pyramid rebuilt")
+   monkeypatch.setattr(AutoCAMS.CAMSPyramid, "buildLevels", failBuild)
+   loaded = Archive(ARCHIVES[-1], cache=cache).getPyramid()
+   assert len(loaded.levels) == len(stored.levels)
+   for storedLevel, loadedLevel in zip(stored.levels, loaded.levels):
+      assert storedLevel.tobytes() == loadedLevel.tobytes()
+
+   # Sliced archives are not complete, so they neither load nor store a pyramid.
+   monkeypatch.undo()
+   assert Archive(ARCHIVES[-1], max_rows=100, cache=cache).getPyramid().levels[0][P_ROWS].sum() == 100
+
+
+def test_unpack():
+   levels = Archive(ARCHIVES[0]).getPyramid().levels
+   rows = int(levels[0][P_ROWS].sum())
+   assert unpackPyramid(packPyramid(levels), rows) is not None
+   assert unpackPyramid(packPyramid(levels), rows + 1) is None
+
+   arrays = packPyramid(levels)
+   arrays["version"] = np.array([PYRAMID_VERSION - 1, BASE_SHIFT], dtype=np.int64)
+   assert unpackPyramid(arrays, rows) is None
+   arrays = packPyramid(levels)
+   arrays["version"] = np.array([PYRAMID_VERSION, BASE_SHIFT + 1], dtype=np.int64)
+   assert unpackPyramid(arrays, rows) is None
+   arrays = packPyramid(levels)
+   del arrays["version"]
+   assert unpackPyramid(arrays, rows) is None
+   arrays = packPyramid(levels)
+   arrays["level0"] = levels[0][[P_BUCKET, P_FIRST, P_ROWS]]
+   assert unpackPyramid(arrays, rows) is None
+   assert unpackPyramid({"version": np.array([PYRAMID_VERSION, BASE_SHIFT])}, rows) is None
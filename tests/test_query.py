@@ -0,0 +1,107 @@
+import os
+import numpy as np
+import pytest
+from AutoCAMS.CAMSArchive import *
+from AutoCAMS.CAMSCategorical import *
+from AutoCAMS.CAMSQuery import *
+from conftest import ROOT_DIR
+
+# Archive in time order and archive with rows out of time order.
+SORTED   = os.path.join(ROOT_DIR, "Data", "M5_Logs", "S1", "192.168.7.8_0000.txt")
+UNSORTED = os.path.join(ROOT_DIR, "Data", "M5_Logs", "S3", "192.168.7.8_0008.txt")
+
+
+@pytest.fixture(scope="module", params=[SORTED, UNSORTED], ids=["sorted", "unsorted"])
+def archive(request):
+   return Archive(request.param)
+
+
+def getStrings(archive, field):
+   return np.atleast_1d(archive[field]).decode()
+
+
+def getMatches(archive, field, value):
+   values = value if isinstance(value, (list, tuple, set)) else [value]
+   return np.isin(getStrings(archive, field), list(values))
+
+
+def test_time_index():
+   column = np.array([5, 3, 3, 9, 1, 5, 7])
+   index = TimeIndex(column)
+   assert False == index.isSorted()
+   assert np.array_equal(index.values, np.sort(column))
+   assert np.array_equal(index.order, [4, 1, 2, 0, 5, 6, 3])   # Ties kept in file order.
+   for start, end in ((None, None), (3, 5), (4, 4), (2, 8), (10, 20), (6, 2)):
+      lo = -np.inf if start is None else start
+      hi =  np.inf if end is None else end
+      assert np.array_equal(index.getRows(start, end), np.flatnonzero((column >= lo) & (column <= hi)))
+
+   index = TimeIndex(np.array([1, 1, 2, 4]))
+   assert True == index.isSorted()
+   assert index.getBounds(1, 3) == (0, 3)
+   assert np.array_equal(index.getRows(2), [2, 3])
+   assert TimeIndex(np.array([], dtype=np.int64)).getBounds(0, 10) == (0, 0)
+
+
+def test_event_index():
+   column = np.array([4, 2, 4, 7, 2, 4])
+   index = EventIndex(column)
+   assert np.array_equal(index.getRows(4), [0, 2, 5])
+   assert np.array_equal(index.getRowsIn([7, 2]), [1, 3, 4])
+   assert index.count(3) == 0
+   assert index.count(8) == 0
+   assert len(index.getRowsIn([])) == 0
+
+   vocabulary = Vocabulary(["a", "b", "c"])
+   index = EventIndex(Categorical(vocabulary.encode(["c", "a", "c", "b"]), vocabulary))
+   assert np.array_equal(index.getRows("c"), [0, 2])
+   assert np.array_equal(index.getRowsIn(["a", "b", "unknown"]), [1, 3])
+   assert len(index.getRows("unknown")) == 0
+   assert len(EventIndex(np.array([], dtype=np.int64)).getRows(1)) == 0
+
+
+def test_archive_indexes(archive):
+   times = np.asarray(archive[I_OSMET])
+   assert archive.getTimeIndex().isSorted() == bool(np.all(times[1:] >= times[:-1]))
+   assert archive.getTimeIndex() is archive.getTimeIndex()
+   for value in (EventDesc.PHASE_CHANGE, EventDesc.ICON_APPEARS, "unknown"):
+      assert np.array_equal(archive.findRows(I_EVENT_DESC, value), np.flatnonzero(getMatches(archive, I_EVENT_DESC, value)))
+
+
+def test_query(archive):
+   times = np.asarray(archive[I_OSMET])
+   first, last = int(times.min()), int(times.max())
+   windows = [(None, None), (first + (last - first) // 3, first + 2 * (last - first) // 3), (None, first + 60000),
+              (last + 1, None)]
+   criteria = [{}, {"desc" : EventDesc.PHASE_CHANGE}, {"desc" : EventDesc.PHASE_CHANGE, "phase" : ErrorState.RED},
+               {"source" : EventSource.CONNECTION_CHECK, "desc" : [EventDesc.ICON_CONFIRMED, EventDesc.ICON_CLOSED]},
+               {"source" : "unknown"}, {"desc" : [EventDesc.ICON_APPEARS, "unknown"]},
+               {"source" : EventSource.CONNECTION_CHECK, "phase" : [ErrorState.GREEN, ErrorState.RED]}]
+   names = {"source" : I_EVENT_SOURCE, "desc" : I_EVENT_DESC, "phase" : I_ERROR_PHASE}
+   for criterion in criteria:
+      for start, end in windows:
+         for firstRow, lastRow in ((None, None), (100, 1500), (archive.size - 10, None)):
+            expected = np.ones(archive.size, dtype=bool)
+            for key, value in criterion.items():
+               expected &= getMatches(archive, names[key], value)
+            if(start is not None):
+               expected &= (times >= start)
+            if(end is not None):
+               expected &= (times <= end)
+            if(firstRow is not None):
+               expected[:firstRow] = False
+            if(lastRow is not None):
+               expected[lastRow + 1:] = False
+            rows = archive.query(start=start, end=end, firstRow=firstRow, lastRow=lastRow, **criterion)
+            assert np.array_equal(rows, np.flatnonzero(expected)), (criterion, start, end, firstRow, lastRow)
+
+
+def test_next_row(archive):
+   changes = np.flatnonzero(getMatches(archive, I_EVENT_DESC, EventDesc.PHASE_CHANGE) &
+                            getMatches(archive, I_ERROR_PHASE, ErrorState.GREEN))
+   for row in (0, int(changes[0]), int(changes[0]) + 1, int(changes[-1]), archive.size - 1):
+      after  = changes[changes > row]
+      before = changes[changes < row]
+      assert archive.getNextRow(row, desc=EventDesc.PHASE_CHANGE, phase=ErrorState.GREEN) == (int(after[0]) if len(after) > 0 else None)
+      assert archive.getPreviousRow(row, desc=EventDesc.PHASE_CHANGE, phase=ErrorState.GREEN) == (int(before[-1]) if len(before) > 0 else None)
+   assert archive.getNextRow(0, source="unknown") is None
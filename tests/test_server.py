@@ -0,0 +1,81 @@
+import os
+import asyncio
+import numpy as np
+import pytest
+from AutoCAMS.CAMSArchive import *
+from AutoCAMS.CAMSServer import *
+from conftest import ROOT_DIR
+
+ARCHIVE = os.path.join(ROOT_DIR, "Data", "M5_Logs", "S1", "192.168.7.8_0000.txt")
+
+
+def runWithServer(tmp_path, client, **kwargs):
+   """
+   Run a coroutine client(address) against a server listening on a Unix
+   socket. Return the reply of the client and the published episodes.
+   """
+   address = UNIX_PREFIX + str(tmp_path / "cams.sock")
+   published = []
+
+   async def run():
+      server = EpisodeServer(lambda clientId, record: published.append((clientId, record)), **kwargs)
+      await server.start(address)
+      try:
+         return await client(address)
+      finally:
+         await server.close()
+   return asyncio.run(run()), published
+
+
+async def sendRaw(address, data):
+   reader, writer = await openConnection(address)
+   try:
+      writer.write(data)
+      await writer.drain()
+      if(writer.can_write_eof()):
+         writer.write_eof()
+      return (await reader.read()).decode("ascii").strip()
+   finally:
+      writer.close()
+      await writer.wait_closed()
+
+
+def test_parse_address():
+   assert parseAddress("unix:/tmp/cams.sock") == ("unix", "/tmp/cams.sock")
+   assert parseAddress("127.0.0.1:7420") == ("tcp", "127.0.0.1", 7420)
+   for address in ("unix:", "7420", "localhost:port"):
+      with pytest.raises(ValueError):
+         parseAddress(address)
+
+
+def test_replay(tmp_path):
+   reply, published = runWithServer(tmp_path, lambda address: replayArchive(ARCHIVE, address, speed=0))
+   metrics = Archive(ARCHIVE).getMetrics()
+   assert reply == "OK " + str(len(metrics))
+   assert [clientId for clientId, _ in published] == [getArchivePrefix(ARCHIVE)] * len(metrics)
+   records = np.array([record for _, record in published], dtype=metrics.dtype)
+   assert records.tobytes() == metrics.tobytes()
+
+
+def test_small_reads(tmp_path):
+   # Lines split over many reads are joined before being parsed.
+   reply, published = runWithServer(tmp_path, lambda address: replayArchive(ARCHIVE, address, speed=0, clientId="client-1"),
+                                    readSize=7)
+   assert reply == "OK " + str(len(Archive(ARCHIVE).getMetrics()))
+   assert set(clientId for clientId, _ in published) == set(["client-1"])
+
+
+def test_bad_client_id(tmp_path):
+   reply, published = runWithServer(tmp_path, lambda address: sendRaw(address, b"bad/id\n"))
+   assert reply.startswith("ERROR invalid client identifier")
+   reply, _ = runWithServer(tmp_path, lambda address: sendRaw(address, b""))
+   assert reply == "ERROR missing client identifier"
+   assert published == []
+
+
+def test_long_line(tmp_path):
+   reply, published = runWithServer(tmp_path, lambda address: sendRaw(address, b"client\n" + b"x" * 4096), maxLineBytes=1024)
+   assert reply == "ERROR line longer than 1024 bytes"
+   reply, _ = runWithServer(tmp_path, lambda address: sendRaw(address, b"x" * 4096 + b"\n"), maxLineBytes=1024)
+   assert reply == "ERROR client identifier longer than 1024 bytes"
+   assert published == []
@@ -0,0 +1,67 @@
+import os
+import numpy as np
+import pytest
+from AutoCAMS.CAMSArchive import *
+from AutoCAMS.CAMSSession import *
+from conftest import ROOT_DIR
+
+ARCHIVE = os.path.join(ROOT_DIR, "Data", "M5_Logs", "S1", "192.168.7.8_0000.txt")
+
+
+def getMerged(columns, runs):
+   """
+   Gather a column of each fragment in the merged order.
+   """
+   return [int(value) for iFragment, start, stop in runs for value in columns[iFragment][start:stop]]
+
+
+def test_merge_seam():
+   osmets = [[1, 2, 3, 4], [3, 4, 5]]
+   ids    = [[0, 1, 2, 3], [2, 3, 4]]
+   runs, duplicates = mergeFragments(osmets, ids)
+   assert duplicates == 2
+   assert getMerged(osmets, runs) == [1, 2, 3, 4, 5]
+   assert getMerged(ids, runs) == [0, 1, 2, 3, 4]
+
+
+def test_merge_same_time():
+   # Rows with the same time code and another running number are kept.
+   osmets = [[1, 2, 2], [2, 3]]
+   ids    = [[0, 1, 2], [3, 4]]
+   runs, duplicates = mergeFragments(osmets, ids)
+   assert duplicates == 0
+   assert sorted(getMerged(ids, runs)) == [0, 1, 2, 3, 4]
+
+
+def test_merge_out_of_order():
+   # A row logged late stays after the rows before it in its file.
+   osmets = [[10, 20, 15, 30], [25, 40]]
+   ids    = [[0, 1, 2, 4], [3, 5]]
+   runs, duplicates = mergeFragments(osmets, ids)
+   assert duplicates == 0
+   assert getMerged(osmets, runs) == [10, 20, 15, 25, 30, 40]
+   assert getMerged(ids, runs) == [0, 1, 2, 3, 4, 5]
+
+
+@pytest.mark.parametrize("split", [(0.5, 0.5), (0.4, 0.6), (0.7, 0.7)])
+def test_split_session(tmp_path, split):
+   with open(ARCHIVE, "rb") as fp:
+      lines = fp.read().splitlines(True)
+   header, rows = lines[:1], lines[1:]
+   
+   # The second fragment starts before the end of the first one,
+   # the rows in between are logged to both files.
+   end   = int(len(rows) * split[1])
+   start = int(len(rows) * split[0])
+   filenames = [str(tmp_path / "192.168.7.8_0000.txt"), str(tmp_path / "192.168.7.8_0001.txt")]
+   for filename, part in zip(filenames, (rows[:end], rows[start:])):
+      with open(filename, "wb") as fp:
+         fp.writelines(header + part)
+   
+   archive = Archive(ARCHIVE)
+   session = Session(filenames)
+   assert len(session) == archive.size
+   assert np.array_equal(session[I_OSMET], archive[I_OSMET])
+   assert session.getMetrics().tobytes() == archive.getMetrics().tobytes()
+   assert session.parseData([0, 1, 2, 1]) == archive.parseData([0, 1, 2, 1])
+   assert getTargetRecords(*session.getOutOfTarget()).tobytes() == getTargetRecords(*archive.getOutOfTarget()).tobytes()
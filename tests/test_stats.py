@@ -0,0 +1,141 @@
+import numpy as np
+import pytest
+from AutoCAMS.CAMSConstants import *
+from AutoCAMS.CAMSJoin import *
+from AutoCAMS.CAMSStats import *
+
+SEED = 1234
+
+
+def getRecords(rng, size=200):
+   """
+   Episodes of 4 subjects, the sessions with a fault take 2000 ms longer.
+   """
+   records = np.zeros(size, dtype=OUTPUT_TYPE_KEYS)
+   records[O_USER]  = rng.integers(1, 5, size)
+   records[O_FAULT] = rng.integers(0, 2, size)
+   records[M_FIT]   = rng.normal(10000, 500, size).astype(np.int64) + 2000 * records[O_FAULT]
+   records[M_AVT]   = rng.normal(0, 1000, size).astype(np.int64)
+   records[M_AVS_RP] = rng.random(size)
+   records[M_FIT][::10]   = MISSING_TIME
+   records[M_AVS_RP][::7] = MISSING_RATIO
+   return records
+
+
+def test_sorted_quantile():
+   rng = np.random.default_rng(SEED)
+   values = np.sort(rng.normal(size=101))
+   for quantile in (0.0, 0.25, 0.5, 0.95, 1.0):
+      assert np.isclose(getSortedQuantile(values, np.array([0, 10]), np.array([100, 10]), quantile)[0], np.quantile(values, quantile))
+   assert getSortedQuantile(values, np.array([10]), np.array([10]), 0.5)[0] == values[10]
+
+
+def test_valid_mask():
+   assert list(getValidMask(np.array([-1, 5, MISSING_TIME]))) == [True, True, False]
+   assert list(getValidMask(np.array([0.5, MISSING_RATIO]))) == [True, False]
+
+
+def test_describe_values():
+   rng = np.random.default_rng(SEED)
+   values = rng.normal(50, 10, 300)
+   groups = rng.integers(0, 3, 300)
+   values, groups = np.append(values, 7.0), np.append(groups, 3)
+   stats = describeValues(values, groups, 5, 2000, 0.95, np.random.default_rng(SEED))
+   for iGroup in range(3):
+      group = values[groups == iGroup]
+      assert stats[G_COUNT][iGroup] == len(group)
+      assert np.isclose(stats[G_MEAN][iGroup], np.mean(group))
+      assert np.isclose(stats[G_STD][iGroup], np.std(group, ddof=1))
+      assert np.isclose(stats[G_MEDIAN][iGroup], np.median(group))
+      assert stats[G_MIN][iGroup] == group.min() and stats[G_MAX][iGroup] == group.max()
+      assert stats[G_CI_LOW][iGroup] < np.mean(group) < stats[G_CI_HIGH][iGroup]
+   
+   # A single value has no deviation, an empty group no statistics.
+   assert stats[G_COUNT][3] == 1 and stats[G_MEDIAN][3] == 7.0 and np.isnan(stats[G_STD][3])
+   assert stats[G_COUNT][4] == 0 and np.isnan(stats[G_MEAN][4]) and np.isnan(stats[G_CI_LOW][4])
+
+
+def test_bootstrap_means():
+   rng = np.random.default_rng(SEED)
+   ordered = np.concatenate((rng.normal(0, 1, 50), np.full(3, 4.0), rng.normal(20, 5, 200)))
+   counts  = np.array([50, 0, 3, 200])
+   means = bootstrapMeans(ordered, counts, 5000, np.random.default_rng(SEED))
+   assert means.shape == (5000, 4)
+   assert np.all(np.isnan(means[:, 1]))
+   assert np.all(means[:, 2] == 4.0)
+   for column, group in ((0, ordered[:50]), (3, ordered[53:])):
+      # Mean and standard error of the resampled means.
+      assert abs(means[:, column].mean() - np.mean(group)) < 0.05 * np.std(group)
+      assert np.isclose(means[:, column].std(), np.std(group) / np.sqrt(len(group)), rtol=0.1)
+      assert np.all((means[:, column] >= group.min()) & (means[:, column] <= group.max()))
+   
+   # The resamples are reproducible with the same seed.
+   assert np.array_equal(means, bootstrapMeans(ordered, counts, 5000, np.random.default_rng(SEED)), equal_nan=True)
+
+
+def test_permutation_exact():
+   # 2 of the 6 ways to label two of four values are as extreme as the observed one.
+   observed, pValue = permutationTest([1.0, 2.0, 3.0, 4.0], [True, True, False, False], 20000, np.random.default_rng(SEED))
+   assert observed == -2.0
+   assert abs(pValue - 2.0 / 6.0) < 0.015
+
+
+def test_permutation_effect():
+   rng = np.random.default_rng(SEED)
+   labels = np.arange(100) < 50
+   values = rng.normal(0, 1, 100) + 2.0 * labels
+   observed, pValue = permutationTest(values, labels, 5000, np.random.default_rng(SEED))
+   assert np.isclose(observed, values[labels].mean() - values[~labels].mean())
+   assert pValue == 1.0 / 5001
+   
+   # Without an effect the p-value is not small.
+   _, pValue = permutationTest(rng.normal(0, 1, 100), labels, 5000, np.random.default_rng(SEED))
+   assert pValue > 0.05
+   assert np.isnan(permutationTest([1.0, 2.0], [True, True], 100)[1])
+
+
+def test_permutation_strata():
+   # Subjects differ, the fault has no effect within a subject.
+   rng = np.random.default_rng(SEED)
+   strata = np.repeat([0, 1], 40)
+   labels = np.concatenate((np.arange(40) < 30, np.arange(40) < 10))
+   values = rng.normal(0, 1, 80) + 100 * strata
+   _, pValue = permutationTest(values, labels, 5000, np.random.default_rng(SEED))
+   assert pValue < 0.001
+   _, pValue = permutationTest(values, labels, 5000, np.random.default_rng(SEED), strata)
+   assert pValue > 0.05
+
+
+def test_describe_metrics():
+   records = getRecords(np.random.default_rng(SEED))
+   stats = describeMetrics(records, [M_FIT, M_AVS_RP], by=[O_FAULT], resamples=500, seed=SEED)
+   assert len(stats) == 4
+   for result in stats:
+      values = records[result[G_METRIC]][records[O_FAULT] == result[O_FAULT]]
+      values = values[getValidMask(values)]
+      assert result[G_COUNT] == len(values)
+      assert np.isclose(result[G_MEAN], np.mean(values))
+      assert np.isclose(result[G_MEDIAN], np.median(values))
+      assert np.isclose(result[G_STD], np.std(values, ddof=1))
+   assert stats.tobytes() == (describeMetrics(records, [M_FIT, M_AVS_RP], by=[O_FAULT], resamples=500, seed=SEED)).tobytes()
+   with pytest.raises(ValueError):
+      describeMetrics(records[[O_FAULT, M_FIT]], [M_FIT, M_AVS_RP])
+
+
+def test_compare_conditions():
+   records = getRecords(np.random.default_rng(SEED))
+   results = compareConditions(records, [M_FIT, M_AVT], by=[O_USER], resamples=2000, seed=SEED, strata=O_SESSION)
+   assert len(results) == 8
+   for result in results:
+      rows = (records[O_USER] == result[O_USER]) & getValidMask(records[result[G_METRIC]])
+      fault = records[result[G_METRIC]][rows & (records[O_FAULT] == 1)]
+      normal = records[result[G_METRIC]][rows & (records[O_FAULT] == 0)]
+      assert (result[H_COUNT_FAULT], result[H_COUNT_NORMAL]) == (len(fault), len(normal))
+      assert np.isclose(result[H_MEAN_FAULT], np.mean(fault))
+      assert np.isclose(result[H_DIFF], np.mean(fault) - np.mean(normal))
+   
+   # FIT is 2000 ms longer with a fault, AVT is the same.
+   assert np.all(results[H_P_VALUE][results[G_METRIC] == M_FIT] < 0.001)
+   assert np.all(results[H_P_VALUE][results[G_METRIC] == M_AVT] > 0.001)
+   with pytest.raises(ValueError):
+      compareConditions(records, by=[O_FAULT])
@@ -0,0 +1,66 @@
+import os
+import pytest
+from AutoCAMS.CAMSStream import *
+from conftest import ROOT_DIR
+
+ARCHIVE = os.path.join(ROOT_DIR, "Data", "M5_Logs", "S1", "192.168.7.8_0000.txt")
+
+
+@pytest.fixture
+def followed(tmp_path):
+   """
+   Copy of ARCHIVE followed until its end.
+   Return the file name, the contents and the chunk generator.
+   """
+   filename = str(tmp_path / os.path.basename(ARCHIVE))
+   with open(ARCHIVE, "rb") as fp:
+      data = fp.read()
+   with open(filename, "wb") as fp:
+      fp.write(data)
+   chunks = readChunks(filename, len(data) + 1, True, 0.01, 0.5)
+   assert next(chunks) == (False, data)
+   yield filename, data, chunks
+   chunks.close()
+
+
+def test_follow_append(followed):
+   filename, data, chunks = followed
+   line = data.splitlines(True)[-1]
+   with open(filename, "ab") as fp:
+      fp.write(line)
+   assert next(chunks) == (False, line)
+
+
+def test_follow_truncated(followed):
+   filename, data, chunks = followed
+   with open(filename, "wb") as fp:
+      fp.write(data[:100])
+   restarted, buffer = next(chunks)
+   assert True == restarted
+   assert data[:100].startswith(buffer)
+
+
+def test_follow_replaced(followed, tmp_path):
+   # New session with the same size, moved over the followed archive.
+   filename, data, chunks = followed
+   replacement = data.replace(b"CAMS_SYSTEM", b"CAMS_SYSTEN", 1)
+   temp = str(tmp_path / "replacement.txt")
+   with open(temp, "wb") as fp:
+      fp.write(replacement)
+   os.replace(temp, filename)
+   assert next(chunks) == (True, replacement)
+
+
+def test_follow_rewritten(followed):
+   # New session with the same size, written over the followed archive.
+   filename, data, chunks = followed
+   replacement = data.replace(b"CAMS_SYSTEM", b"CAMS_SYSTEN", 1)
+   with open(filename, "r+b") as fp:
+      fp.write(replacement)
+   assert next(chunks) == (True, replacement)
+
+
+def test_follow_idle(followed):
+   filename, data, chunks = followed
+   with pytest.raises(StopIteration):
+      next(chunks)
@@ -0,0 +1,171 @@
+import os
+import json
+import shutil
+import subprocess
+import sys
+import pytest
+from AutoCAMS.CAMSConstants import *
+from AutoCAMS.CAMSValidate import *
+from conftest import ROOT_DIR
+
+# Archive without any problem.
+ARCHIVE = os.path.join(ROOT_DIR, "Data", "M5_Logs", "S1", "192.168.7.8_0000.txt")
+
+# Position of the columns in a line.
+FIELDS = [name for name, _ in TYPE_KEYS]
+
+
+def readLines():
+   with open(ARCHIVE, "rb") as fp:
+      return fp.read().splitlines(True)
+
+
+def setField(lines, line, name, value):
+   """
+   Replace a field of a line of the file (numbered from 1).
+   """
+   fields = lines[line - 1].rstrip(b'\r\n').split(b';')
+   fields[FIELDS.index(name)] = value
+   lines[line - 1] = b';'.join(fields) + b'\n'
+
+
+def getProblems(lines):
+   """
+   Validate an archive and get its problems as (check, severity, first line).
+   """
+   report = validateBuffer(b''.join(lines))
+   return [(entry[V_CHECK], entry[V_SEVERITY], entry[V_LINE]) for entry in report.diagnostics]
+
+
+def test_clean():
+   report = validateArchive(ARCHIVE)
+   assert report.diagnostics == []
+   assert True == report.isValid()
+   assert report.rows == len(readLines()) - 1
+
+
+def test_header():
+   lines = readLines()
+   assert getProblems(lines[1:]) == [(Check.HEADER, Severity.ERROR, None)]
+   assert getProblems(lines[:1]) == [(Check.EMPTY, Severity.ERROR, None)]
+
+
+def test_columns():
+   lines = readLines()
+   lines[9] = lines[9].replace(b';', b'', 1)
+   assert getProblems(lines) == [(Check.COLUMNS, Severity.ERROR, 10)]
+
+
+def test_numeric():
+   lines = readLines()
+   setField(lines, 20, I_OSMET, b'15257x')
+   setField(lines, 30, I_CABIN_O2, b'abc')
+   assert getProblems(lines) == [(Check.NUMERIC, Severity.ERROR, 20), (Check.NUMERIC, Severity.ERROR, 30)]
+   
+   # The other rows are still checked.
+   setField(lines, 40, I_EVENT_SOURCE, b'Bogus')
+   assert (Check.UNKNOWN_SOURCE, Severity.WARNING, 40) in getProblems(lines)
+
+
+def test_decimal_style():
+   lines = readLines()
+   lines[49] = lines[49].replace(b'.', b',')
+   assert getProblems(lines) == [(Check.DECIMAL_STYLE, Severity.WARNING, 50)]
+
+
+def test_order():
+   lines = readLines()
+   lines[10], lines[11] = lines[11], lines[10]
+   problems = getProblems(lines)
+   assert (Check.ID_ORDER, Severity.ERROR, 12) in problems
+   assert (Check.OSMET_ORDER, Severity.WARNING, 12) in problems
+   assert all(Check.ID_ORDER == check or Severity.WARNING == severity for check, severity, _ in problems)
+
+
+def test_time_gap():
+   lines = readLines()
+   for line in range(60, len(lines) + 1):
+      fields = lines[line - 1].split(b';')
+      setField(lines, line, I_OSMET, str(int(fields[FIELDS.index(I_OSMET)]) + MAX_TIME_GAP + 1).encode())
+   assert getProblems(lines) == [(Check.TIME_GAP, Severity.WARNING, 60)]
+
+
+def test_unknown_source():
+   lines = readLines()
+   setField(lines, 40, I_EVENT_SOURCE, b'Bogus')
+   setField(lines, 41, I_EVENT_SOURCE, b'OxygenManualManager')
+   assert getProblems(lines) == [(Check.UNKNOWN_SOURCE, Severity.WARNING, 40)]
+
+
+def test_unknown_fault():
+   lines = readLines()
+   line = next(i + 1 for i, text in enumerate(lines) if b';AfiraSystem' in text and b':' in text.split(b';')[10])
+   setField(lines, line, I_EVENT_DESC, b'NITROGEN_VALVE_LEAK:FLUX_CAPACITOR')
+   problems = getProblems(lines)
+   assert problems == [(Check.UNKNOWN_FAULT, Severity.ERROR, line)]
+   assert False == validateBuffer(b''.join(lines)).isValid()
+
+
+def test_open_episode():
+   # The file ends during the last fault episode.
+   lines = readLines()
+   red = [i + 1 for i, text in enumerate(lines) if b';phase changed;RED;' in text][-1]
+   assert getProblems(lines[:red + 5]) == [(Check.EPISODE_OPEN, Severity.WARNING, red)]
+
+
+def test_validate_archives(tmp_path):
+   lines = readLines()
+   lines[9] = lines[9].replace(b';', b'', 1)
+   corrupt = str(tmp_path / "corrupt.txt")
+   with open(corrupt, "wb") as fp:
+      fp.writelines(lines)
+   missing = str(tmp_path / "missing.txt")
+   
+   reports = validateArchives([ARCHIVE, corrupt, missing], 2)
+   assert [report.filename for report in reports] == [ARCHIVE, corrupt, missing]
+   assert [report.isValid() for report in reports] == [True, False, False]
+   assert reports[1].getChecks(Severity.ERROR) == [Check.COLUMNS]
+   assert reports[2].getChecks(Severity.ERROR) == [Check.READ]
+   assert "3 archive(s) checked, 2 invalid" in formatReports(reports)
+
+
+@pytest.fixture
+def tree(tmp_path):
+   """
+   Copy of main.py with a data tree holding a clean and a corrupt archive.
+   """
+   shutil.copy(os.path.join(ROOT_DIR, "main.py"), str(tmp_path))
+   os.symlink(os.path.join(ROOT_DIR, "AutoCAMS"), str(tmp_path / "AutoCAMS"))
+   folder = tmp_path / "Data" / "M5_Logs" / "S1"
+   folder.mkdir(parents=True)
+   shutil.copy(ARCHIVE, str(folder))
+   lines = readLines()
+   lines[9] = lines[9].replace(b';', b'', 1)
+   with open(str(folder / "192.168.7.8_0004.txt"), "wb") as fp:
+      fp.writelines(lines)
+   return tmp_path
+
+
+def runMain(folder, *args):
+   result = subprocess.run([sys.executable, "main.py"] + list(args), cwd=str(folder),
+                           stdout=subprocess.PIPE, stderr=subprocess.STDOUT, check=True)
+   return result.stdout.decode()
+
+
+def test_main_validate(tree):
+   log = runMain(tree, "--validate", "--validate-json", "report.json")
+   assert "192.168.7.8_0004.txt: 1 error(s), 0 warning(s)" in log
+   assert "2 archive(s) checked, 1 invalid" in log
+   assert False == os.path.exists(str(tree / "output.txt"))
+   with open(str(tree / "report.json")) as fp:
+      valid = dict((os.path.basename(report["file"]), report["valid"]) for report in json.load(fp))
+   assert valid == {"192.168.7.8_0000.txt" : True, "192.168.7.8_0004.txt" : False}
+
+
+def test_main_skip_invalid(tree):
+   log = runMain(tree, "--skip-invalid", "--no-stitch")
+   assert "192.168.7.8_0004.txt (invalid: " + Check.COLUMNS + ")" in log
+   assert "- Parsing ./Data/M5_Logs/S1/192.168.7.8_0000.txt" in log
+   assert "- Parsing ./Data/M5_Logs/S1/192.168.7.8_0004.txt" not in log
+   with open(str(tree / "output.txt")) as fp:
+      assert len(fp.read()) > 0